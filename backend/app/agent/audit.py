@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Tuple
+
+# Events kept per run; older ones are dropped (and counted)
+AGENT_AUDIT_MAX_EVENTS = int(os.getenv("AGENT_AUDIT_MAX_EVENTS", "500"))
+
+# Payload limits per event: the full plan, quality and actions live in the
+# page results, the audit log only needs enough to follow the run
+MAX_STRING_LENGTH = 160
+MAX_LIST_ITEMS = 8
+MAX_DEPTH = 3
+
+# (phase, message) pairs are interned once per process; events store the code
+_event_types: Dict[Tuple[str, str], int] = {}
+_event_type_names: List[Tuple[str, str]] = []
+_event_types_lock = threading.Lock()
+
+
+def event_type(phase: str, message: str) -> int:
+    """Process-wide code of an event type."""
+    key = (phase, message)
+    code = _event_types.get(key)
+    if code is None:
+        with _event_types_lock:
+            code = _event_types.get(key)
+            if code is None:
+                code = len(_event_type_names)
+                _event_type_names.append((sys.intern(phase), sys.intern(message)))
+                _event_types[key] = code
+    return code
+
+
+def compact(value: Any, depth: int = 0) -> Any:
+    """Bounded copy of an event payload (short strings, few items, shallow)."""
+    if isinstance(value, str):
+        return value if len(value) <= MAX_STRING_LENGTH else value[:MAX_STRING_LENGTH] + "…"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if depth >= MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        items = list(value.items())
+        result = {str(key): compact(item, depth + 1) for key, item in items[:MAX_LIST_ITEMS]}
+        if len(items) > MAX_LIST_ITEMS:
+            result["…"] = f"{len(items) - MAX_LIST_ITEMS} more"
+        return result
+    if isinstance(value, (list, tuple)):
+        result = [compact(item, depth + 1) for item in value[:MAX_LIST_ITEMS]]
+        if len(value) > MAX_LIST_ITEMS:
+            result.append(f"… {len(value) - MAX_LIST_ITEMS} more")
+        return result
+    return compact(str(value), depth)
+
+
+class AuditLog:
+    """
+    Event-sourced audit trail of one agent run.
+
+    Events are (milliseconds since start, event type code, compacted data)
+    tuples in a bounded deque; to_list() expands them to the
+    {timestamp, phase, message, data} dicts the API has always returned.
+    """
+
+    def __init__(self, max_events: int = AGENT_AUDIT_MAX_EVENTS):
+        self.started_at = datetime.utcnow()
+        self._started = time.monotonic()
+        self._events: Deque[Tuple[int, int, Any]] = deque(maxlen=max_events)
+        self.dropped = 0
+
+    def record(self, phase: str, message: str, data: Dict[str, Any]) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        elapsed_ms = int((time.monotonic() - self._started) * 1000)
+        self._events.append((elapsed_ms, event_type(phase, message), compact(data)))
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        events = []
+        for elapsed_ms, code, data in self._events:
+            phase, message = _event_type_names[code]
+            events.append({
+                "timestamp": (self.started_at + timedelta(milliseconds=elapsed_ms)).isoformat(),
+                "phase": phase,
+                "message": message,
+                "data": data,
+            })
+        if self.dropped:
+            events.insert(0, {
+                "timestamp": self.started_at.isoformat(),
+                "phase": "audit",
+                "message": "earlier_events_dropped",
+                "data": {"count": self.dropped},
+            })
+        return events
@@ -1,9 +1,12 @@
-import json
 import logging
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
+
+from app.agent.memory_index import get_memory_index
+from app.agent.session_store import SessionStore
 
 logger = logging.getLogger(__name__)
 
@@ -14,54 +17,47 @@ class AgentMemory:
         self.memory_dir = self.base_dir / "agent_memory"
         self.memory_dir.mkdir(parents=True, exist_ok=True)
         self.long_term_file = self.memory_dir / "long_term_memory.json"
+        self.long_term = get_memory_index(self.long_term_file)
+        self.sessions = _get_session_store(self.memory_dir)
 
-    def load_session(self, session_id: str) -> Dict[str, Any]:
-        session_file = self.memory_dir / f"session_{session_id}.json"
-        if not session_file.exists():
-            return {"session_id": session_id, "events": [], "preferences": {}}
+    def load_session(self, session_id: str, limit: Optional[int] = None) -> Dict[str, Any]:
         try:
-            return json.loads(session_file.read_text(encoding="utf-8"))
+            return self.sessions.load(session_id, limit=limit)
         except Exception as exc:
             logger.warning("Failed to read agent session memory %s: %s", session_id, exc)
             return {"session_id": session_id, "events": [], "preferences": {}}
 
     def save_session_event(self, session_id: str, event: Dict[str, Any]) -> None:
-        session = self.load_session(session_id)
-        session.setdefault("events", []).append({
+        self.sessions.append(session_id, {
             "id": str(uuid.uuid4()),
             "timestamp": datetime.utcnow().isoformat(),
             **event,
         })
-        session_file = self.memory_dir / f"session_{session_id}.json"
-        session_file.write_text(json.dumps(session, indent=2, ensure_ascii=False), encoding="utf-8")
 
     def load_long_term(self) -> List[Dict[str, Any]]:
-        if not self.long_term_file.exists():
-            return []
-        try:
-            data = json.loads(self.long_term_file.read_text(encoding="utf-8"))
-            return data if isinstance(data, list) else []
-        except Exception as exc:
-            logger.warning("Failed to read long-term agent memory: %s", exc)
-            return []
+        return self.long_term.records()
 
     def remember_document_profile(self, profile: Dict[str, Any]) -> None:
-        records = self.load_long_term()
-        records.append({
+        # Indexed immediately, written to disk in the background
+        self.long_term.add({
             "id": str(uuid.uuid4()),
             "timestamp": datetime.utcnow().isoformat(),
             **profile,
         })
-        self.long_term_file.write_text(json.dumps(records[-250:], indent=2, ensure_ascii=False), encoding="utf-8")
 
     def retrieve_relevant_profiles(self, user_goal: str, limit: int = 5) -> List[Dict[str, Any]]:
-        records = self.load_long_term()
-        terms = {term.lower() for term in user_goal.split() if len(term) > 3}
-        scored = []
-        for record in records:
-            haystack = " ".join(str(value) for value in record.values()).lower()
-            score = sum(1 for term in terms if term in haystack)
-            if score:
-                scored.append((score, record))
-        scored.sort(key=lambda item: item[0], reverse=True)
-        return [record for _, record in scored[:limit]]
+        return self.long_term.search(user_goal, limit=limit)
+
+# One store per memory directory: the per-session locks and offset indexes
+# must be shared by every AgentMemory (one is created per request)
+_session_stores: Dict[Path, SessionStore] = {}
+_session_stores_lock = threading.Lock()
+
+
+def _get_session_store(memory_dir: Path) -> SessionStore:
+    key = memory_dir.resolve()
+    with _session_stores_lock:
+        store = _session_stores.get(key)
+        if store is None:
+            store = _session_stores[key] = SessionStore(key / "sessions", legacy_dir=key)
+        return store
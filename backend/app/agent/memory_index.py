@@ -0,0 +1,214 @@
+"""
+In-process inverted index over the agent's long-term memory.
+
+retrieve_relevant_profiles used to load long_term_memory.json on every
+run and substring-match each goal term against every record stringified;
+remember_document_profile reloaded and rewrote the whole file and kept
+only the last 250 records.
+
+MemoryIndex instead:
+1. Loads the file once per process (one index per file, shared by every
+   AgentMemory)
+2. Tokenizes each record's values into postings (term -> {record: tf})
+   and ranks queries with BM25, so retrieval never touches the disk and
+   costs O(postings of the query terms)
+3. Evicts the oldest records beyond AGENT_MEMORY_CAPACITY, removing their
+   postings
+4. Persists in the background: additions mark the index dirty and a timer
+   thread writes a snapshot (atomic replace) after AGENT_MEMORY_FLUSH_SECONDS;
+   pending changes are also flushed at exit
+
+CONFIGURATION (environment variables):
+- AGENT_MEMORY_CAPACITY: Long-term records kept (default: 1000)
+- AGENT_MEMORY_FLUSH_SECONDS: Delay before a snapshot is written (default: 2)
+"""
+import atexit
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MEMORY_CAPACITY = max(1, int(os.getenv("AGENT_MEMORY_CAPACITY", "1000")))
+FLUSH_SECONDS = float(os.getenv("AGENT_MEMORY_FLUSH_SECONDS", "2"))
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Bookkeeping fields that carry no meaning for retrieval
+UNINDEXED_FIELDS = {"id", "timestamp"}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens, with a plural 's' folded away."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _record_text(value: Any) -> str:
+    if isinstance(value, dict):
+        return " ".join(f"{key} {_record_text(item)}" for key, item in value.items() if key not in UNINDEXED_FIELDS)
+    if isinstance(value, (list, tuple)):
+        return " ".join(_record_text(item) for item in value)
+    return str(value)
+
+
+class MemoryIndex:
+    def __init__(self, path: Path, capacity: int = MEMORY_CAPACITY, flush_seconds: float = FLUSH_SECONDS):
+        self.path = Path(path)
+        self.capacity = capacity
+        self.flush_seconds = flush_seconds
+        self._lock = threading.RLock()
+        self._records: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._norms: Optional[Dict[int, float]] = None
+        self._next_doc = 0
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+
+        for record in self._load():
+            self._insert(record)
+        self._evict()
+
+    def add(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._insert(record)
+            self._evict()
+            self._schedule_flush()
+
+    def records(self) -> List[Dict[str, Any]]:
+        """All records, oldest first."""
+        with self._lock:
+            return list(self._records.values())
+
+    def search(self, query: str, limit: int = 5, min_term_length: int = 4) -> List[Dict[str, Any]]:
+        """
+        Records ranked by BM25 against the query terms.
+
+        Args:
+            query: Free text (e.g. the user's goal)
+            limit: Maximum records returned
+            min_term_length: Shorter query terms are ignored
+        """
+        terms = {term for term in tokenize(query) if len(term) >= min_term_length}
+        with self._lock:
+            count = len(self._records)
+            if not terms or not count:
+                return []
+            norms = self._length_norms()
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc, tf in postings.items():
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norms[doc])
+            # Ties go to the most recent record
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            return [self._records[doc] for doc, _ in ranked]
+
+    def _length_norms(self) -> Dict[int, float]:
+        """BM25 length normalization per record (rebuilt after changes)."""
+        if self._norms is None:
+            average_length = self._total_length / len(self._records) or 1.0
+            self._norms = {
+                doc: K1 * (1 - B + B * length / average_length)
+                for doc, length in self._lengths.items()
+            }
+        return self._norms
+
+    def flush(self) -> None:
+        """Write the current snapshot if anything changed."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            snapshot = list(self._records.values())
+            self._dirty = False
+        try:
+            tmp = self.path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(snapshot, ensure_ascii=False, default=str), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except Exception as exc:
+            logger.warning("Failed to persist long-term agent memory: %s", exc)
+            with self._lock:
+                self._dirty = True
+
+    def _insert(self, record: Dict[str, Any]) -> None:
+        doc = self._next_doc
+        self._next_doc += 1
+        counts = Counter(tokenize(_record_text(record)))
+        self._records[doc] = record
+        self._lengths[doc] = sum(counts.values())
+        self._total_length += self._lengths[doc]
+        self._norms = None
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc] = tf
+
+    def _evict(self) -> None:
+        while len(self._records) > self.capacity:
+            doc, record = self._records.popitem(last=False)
+            self._total_length -= self._lengths.pop(doc)
+            self._norms = None
+            for term in set(tokenize(_record_text(record))):
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(doc, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def _schedule_flush(self) -> None:
+        self._dirty = True
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return [record for record in data if isinstance(record, dict)] if isinstance(data, list) else []
+        except Exception as exc:
+            logger.warning("Failed to read long-term agent memory: %s", exc)
+            return []
+
+
+_memory_indexes: Dict[Path, MemoryIndex] = {}
+_memory_indexes_lock = threading.Lock()
+
+
+def get_memory_index(path: Path) -> MemoryIndex:
+    """Get or create the process-wide index of a long-term memory file."""
+    key = Path(path).resolve()
+    with _memory_indexes_lock:
+        index = _memory_indexes.get(key)
+        if index is None:
+            index = _memory_indexes[key] = MemoryIndex(key)
+        return index
+
+
+@atexit.register
+def _flush_all() -> None:
+    for index in list(_memory_indexes.values()):
+        index.flush()
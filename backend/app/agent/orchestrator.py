@@ -1,17 +1,29 @@
+import asyncio
+import functools
+import json
 import logging
+import os
+import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from app.agent.memory import AgentMemory
+from app.agent.page_context import PageContext
 from app.agent.planner import AgentPlanner
-from app.agent.state import AgentPageResult, AgentState
+from app.agent.scheduler import get_cost_model, predicted_makespan, schedule_longest_first
+from app.agent.state import AgentPageResult, AgentState, RetryBudget
 from app.agent.tools import (
     assess_image_quality,
+    critique_score,
     critique_structured_output,
     parse_structured_text,
     preprocess_with_policy,
+    reocr_suspicious_band,
+    reocr_with_strong_preprocessing,
+    retry_keeps_content,
     run_layout_detection,
     run_qwen_ocr,
 )
@@ -19,12 +31,81 @@ from app.services.docx_generator import DOCXGenerator
 
 logger = logging.getLogger(__name__)
 
+# Pages processed concurrently (across all requests: the executor is shared).
+# Mostly OCR API calls and OpenCV (which releases the GIL), so not tied to CPUs
+AGENT_PAGE_WORKERS = max(1, int(os.getenv("AGENT_PAGE_WORKERS", "4")))
+# Assess every page first and plan the whole upload with one planner call
+AGENT_PLAN_BATCH = os.getenv("AGENT_PLAN_BATCH", "true").lower() == "true"
+# Page order: "lpt" starts the pages predicted to be slowest first, "upload"
+# keeps upload order
+AGENT_PAGE_SCHEDULE = os.getenv("AGENT_PAGE_SCHEDULE", "lpt").lower()
+# Reuse pages the same session already processed (same image content)
+AGENT_SESSION_RESUME = os.getenv("AGENT_SESSION_RESUME", "true").lower() == "true"
+
+# Self-correction budget per session: extra OCR calls and seconds spent on
+# them, shared by every run of the session (resubmissions don't reset it)
+AGENT_RETRY_MAX_CALLS = int(os.getenv("AGENT_RETRY_MAX_CALLS", "4"))
+AGENT_RETRY_MAX_SECONDS = float(os.getenv("AGENT_RETRY_MAX_SECONDS", "60"))
+# Sessions whose budgets stay in memory (older ones are re-read from the
+# session's last completed run)
+AGENT_RETRY_BUDGET_CACHE_SIZE = max(1, int(os.getenv("AGENT_RETRY_BUDGET_CACHE_SIZE", "1024")))
+
+# Tried in order while a page still has suspicious elements
+RETRY_STRATEGIES = [
+    ("suspicious_band", reocr_suspicious_band),
+    ("strong_preprocessing", reocr_with_strong_preprocessing),
+]
+
+_page_executor = None
+_memory_writer = None
+# Retry budgets by session id, most recently used last
+_retry_budgets: "OrderedDict[str, RetryBudget]" = OrderedDict()
+
+
+def _get_page_executor() -> ThreadPoolExecutor:
+    """Runs the blocking page tools (OpenCV, preprocessing, OCR calls)."""
+    global _page_executor
+    if _page_executor is None:
+        _page_executor = ThreadPoolExecutor(max_workers=AGENT_PAGE_WORKERS, thread_name_prefix="agent-page")
+    return _page_executor
+
+
+def _get_memory_writer() -> ThreadPoolExecutor:
+    """Single thread: memory writes from concurrent pages never interleave."""
+    global _memory_writer
+    if _memory_writer is None:
+        _memory_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-memory")
+    return _memory_writer
+
+
+def _session_retry_budget(session_id: str, session: Dict[str, Any]) -> RetryBudget:
+    """
+    The retry budget of a session, shared by all of its runs (event loop
+    only). A session not in memory resumes from the usage its last
+    completed run reported.
+    """
+    budget = _retry_budgets.get(session_id)
+    if budget is None:
+        budget = RetryBudget(AGENT_RETRY_MAX_CALLS, AGENT_RETRY_MAX_SECONDS)
+        for event in reversed(session.get("events", [])):
+            if event.get("type") == "agent_run_completed":
+                used = (event.get("confidence_report") or {}).get("self_correction") or {}
+                budget.calls_used = budget.calls_finished = int(used.get("retry_calls", 0))
+                budget.seconds_used = float(used.get("retry_seconds", 0.0))
+                break
+        _retry_budgets[session_id] = budget
+    _retry_budgets.move_to_end(session_id)
+    while len(_retry_budgets) > AGENT_RETRY_BUDGET_CACHE_SIZE:
+        _retry_budgets.popitem(last=False)
+    return budget
+
 
 class AgenticOCRAgent:
     def __init__(self, base_dir: Path):
         self.base_dir = base_dir
         self.memory = AgentMemory(base_dir)
         self.planner = AgentPlanner()
+        self.cost_model = get_cost_model(self.memory)
 
     async def run(
         self,
@@ -34,13 +115,18 @@ class AgenticOCRAgent:
         user_goal: str,
         session_id: str | None = None,
     ) -> AgentState:
+        # Only a caller-supplied session can have checkpoints to resume from
+        # or a retry budget already spent
+        resuming = session_id is not None
         session_id = session_id or str(uuid.uuid4())
+        session = await self._offload(self.memory.load_session, session_id) if resuming else {}
         state = AgentState(
             session_id=session_id,
             user_goal=user_goal,
             image_paths=image_paths,
             uploads_dir=uploads_dir,
             outputs_dir=outputs_dir,
+            retry_budget=_session_retry_budget(session_id, session),
         )
         self._log(state, "observe", "session_started", {
             "image_count": len(image_paths),
@@ -52,10 +138,81 @@ class AgenticOCRAgent:
             "memory_hits": len(state.memory_hits),
         })
 
+        # Pages run concurrently and are put back in page order. Only
+        # the tools leave the event loop, so audit entries are appended by a
+        # single thread and memory writes go through the writer thread
+        page_slots = asyncio.Semaphore(AGENT_PAGE_WORKERS)
+        # Each image is decoded once and shared by every tool of its page
+        contexts = [PageContext(image_path) for image_path in image_paths]
+        resumed = await self._resume_pages(state, contexts, session) if resuming else {}
+        pending = [index for index in range(len(image_paths)) if index not in resumed]
+        qualities: List[Any] = [None] * len(image_paths)
+        plans: List[Any] = [None] * len(image_paths)
+        order = list(pending)
+        schedule_pages = AGENT_PAGE_SCHEDULE == "lpt" and len(pending) > 1
+
+        if (AGENT_PLAN_BATCH or schedule_pages) and len(pending) > 1:
+            async def assess_in_slot(position: int, index: int) -> Dict[str, Any]:
+                async with page_slots:
+                    quality = await self._assess_page(state, contexts[index], index)
+                # Pages beyond the first wave wait for a worker: don't hold
+                # their decoded upload meanwhile
+                if position >= AGENT_PAGE_WORKERS:
+                    contexts[index].release_original()
+                return quality
+
+            assessed = await asyncio.gather(*(assess_in_slot(position, index) for position, index in enumerate(pending)))
+            for index, quality in zip(pending, assessed):
+                qualities[index] = quality
+
+        if AGENT_PLAN_BATCH and len(pending) > 1:
+            batch = await self._offload(
+                self.planner.plan_batch, user_goal, [qualities[index] for index in pending], state.memory_hits
+            )
+            for index, plan in zip(pending, batch):
+                plans[index] = plan
+            self._log(state, "decide", "planner_selected_batch_actions", {
+                "pages": len(pending),
+                "distinct_plans": len({json.dumps(plan, sort_keys=True, default=str) for plan in batch}),
+            })
+
+        predictions = [self.cost_model.predict(quality) if quality is not None else None for quality in qualities]
+        if schedule_pages:
+            order = [pending[position] for position in schedule_longest_first([predictions[index] for index in pending])]
+            # The first wave changed: only its pages keep their decoded upload
+            for index in order[AGENT_PAGE_WORKERS:]:
+                contexts[index].release_original()
+            state.schedule = {
+                "policy": "lpt",
+                "order": [index + 1 for index in order],
+                "workers": AGENT_PAGE_WORKERS,
+                "predicted_makespan_seconds": predicted_makespan(predictions, order, AGENT_PAGE_WORKERS),
+                "upload_order_makespan_seconds": predicted_makespan(predictions, pending, AGENT_PAGE_WORKERS),
+            }
+            self._log(state, "decide", "scheduled_pages_longest_first", state.schedule)
+
+        async def process_in_slot(index: int) -> AgentPageResult:
+            async with page_slots:
+                started = time.monotonic()
+                try:
+                    page = await self._process_page(
+                        state, contexts[index], index, qualities[index], plans[index], predictions[index]
+                    )
+                finally:
+                    contexts[index].release()
+            page.actual_seconds = round(time.monotonic() - started, 2)
+            self.cost_model.observe(page.quality, page.actual_seconds)
+            return page
+
+        # Tasks queue on the semaphore in creation order: slowest pages first
+        pages_started = time.monotonic()
+        scheduled_results = await asyncio.gather(*(process_in_slot(index) for index in order))
+        page_results = sorted([*scheduled_results, *resumed.values()], key=lambda page: page.page_index)
+        if state.schedule:
+            state.schedule["actual_makespan_seconds"] = round(time.monotonic() - pages_started, 2)
+
         all_structured_json: List[Dict[str, Any]] = []
-        for index, image_path in enumerate(image_paths):
-            state.current_page = index
-            page_result = await self._process_page(state, image_path, index)
+        for index, page_result in enumerate(page_results):
             state.page_results.append(page_result)
 
             if index > 0:
@@ -76,7 +233,8 @@ class AgenticOCRAgent:
             }]
 
         output_path = outputs_dir / f"agentic_{session_id}_converted.docx"
-        DOCXGenerator().generate_document(
+        await self._offload(
+            DOCXGenerator().generate_document,
             structured_json=all_structured_json,
             diagram_dir=None,
             output_path=output_path,
@@ -84,13 +242,13 @@ class AgenticOCRAgent:
         state.final_document_path = str(output_path)
         state.confidence_report = self._build_confidence_report(state)
 
-        self.memory.remember_document_profile({
+        await self._write_memory(self.memory.remember_document_profile, {
             "user_goal": user_goal,
             "image_count": len(image_paths),
             "human_review_required": state.human_review_required,
             "confidence_report": state.confidence_report,
         })
-        self.memory.save_session_event(session_id, {
+        await self._write_memory(self.memory.save_session_event, session_id, {
             "type": "agent_run_completed",
             "output_path": str(output_path),
             "human_review_required": state.human_review_required,
@@ -101,36 +259,54 @@ class AgenticOCRAgent:
         })
         return state
 
-    async def _process_page(self, state: AgentState, image_path: str, page_index: int) -> AgentPageResult:
-        page = AgentPageResult(page_index=page_index, original_path=image_path)
-
+    async def _assess_page(self, state: AgentState, context: PageContext, page_index: int) -> Dict[str, Any]:
         self._log(state, "observe", "assessing_image_quality", {"page": page_index + 1})
-        page.quality = assess_image_quality(image_path)
+        return await self._offload(assess_image_quality, context)
+
+    async def _process_page(
+        self,
+        state: AgentState,
+        context: PageContext,
+        page_index: int,
+        quality: Optional[Dict[str, Any]] = None,
+        plan: Optional[Dict[str, Any]] = None,
+        predicted_seconds: Optional[float] = None,
+    ) -> AgentPageResult:
+        page = AgentPageResult(page_index=page_index, original_path=context.original_path)
+        state.current_page = page_index
+
+        page.quality = quality if quality is not None else await self._assess_page(state, context, page_index)
+        page.predicted_seconds = (
+            predicted_seconds if predicted_seconds is not None else self.cost_model.predict(page.quality)
+        )
         page.actions.append({"action": "assess_image_quality", "result": page.quality})
 
-        plan = self.planner.plan_page(state.user_goal, page.quality, state.memory_hits)
+        if plan is None:
+            plan = await self._offload(self.planner.plan_page, state.user_goal, page.quality, state.memory_hits)
         page.actions.append({"action": "plan_page", "result": plan})
+        # The full plan is in the page actions; the audit log keeps the decision
         self._log(state, "decide", "planner_selected_actions", {
             "page": page_index + 1,
-            "plan": plan,
+            "actions": plan.get("actions", []) if isinstance(plan, dict) else plan,
+            "cached": isinstance(plan, dict) and bool(plan.get("cached")),
         })
 
         self._log(state, "decide", "selecting_preprocessing_policy", {
             "page": page_index + 1,
             "recommendations": page.quality.get("recommendations", []),
         })
-        processed_path, preprocess_actions = preprocess_with_policy(image_path, page.quality)
+        processed_path, preprocess_actions = await self._offload(preprocess_with_policy, context, page.quality)
         page.processed_path = processed_path
         page.actions.extend(preprocess_actions)
 
         self._log(state, "act", "detecting_layout", {"page": page_index + 1})
-        regions, layout_action = run_layout_detection(processed_path)
+        regions, layout_action = await self._offload(run_layout_detection, context)
         page.layout_regions = regions
         page.actions.append(layout_action)
 
         self._log(state, "act", "running_ocr_tool", {"page": page_index + 1})
         try:
-            text, diagram_regions, ocr_action = run_qwen_ocr(processed_path)
+            text, diagram_regions, ocr_action = await self._offload(run_qwen_ocr, context)
             page.actions.append(ocr_action)
             page.actions.append({
                 "action": "diagram_region_detection",
@@ -154,16 +330,149 @@ class AgenticOCRAgent:
         self._log(state, "interpret", "self_critiquing_page_output", {"page": page_index + 1})
         page.critique = critique_structured_output(page.structured_json, page.quality)
         page.actions.append({"action": "self_critique", "result": page.critique})
+        await self._self_correct(state, context, page)
 
-        self.memory.save_session_event(state.session_id, {
+        await self._write_memory(self.memory.save_session_event, state.session_id, {
             "type": "page_processed",
             "page": page_index + 1,
+            "content_hash": await self._offload(context.content_hash),
             "quality": page.quality,
             "critique": page.critique,
             "actions": page.actions,
+            "retries": page.retries,
+            # Checkpoint: a resubmission of the same image reuses this output
+            "structured_json": page.structured_json,
         })
         return page
 
+    async def _resume_pages(
+        self,
+        state: AgentState,
+        contexts: List[PageContext],
+        session: Dict[str, Any],
+    ) -> Dict[int, AgentPageResult]:
+        """
+        Pages of this upload the session already processed, by page index.
+
+        Checkpoints are the session's page_processed events, keyed by the
+        SHA-256 of the uploaded image: an identical image reuses the stored
+        structured_json, critique and quality instead of being OCR'd again.
+        """
+        if not AGENT_SESSION_RESUME:
+            return {}
+        checkpoints: Dict[str, Dict[str, Any]] = {}
+        for event in session.get("events", []):
+            # Later events win; pages that failed OCR are never reused
+            if event.get("type") == "page_processed" and event.get("content_hash") and event.get("structured_json"):
+                if any(
+                    isinstance(element, dict) and element.get("source") == "agent_ocr_error"
+                    for element in event["structured_json"]
+                ):
+                    checkpoints.pop(event["content_hash"], None)
+                else:
+                    checkpoints[event["content_hash"]] = event
+        if not checkpoints:
+            return {}
+
+        hashes = await asyncio.gather(*(self._offload(context.content_hash) for context in contexts))
+        resumed: Dict[int, AgentPageResult] = {}
+        for index, (context, content_hash) in enumerate(zip(contexts, hashes)):
+            checkpoint = checkpoints.get(content_hash)
+            if checkpoint is None:
+                continue
+            page = AgentPageResult(
+                page_index=index,
+                original_path=context.original_path,
+                quality=checkpoint.get("quality", {}),
+                structured_json=checkpoint["structured_json"],
+                critique=checkpoint.get("critique", {}),
+                resumed=True,
+            )
+            page.actions.append({
+                "action": "resume_checkpoint",
+                "decision": "reused",
+                "content_hash": content_hash,
+                "checkpoint_id": checkpoint.get("id"),
+                "checkpoint_page": checkpoint.get("page"),
+            })
+            resumed[index] = page
+            # Re-recorded so the checkpoint outlives compaction of old events
+            await self._write_memory(self.memory.save_session_event, state.session_id, {
+                "type": "page_processed",
+                "page": index + 1,
+                "content_hash": content_hash,
+                "quality": page.quality,
+                "critique": page.critique,
+                "actions": page.actions,
+                "retries": 0,
+                "structured_json": page.structured_json,
+                "resumed": True,
+            })
+
+        if resumed:
+            self._log(state, "interpret", "resumed_session_pages", {
+                "pages": [index + 1 for index in sorted(resumed)],
+                "reprocessing": len(contexts) - len(resumed),
+            })
+        return resumed
+
+    async def _self_correct(self, state: AgentState, context: PageContext, page: AgentPageResult) -> None:
+        """
+        Retry OCR while the critique flags suspicious elements and the run's
+        budget allows; keep a retry only if it lowers the critique score
+        without losing much of the page's text.
+        """
+        for strategy, retry in RETRY_STRATEGIES:
+            if not page.critique.get("suspicious_items"):
+                return
+            reserved = state.retry_budget.reserve()
+            if reserved is None:
+                self._log(state, "decide", "self_correction_budget_exhausted", {"page": page.page_index + 1})
+                return
+
+            before = critique_score(page.critique)
+            started = time.monotonic()
+            try:
+                merged, action = await self._offload(retry, context, page.structured_json, page.critique)
+                critique = critique_structured_output(merged, page.quality)
+                after = critique_score(critique)
+                keeps_content = retry_keeps_content(page.critique, critique)
+                accepted = after < before and keeps_content
+                if accepted:
+                    page.structured_json, page.critique = merged, critique
+                action.update({
+                    "decision": "accepted" if accepted else "rejected",
+                    "keeps_content": keeps_content,
+                    "score_before": before,
+                    "score_after": after,
+                    "improvement": before - after,
+                })
+            except Exception as exc:
+                logger.warning("Agent self-correction (%s) failed on page %s: %s", strategy, page.page_index + 1, exc)
+                action = {"action": "self_correction", "strategy": strategy, "decision": "failed", "reason": str(exc)}
+            elapsed = time.monotonic() - started
+            state.retry_budget.spend(elapsed, reserved)
+            action["seconds"] = round(elapsed, 2)
+            page.actions.append(action)
+            page.retries += 1
+            self._log(state, "act", "self_correction_attempt", {
+                "page": page.page_index + 1,
+                "strategy": strategy,
+                "decision": action["decision"],
+                "improvement": action.get("improvement"),
+                "seconds": action["seconds"],
+            })
+
+    async def _offload(self, func, *args, **kwargs):
+        """Run a blocking tool on the page executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_page_executor(), functools.partial(func, *args, **kwargs))
+
+    async def _write_memory(self, func, *args) -> None:
+        """Queue a memory write on the single writer thread (in submission order)."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_get_memory_writer(), functools.partial(func, *args))
+
     def _build_confidence_report(self, state: AgentState) -> Dict[str, Any]:
         pages = []
         review_count = 0
@@ -178,20 +487,25 @@ class AgenticOCRAgent:
                 "characters": critique.get("total_characters", 0),
                 "human_review_required": critique.get("human_review_required", False),
                 "suspicious_items": critique.get("suspicious_items", []),
+                "retries": page.retries,
+                "resumed": page.resumed,
+                "predicted_seconds": page.predicted_seconds,
+                "actual_seconds": page.actual_seconds,
             })
         return {
             "pages": pages,
             "total_pages": len(state.page_results),
             "pages_requiring_review": review_count,
+            "resumed_pages": sum(1 for page in state.page_results if page.resumed),
             "overall_status": "human_review_recommended" if review_count else "agent_completed",
+            "self_correction": {
+                "retry_calls": state.retry_budget.calls_used,
+                "retry_seconds": round(state.retry_budget.seconds_used, 2),
+                "max_calls": state.retry_budget.max_calls,
+            },
+            "schedule": state.schedule,
         }
 
     def _log(self, state: AgentState, phase: str, message: str, data: Dict[str, Any]) -> None:
-        event = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "phase": phase,
-            "message": message,
-            "data": data,
-        }
-        state.audit_log.append(event)
+        state.audit_log.record(phase, message, data)
         logger.info("Agent phase=%s message=%s data=%s", phase, message, data)
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.services.page_analysis import PageAnalysis
+
+
+class PageContext:
+    """
+    One page as it moves through the agent tools.
+
+    The original upload and the preprocessed image are each decoded at most
+    once and wrapped in a PageAnalysis, so quality assessment, preprocessing,
+    layout detection and OCR share the arrays, their dimensions and every
+    derived transform instead of rereading the files.
+    """
+
+    def __init__(self, original_path: str):
+        self.original_path = original_path
+        self.processed_path: Optional[str] = None
+        self._original: Optional[PageAnalysis] = None
+        self._processed: Optional[PageAnalysis] = None
+        self._content_hash: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def content_hash(self) -> str:
+        """SHA-256 of the uploaded file (hex), computed once."""
+        with self._lock:
+            if self._content_hash is None:
+                digest = hashlib.sha256()
+                with open(self.original_path, "rb") as stream:
+                    for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                        digest.update(chunk)
+                self._content_hash = digest.hexdigest()
+            return self._content_hash
+
+    @property
+    def original(self) -> Optional[PageAnalysis]:
+        """Decoded upload (None if it cannot be read)."""
+        with self._lock:
+            if self._original is None:
+                self._original = PageAnalysis.load(self.original_path)
+            return self._original
+
+    @property
+    def processed(self) -> Optional[PageAnalysis]:
+        """Preprocessed page (the original until preprocessing has run)."""
+        with self._lock:
+            if self._processed is None and self.processed_path and self.processed_path != self.original_path:
+                # Only when a tool wrote the file without handing over its array
+                self._processed = PageAnalysis.load(self.processed_path)
+        return self._processed or self.original
+
+    @property
+    def dimensions(self) -> Optional[Tuple[int, int]]:
+        """(width, height) of the processed page."""
+        page = self.processed
+        if page is None:
+            return None
+        height, width = page.shape
+        return width, height
+
+    def set_processed(self, path: str, image: Optional[np.ndarray] = None) -> None:
+        """Record the preprocessed file and, if available, its array (as written)."""
+        with self._lock:
+            self.processed_path = path
+            self._processed = PageAnalysis(image, path) if image is not None else None
+
+    def release_original(self) -> None:
+        """Drop the decoded upload (e.g. while the page waits for a worker)."""
+        with self._lock:
+            self._original = None
+
+    def release(self) -> None:
+        """Drop every decoded array once the page is done."""
+        with self._lock:
+            self._original = None
+            self._processed = None
@@ -1,16 +1,163 @@
+import copy
 import json
 import logging
 import os
-from typing import Any, Dict, List
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# LLM plans depend only on the goal, bucketed quality and a memory summary,
+# so pages and runs with the same profile share one plan
+AGENT_PLAN_CACHE_SIZE = int(os.getenv("AGENT_PLAN_CACHE_SIZE", "256"))
+AGENT_PLAN_CACHE_TTL = float(os.getenv("AGENT_PLAN_CACHE_TTL", "3600"))
+AGENT_PLAN_MAX_TOKENS = int(os.getenv("AGENT_PLAN_MAX_TOKENS", "300"))
+
+# Bucket edges; the first two match the thresholds of assess_image_quality
+BLUR_BUCKETS = (80, 300)
+CONTRAST_BUCKETS = (35, 60)
+RESOLUTION_BUCKETS = (800 * 600, 2000 * 1500)
+
+ALLOWED_ACTIONS = [
+    "preprocess_image",
+    "detect_layout",
+    "run_ocr",
+    "self_critique",
+    "request_human_review",
+]
+SYSTEM_PROMPT = "You are an OCR workflow planner. Return only compact JSON with keys: actions, rationale, human_review_threshold."
+BATCH_SYSTEM_PROMPT = (
+    "You are an OCR workflow planner. For each page profile, return only compact JSON of the form "
+    '{"plans": {"<profile id>": {"actions": [...], "rationale": "...", "human_review_threshold": "..."}}}.'
+)
+
+
+def _bucket(value: float, edges: Tuple[float, ...]) -> int:
+    return sum(1 for edge in edges if value >= edge)
+
+
+def quality_profile(image_quality: Dict[str, Any]) -> Dict[str, Any]:
+    """Discretized quality features a plan is allowed to depend on."""
+    resolution = image_quality.get("resolution") or {}
+    pixels = int(resolution.get("width", 0)) * int(resolution.get("height", 0))
+    return {
+        "readable": bool(image_quality.get("readable", True)),
+        "blur_bucket": _bucket(float(image_quality.get("blur_score", 0.0)), BLUR_BUCKETS),
+        "contrast_bucket": _bucket(float(image_quality.get("contrast_score", 0.0)), CONTRAST_BUCKETS),
+        "resolution_bucket": _bucket(pixels, RESOLUTION_BUCKETS),
+        "recommendations": sorted(image_quality.get("recommendations", [])),
+    }
+
+
+def memory_summary(memory_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """What the planner sees of long-term memory (full reports cost tokens)."""
+    summary = []
+    for hit in memory_hits[:3]:
+        report = hit.get("confidence_report") or {}
+        summary.append({
+            "user_goal": hit.get("user_goal"),
+            "human_review_required": hit.get("human_review_required"),
+            "overall_status": report.get("overall_status"),
+            "pages_requiring_review": report.get("pages_requiring_review"),
+        })
+    return summary
+
+
+class PlanCache:
+    """
+    TTL + LRU cache of plans. Concurrent misses on one key compute it once.
+    """
+
+    def __init__(self, max_size: int = AGENT_PLAN_CACHE_SIZE, ttl: float = AGENT_PLAN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key: str, plan: Dict[str, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, plan)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Cached plan for key, or compute() it (once across threads).
+
+        Returns:
+            (plan, cache_hit)
+        """
+        while True:
+            with self._lock:
+                plan = self._get_locked(key)
+                if plan is not None:
+                    self.hits += 1
+                    return plan, True
+                pending = self._inflight.get(key)
+                if pending is None:
+                    self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another page is planning this profile: wait, then re-check
+            pending.wait()
+
+        try:
+            plan = compute()
+            self.put(key, plan)
+            return plan, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def _get_locked(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, plan = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return plan
+
+
+_plan_cache = PlanCache()
+_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _get_client(api_key: str, base_url: Optional[str]):
+    """One OpenAI client (and HTTP connection pool) per key and endpoint."""
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is None:
+            from openai import OpenAI
+
+            client_kwargs = {"api_key": api_key}
+            if base_url:
+                client_kwargs["base_url"] = base_url
+            client = _clients[(api_key, base_url)] = OpenAI(**client_kwargs)
+        return client
+
 
 class AgentPlanner:
     def __init__(self):
         self.api_key = os.getenv("AGENT_LLM_API_KEY") or os.getenv("OPENAI_API_KEY")
         self.base_url = os.getenv("AGENT_LLM_BASE_URL")
         self.model = os.getenv("AGENT_LLM_MODEL", "gpt-4o-mini")
+        self.cache = _plan_cache
 
     def plan_page(
         self,
@@ -19,50 +166,131 @@ class AgentPlanner:
         memory_hits: List[Dict[str, Any]],
     ) -> Dict[str, Any]:
         if self.api_key:
+            profile = quality_profile(image_quality)
+            memory = memory_summary(memory_hits)
             try:
-                return self._llm_plan(user_goal, image_quality, memory_hits)
+                plan, cache_hit = self.cache.get_or_compute(
+                    self._cache_key(user_goal, profile, memory),
+                    lambda: self._llm_plan(user_goal, profile, memory),
+                )
+                return self._result(plan, cache_hit)
             except Exception as exc:
                 logger.warning("Agent LLM planner failed, using heuristic planner: %s", exc)
         return self._heuristic_plan(image_quality, memory_hits)
 
-    def _llm_plan(
+    def plan_batch(
         self,
         user_goal: str,
-        image_quality: Dict[str, Any],
+        image_qualities: List[Dict[str, Any]],
         memory_hits: List[Dict[str, Any]],
-    ) -> Dict[str, Any]:
-        from openai import OpenAI
+    ) -> List[Dict[str, Any]]:
+        """
+        Plan several pages with at most one LLM call: pages sharing a quality
+        profile share a plan, and uncached profiles are planned together.
+        """
+        if not self.api_key:
+            return [self._heuristic_plan(quality, memory_hits) for quality in image_qualities]
+
+        memory = memory_summary(memory_hits)
+        profiles = [quality_profile(quality) for quality in image_qualities]
+        keys = [self._cache_key(user_goal, profile, memory) for profile in profiles]
 
-        client_kwargs = {"api_key": self.api_key}
-        if self.base_url:
-            client_kwargs["base_url"] = self.base_url
-        client = OpenAI(**client_kwargs)
+        plans: Dict[str, Tuple[Dict[str, Any], bool]] = {}
+        missing: Dict[str, Dict[str, Any]] = {}
+        for key, profile in zip(keys, profiles):
+            cached = self.cache.get(key)
+            if cached is not None:
+                plans[key] = (cached, True)
+            else:
+                missing.setdefault(key, profile)
+
+        if len(missing) > 1:
+            try:
+                for key, plan in self._llm_plan_batch(user_goal, missing, memory).items():
+                    self.cache.put(key, plan)
+                    plans[key] = (plan, False)
+            except Exception as exc:
+                logger.warning("Agent LLM batch planning failed, planning pages one by one: %s", exc)
+
+        results = []
+        for key, quality in zip(keys, image_qualities):
+            if key in plans:
+                results.append(self._result(*plans[key]))
+            else:
+                results.append(self.plan_page(user_goal, quality, memory_hits))
+        return results
+
+    def _llm_plan(
+        self,
+        user_goal: str,
+        profile: Dict[str, Any],
+        memory: List[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        client = _get_client(self.api_key, self.base_url)
         prompt = {
             "user_goal": user_goal,
-            "image_quality": image_quality,
-            "relevant_memory": memory_hits[:3],
-            "allowed_actions": [
-                "preprocess_image",
-                "detect_layout",
-                "run_ocr",
-                "self_critique",
-                "request_human_review",
-            ],
+            "image_quality": profile,
+            "relevant_memory": memory,
+            "allowed_actions": ALLOWED_ACTIONS,
         }
         response = client.chat.completions.create(
             model=self.model,
             messages=[
-                {
-                    "role": "system",
-                    "content": "You are an OCR workflow planner. Return only compact JSON with keys: actions, rationale, human_review_threshold.",
-                },
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": json.dumps(prompt)},
             ],
             temperature=0.1,
+            max_tokens=AGENT_PLAN_MAX_TOKENS,
         )
         content = response.choices[0].message.content or "{}"
         return json.loads(content)
 
+    def _llm_plan_batch(
+        self,
+        user_goal: str,
+        profiles: Dict[str, Dict[str, Any]],
+        memory: List[Dict[str, Any]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """Plans for several profiles from one completion, by cache key."""
+        client = _get_client(self.api_key, self.base_url)
+        keys_by_id = {f"p{index}": key for index, key in enumerate(profiles)}
+        prompt = {
+            "user_goal": user_goal,
+            "page_profiles": {profile_id: profiles[key] for profile_id, key in keys_by_id.items()},
+            "relevant_memory": memory,
+            "allowed_actions": ALLOWED_ACTIONS,
+        }
+        response = client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(prompt)},
+            ],
+            temperature=0.1,
+            max_tokens=AGENT_PLAN_MAX_TOKENS * len(profiles),
+        )
+        content = json.loads(response.choices[0].message.content or "{}")
+        plans = content.get("plans", {}) if isinstance(content, dict) else {}
+        # Profiles the model skipped are planned one by one by the caller
+        return {
+            keys_by_id[profile_id]: plan
+            for profile_id, plan in plans.items()
+            if profile_id in keys_by_id and isinstance(plan, dict)
+        }
+
+    @staticmethod
+    def _cache_key(user_goal: str, profile: Dict[str, Any], memory: List[Dict[str, Any]]) -> str:
+        goal = " ".join(user_goal.lower().split())
+        return json.dumps([goal, profile, memory], sort_keys=True)
+
+    @staticmethod
+    def _result(plan: Dict[str, Any], cache_hit: bool) -> Dict[str, Any]:
+        # Callers store plans in page actions: never hand out the cached object
+        result = copy.deepcopy(plan)
+        if cache_hit:
+            result["cached"] = True
+        return result
+
     def _heuristic_plan(self, image_quality: Dict[str, Any], memory_hits: List[Dict[str, Any]]) -> Dict[str, Any]:
         actions = ["preprocess_image", "detect_layout", "run_ocr", "self_critique"]
         recommendations = image_quality.get("recommendations", [])
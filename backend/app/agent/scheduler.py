@@ -0,0 +1,118 @@
+import heapq
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.agent.planner import quality_profile
+from app.agent.tools import select_preprocessing_steps
+
+# Prior page cost in seconds, used until history exists for a profile:
+# OCR round trip, plus per megapixel and per selected preprocessing step.
+# Blurry pages are the ones self-correction usually retries
+PRIOR_BASE_SECONDS = 4.0
+PRIOR_SECONDS_PER_MEGAPIXEL = 0.5
+PRIOR_SECONDS_PER_STEP = 0.8
+PRIOR_BLURRY_RETRY_SECONDS = 3.0
+SMOOTHING = 0.3
+
+
+def _megapixels(quality: Dict[str, Any]) -> float:
+    resolution = quality.get("resolution") or {}
+    return int(resolution.get("width", 0)) * int(resolution.get("height", 0)) / 1_000_000
+
+
+def _profile_key(quality: Dict[str, Any]) -> Tuple[Any, ...]:
+    profile = quality_profile(quality)
+    return (
+        profile["readable"],
+        profile["blur_bucket"],
+        profile["contrast_bucket"],
+        profile["resolution_bucket"],
+    )
+
+
+def prior_seconds(quality: Dict[str, Any]) -> float:
+    """Cost of a page from its quality metrics alone."""
+    steps, _ = select_preprocessing_steps(quality)
+    seconds = PRIOR_BASE_SECONDS
+    seconds += PRIOR_SECONDS_PER_MEGAPIXEL * _megapixels(quality)
+    seconds += PRIOR_SECONDS_PER_STEP * len(steps)
+    if "image_may_be_blurry" in quality.get("recommendations", []):
+        seconds += PRIOR_BLURRY_RETRY_SECONDS
+    return seconds
+
+
+class PageCostModel:
+    """
+    Predicted processing seconds of a page.
+
+    Keeps a running average of actual seconds per quality profile (the
+    planner's buckets); unseen profiles get the prior scaled by how far
+    actual costs have run from it so far (calibration).
+    """
+
+    def __init__(self, smoothing: float = SMOOTHING):
+        self.smoothing = smoothing
+        self._by_profile: Dict[Tuple[Any, ...], float] = {}
+        self._calibration: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def predict(self, quality: Dict[str, Any]) -> float:
+        with self._lock:
+            seconds = self._by_profile.get(_profile_key(quality))
+            if seconds is None:
+                seconds = prior_seconds(quality) * (self._calibration or 1.0)
+        return round(seconds, 2)
+
+    def observe(self, quality: Dict[str, Any], seconds: float) -> None:
+        if not quality or seconds <= 0:
+            return
+        key = _profile_key(quality)
+        ratio = seconds / prior_seconds(quality)
+        with self._lock:
+            previous = self._by_profile.get(key)
+            self._by_profile[key] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+            calibration = self._calibration
+            self._calibration = ratio if calibration is None else calibration + self.smoothing * (ratio - calibration)
+
+    def seed(self, records: List[Dict[str, Any]]) -> None:
+        """Learn from the per-page costs of earlier runs (long-term memory, oldest first)."""
+        for record in records:
+            report = record.get("confidence_report") or {}
+            for page in report.get("pages", []):
+                if page.get("quality") and page.get("actual_seconds"):
+                    self.observe(page["quality"], float(page["actual_seconds"]))
+
+
+def schedule_longest_first(costs: Sequence[float]) -> List[int]:
+    """
+    Page indexes in descending predicted cost (ties in upload order).
+
+    Handing pages to the first free worker in this order is the LPT
+    heuristic: a long page never starts last and stretches the makespan.
+    """
+    return sorted(range(len(costs)), key=lambda index: (-costs[index], index))
+
+
+def predicted_makespan(costs: Sequence[float], order: Sequence[int], workers: int) -> float:
+    """Finish time of the last page when `order` is fed to `workers` workers."""
+    finish_times = [0.0] * max(1, min(workers, len(order)))
+    for index in order:
+        heapq.heapreplace(finish_times, finish_times[0] + costs[index])
+    return round(max(finish_times), 2)
+
+
+# One model per long-term memory file, seeded from it once per process
+_cost_models: Dict[Path, PageCostModel] = {}
+_cost_models_lock = threading.Lock()
+
+
+def get_cost_model(memory) -> PageCostModel:
+    """Get or create the cost model learned from an AgentMemory's history."""
+    key = Path(memory.long_term_file).resolve()
+    with _cost_models_lock:
+        model = _cost_models.get(key)
+        if model is None:
+            model = _cost_models[key] = PageCostModel()
+            model.seed(memory.load_long_term())
+        return model
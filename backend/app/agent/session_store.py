@@ -0,0 +1,322 @@
+"""
+Append-only session event store for AgentMemory.
+
+Each session is a directory of JSONL segments:
+
+    agent_memory/sessions/<session_id>/
+        000001.jsonl, 000002.jsonl, ...   one event per line, oldest first
+        preferences.json                  optional session preferences
+        .lock                             cross-process lock file
+
+- Appends write one line to the newest segment (O(1), no read-back); a
+  segment is sealed once it exceeds AGENT_SESSION_SEGMENT_BYTES
+- Compaction: when a session has more than AGENT_SESSION_MAX_SEGMENTS
+  segments, the sealed ones are rewritten into a single segment keeping
+  the latest AGENT_SESSION_MAX_EVENTS events (atomic replace)
+- Locking: a per-session thread lock plus flock() on the session's lock
+  file (where available), so requests sharing a session_id never
+  interleave partial lines or race a compaction. Only appends (and legacy
+  migration) create a session directory: loading an unknown session
+  returns it empty and leaves nothing on disk
+- Index: byte offsets of every line per segment, built on first use and
+  extended on append (or when another process grew the file), so the
+  latest N events are read with one seek instead of a full scan. An index
+  is rebuilt when its file was replaced (new inode, e.g. compacted by
+  another process) or shrank
+- Locks and indexes are kept for the AGENT_SESSION_CACHE_SIZE most
+  recently used sessions; idle sessions beyond that are forgotten and
+  re-indexed on next use
+
+Legacy session_<id>.json files are migrated on first access.
+
+CONFIGURATION (environment variables):
+- AGENT_SESSION_SEGMENT_BYTES: Segment size before rolling (default: 1 MiB)
+- AGENT_SESSION_MAX_SEGMENTS: Segments before compaction (default: 8)
+- AGENT_SESSION_MAX_EVENTS: Events kept by compaction (default: 2000)
+- AGENT_SESSION_CACHE_SIZE: Sessions whose locks and indexes stay in
+  memory (default: 256)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: thread locks only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_BYTES = int(os.getenv("AGENT_SESSION_SEGMENT_BYTES", str(1024 * 1024)))
+MAX_SEGMENTS = max(2, int(os.getenv("AGENT_SESSION_MAX_SEGMENTS", "8")))
+MAX_EVENTS = int(os.getenv("AGENT_SESSION_MAX_EVENTS", "2000"))
+CACHE_SIZE = max(1, int(os.getenv("AGENT_SESSION_CACHE_SIZE", "256")))
+
+_SAFE_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _encode(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+
+class _SegmentIndex:
+    """Line start offsets of one segment (file inode), up to indexed_size bytes."""
+
+    def __init__(self, inode: int):
+        self.inode = inode
+        self.offsets: List[int] = []
+        self.indexed_size = 0
+
+
+class _SessionEntry:
+    """In-memory state of one session: its thread lock and segment indexes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes: Dict[str, _SegmentIndex] = {}
+        self.users = 0
+
+
+class SessionStore:
+    def __init__(self, root: Path, legacy_dir: Optional[Path] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.legacy_dir = Path(legacy_dir) if legacy_dir is not None else None
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self._sessions_guard = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def append(self, session_id: str, event: Dict[str, Any]) -> None:
+        line = _encode(event)
+        with self._session_lock(session_id) as session_dir:
+            segments = self._segments(session_dir)
+            if not segments or segments[-1].stat().st_size >= SEGMENT_BYTES:
+                segments.append(session_dir / f"{self._next_number(segments):06d}.jsonl")
+            active = segments[-1]
+
+            with open(active, "ab") as stream:
+                offset = stream.tell()
+                stream.write(line)
+
+            index = self._index(session_id, active)
+            if index.indexed_size == offset:
+                index.offsets.append(offset)
+                index.indexed_size = offset + len(line)
+
+            if len(segments) > MAX_SEGMENTS:
+                self._compact(session_id, segments[:-1], active)
+
+    def load(self, session_id: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Load a session's events (oldest first).
+
+        Args:
+            session_id: Session id
+            limit: Only the latest `limit` events (default: all)
+        """
+        with self._session_lock(session_id, create=False) as session_dir:
+            if session_dir is None:
+                return {"session_id": session_id, "events": [], "preferences": {}}
+            segments = self._segments(session_dir)
+            # Forget segments another process compacted away
+            live = {segment.name for segment in segments}
+            session_indexes = self._sessions[session_id].indexes
+            for name in [name for name in session_indexes if name not in live]:
+                del session_indexes[name]
+            events = self._read_latest(session_id, segments, limit)
+            preferences = self._read_preferences(session_dir)
+        return {"session_id": session_id, "events": events, "preferences": preferences}
+
+    def compact(self, session_id: str) -> None:
+        """Merge every sealed segment of a session now."""
+        with self._session_lock(session_id, create=False) as session_dir:
+            if session_dir is None:
+                return
+            segments = self._segments(session_dir)
+            if len(segments) > 1:
+                self._compact(session_id, segments[:-1], segments[-1])
+
+    # ------------------------------------------------------------------
+    # Segments and index
+    # ------------------------------------------------------------------
+
+    def _segments(self, session_dir: Path) -> List[Path]:
+        return sorted(session_dir.glob("*.jsonl"))
+
+    @staticmethod
+    def _next_number(segments: List[Path]) -> int:
+        return int(segments[-1].stem) + 1 if segments else 1
+
+    def _index(self, session_id: str, segment: Path) -> _SegmentIndex:
+        """Index of a segment, extended to the segment's current size."""
+        session_indexes = self._sessions[session_id].indexes
+        info = segment.stat()
+        size = info.st_size
+        index = session_indexes.get(segment.name)
+        if index is None or index.inode != info.st_ino or size < index.indexed_size:
+            # New, or replaced/rewritten (e.g. compacted by another process)
+            index = session_indexes[segment.name] = _SegmentIndex(info.st_ino)
+        if size > index.indexed_size:
+            with open(segment, "rb") as stream:
+                stream.seek(index.indexed_size)
+                position = index.indexed_size
+                for raw in stream:
+                    if not raw.endswith(b"\n"):
+                        break  # Line still being written by another process
+                    index.offsets.append(position)
+                    position += len(raw)
+                index.indexed_size = position
+        return index
+
+    def _read_latest(self, session_id: str, segments: List[Path], limit: Optional[int]) -> List[Dict[str, Any]]:
+        chunks: List[List[Dict[str, Any]]] = []
+        remaining = limit
+        for segment in reversed(segments):
+            if remaining is not None and remaining <= 0:
+                break
+            index = self._index(session_id, segment)
+            offsets = index.offsets
+            if remaining is not None:
+                offsets = offsets[-remaining:]
+                remaining -= len(offsets)
+            if not offsets:
+                continue
+            with open(segment, "rb") as stream:
+                stream.seek(offsets[0])
+                data = stream.read(index.indexed_size - offsets[0])
+            chunks.append(self._decode_lines(data, segment))
+        return [event for chunk in reversed(chunks) for event in chunk]
+
+    @staticmethod
+    def _decode_lines(data: bytes, segment: Path) -> List[Dict[str, Any]]:
+        events = []
+        for raw in data.splitlines():
+            try:
+                events.append(json.loads(raw))
+            except ValueError:
+                logger.warning("Skipping corrupt agent session event in %s", segment)
+        return events
+
+    def _compact(self, session_id: str, sealed: List[Path], active: Path) -> None:
+        """Rewrite sealed segments as one, keeping the latest MAX_EVENTS events overall."""
+        keep = max(0, MAX_EVENTS - len(self._index(session_id, active).offsets))
+        events = self._read_latest(session_id, sealed, keep)
+
+        # The merged segment takes the oldest sealed number so order is kept
+        target = sealed[0]
+        tmp = target.with_suffix(".jsonl.tmp")
+        with open(tmp, "wb") as stream:
+            for event in events:
+                stream.write(_encode(event))
+        os.replace(tmp, target)
+        for segment in sealed[1:]:
+            segment.unlink()
+
+        session_indexes = self._sessions[session_id].indexes
+        for segment in sealed:
+            session_indexes.pop(segment.name, None)
+        logger.info("Compacted agent session %s: %s segments -> 1 (%s events)", session_id, len(sealed), len(events))
+
+    # ------------------------------------------------------------------
+    # Locking, paths and migration
+    # ------------------------------------------------------------------
+
+    def _session_dir(self, session_id: str) -> Path:
+        # session_id comes from the client: never use it as a path verbatim
+        if _SAFE_SESSION_ID.match(session_id):
+            return self.root / session_id
+        return self.root / hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+
+    @contextmanager
+    def _session_lock(self, session_id: str, create: bool = True):
+        """
+        Hold a session's thread and file locks, yielding its directory.
+
+        With create=False (read paths) a session that has neither a
+        directory nor a legacy file to migrate yields None: looking up an
+        unknown client-supplied id leaves nothing on disk.
+        """
+        with self._sessions_guard:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = _SessionEntry()
+            self._sessions.move_to_end(session_id)
+            entry.users += 1
+        try:
+            with entry.lock:
+                session_dir = self._session_dir(session_id)
+                if not create and not session_dir.is_dir() and self._legacy_file(session_id) is None:
+                    yield None
+                    return
+                session_dir.mkdir(parents=True, exist_ok=True)
+                with open(session_dir / ".lock", "a") as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        self._migrate_legacy(session_id, session_dir)
+                        yield session_dir
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self._sessions_guard:
+                entry.users -= 1
+                self._evict_idle_sessions()
+
+    def _evict_idle_sessions(self) -> None:
+        """Forget least recently used sessions nobody holds (caller has the guard)."""
+        excess = len(self._sessions) - CACHE_SIZE
+        if excess <= 0:
+            return
+        for session_id in [sid for sid, entry in self._sessions.items() if entry.users == 0][:excess]:
+            del self._sessions[session_id]
+
+    def _read_preferences(self, session_dir: Path) -> Dict[str, Any]:
+        try:
+            return json.loads((session_dir / "preferences.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            logger.warning("Failed to read agent session preferences %s: %s", session_dir.name, exc)
+            return {}
+
+    def _legacy_file(self, session_id: str) -> Optional[Path]:
+        """A pre-segment session_<id>.json file still waiting for migration."""
+        if self.legacy_dir is None or not _SAFE_SESSION_ID.match(session_id):
+            return None
+        legacy_file = self.legacy_dir / f"session_{session_id}.json"
+        return legacy_file if legacy_file.exists() else None
+
+    def _migrate_legacy(self, session_id: str, session_dir: Path) -> None:
+        """Import a pre-segment session_<id>.json file once."""
+        legacy_file = self._legacy_file(session_id)
+        if legacy_file is None:
+            return
+        try:
+            legacy = json.loads(legacy_file.read_text(encoding="utf-8"))
+        except Exception as exc:
+            logger.warning("Failed to migrate agent session memory %s: %s", session_id, exc)
+            return
+
+        segments = self._segments(session_dir)
+        # Legacy events predate anything appended since: prepend as segment 0
+        target = session_dir / f"{0 if segments else 1:06d}.jsonl"
+        tmp = target.with_suffix(".jsonl.tmp")
+        with open(tmp, "wb") as stream:
+            for event in legacy.get("events", [])[-MAX_EVENTS:]:
+                stream.write(_encode(event))
+        os.replace(tmp, target)
+        if legacy.get("preferences"):
+            (session_dir / "preferences.json").write_text(json.dumps(legacy["preferences"], ensure_ascii=False), encoding="utf-8")
+        legacy_file.unlink()
+        logger.info("Migrated agent session %s to the segment store", session_id)
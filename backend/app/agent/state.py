@@ -2,6 +2,9 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+from app.agent.audit import AuditLog
+from app.services.region_table import RegionTable
+
 
 @dataclass
 class AgentPageResult:
@@ -9,10 +12,52 @@ class AgentPageResult:
     original_path: str
     processed_path: Optional[str] = None
     quality: Dict[str, Any] = field(default_factory=dict)
-    layout_regions: List[Dict[str, Any]] = field(default_factory=list)
+    layout_regions: RegionTable = field(default_factory=RegionTable)
     structured_json: List[Dict[str, Any]] = field(default_factory=list)
     critique: Dict[str, Any] = field(default_factory=dict)
     actions: List[Dict[str, Any]] = field(default_factory=list)
+    retries: int = 0
+    resumed: bool = False
+    predicted_seconds: Optional[float] = None
+    actual_seconds: Optional[float] = None
+
+
+@dataclass
+class RetryBudget:
+    """
+    Extra OCR calls and seconds self-correction may spend in one session.
+
+    Concurrent pages retry at the same time, so a retry is charged an
+    estimate of its duration when it is reserved (the average of finished
+    retries, or an even share of max_seconds before any finished) and the
+    actual duration when it ends.
+    """
+    max_calls: int = 0
+    max_seconds: float = 0.0
+    calls_used: int = 0
+    seconds_used: float = 0.0
+    seconds_reserved: float = 0.0
+    calls_finished: int = 0
+
+    def estimate(self) -> float:
+        if self.calls_finished:
+            return self.seconds_used / self.calls_finished
+        return self.max_seconds / max(1, self.max_calls)
+
+    def reserve(self) -> Optional[float]:
+        """Claim one retry if the budget allows it (its charged estimate, or None)."""
+        if self.calls_used >= self.max_calls or self.seconds_used + self.seconds_reserved >= self.max_seconds:
+            return None
+        estimate = self.estimate()
+        self.calls_used += 1
+        self.seconds_reserved += estimate
+        return estimate
+
+    def spend(self, seconds: float, reserved: float) -> None:
+        """Replace a retry's reserved estimate with its actual duration."""
+        self.seconds_reserved = max(0.0, self.seconds_reserved - reserved)
+        self.seconds_used += seconds
+        self.calls_finished += 1
 
 
 @dataclass
@@ -24,9 +69,11 @@ class AgentState:
     outputs_dir: Path
     current_page: int = 0
     page_results: List[AgentPageResult] = field(default_factory=list)
-    audit_log: List[Dict[str, Any]] = field(default_factory=list)
+    audit_log: AuditLog = field(default_factory=AuditLog)
     memory_hits: List[Dict[str, Any]] = field(default_factory=list)
     human_review_required: bool = False
     human_review_questions: List[str] = field(default_factory=list)
     final_document_path: Optional[str] = None
     confidence_report: Dict[str, Any] = field(default_factory=dict)
+    retry_budget: RetryBudget = field(default_factory=RetryBudget)
+    schedule: Dict[str, Any] = field(default_factory=dict)
@@ -1,22 +1,44 @@
 import logging
 import math
+import os
 import shutil
+import threading
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import cv2
 import numpy as np
 
+from app.agent.page_context import PageContext
 from app.services.layout import detect_layout
-from app.services.preprocessing import preprocess_image
+from app.services.region_table import RegionTable
+from app.services.preprocessing import OPTIONAL_STEPS, preprocess_image_array
 from app.services.qwen_vl_ocr import get_qwen_vl_ocr
 
 logger = logging.getLogger(__name__)
 
+# adaptive: run only the preprocessing steps the page's quality calls for;
+# full: always run the whole preprocess_image chain
+AGENT_PREPROCESS_POLICY = os.getenv("AGENT_PREPROCESS_POLICY", "adaptive").lower()
 
-def assess_image_quality(image_path: str) -> Dict[str, Any]:
-    image = cv2.imread(image_path)
-    if image is None:
+# Quality thresholds (assess_image_quality, critique, preprocessing policy)
+BLUR_THRESHOLD = 80
+CONTRAST_THRESHOLD = 35
+MIN_WIDTH, MIN_HEIGHT = 800, 600
+
+# Self-correction: re-OCR inputs are upscaled by this factor
+RETRY_UPSCALE = 2.0
+# Rows with less ink than this fraction of the width are blank (band search)
+INK_ROW_FRACTION = 0.005
+# A retry is kept only if the page keeps at least these fractions of its
+# characters and elements: fewer suspicious items must not mean less text
+RETRY_MIN_CHARACTER_FRACTION = 0.8
+RETRY_MIN_ELEMENT_FRACTION = 0.5
+
+
+def assess_image_quality(context: PageContext) -> Dict[str, Any]:
+    page = context.original
+    if page is None:
         return {
             "readable": False,
             "blur_score": 0.0,
@@ -25,17 +47,16 @@ def assess_image_quality(image_path: str) -> Dict[str, Any]:
             "recommendations": ["request_human_review"],
         }
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    height, width = gray.shape[:2]
-    blur_score = float(cv2.Laplacian(gray, cv2.CV_64F).var())
-    contrast_score = float(gray.std())
+    height, width = page.shape
+    blur_score = page.laplacian_variance
+    contrast_score = page.contrast
     recommendations: List[str] = []
 
-    if blur_score < 80:
+    if blur_score < BLUR_THRESHOLD:
         recommendations.append("image_may_be_blurry")
-    if contrast_score < 35:
+    if contrast_score < CONTRAST_THRESHOLD:
         recommendations.append("enhance_contrast")
-    if width < 800 or height < 600:
+    if width < MIN_WIDTH or height < MIN_HEIGHT:
         recommendations.append("low_resolution")
 
     return {
@@ -47,20 +68,110 @@ def assess_image_quality(image_path: str) -> Dict[str, Any]:
     }
 
 
-def preprocess_with_policy(image_path: str, quality: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+def select_preprocessing_steps(quality: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """
+    Minimal preprocessing for a page, from its quality metrics.
+
+    Returns:
+        (steps to run, reasons); a clean page (sharp, enough contrast and
+        resolution) runs none of the optional steps
+    """
+    if AGENT_PREPROCESS_POLICY == "full" or not quality.get("readable", False):
+        return list(OPTIONAL_STEPS), ["full_pipeline"]
+
+    low_contrast = quality.get("contrast_score", 0.0) < CONTRAST_THRESHOLD
+    blurry = quality.get("blur_score", 0.0) < BLUR_THRESHOLD
+    resolution = quality.get("resolution", {})
+    low_resolution = resolution.get("width", 0) < MIN_WIDTH or resolution.get("height", 0) < MIN_HEIGHT
+
+    steps, reasons = [], []
+    # CLAHE amplifies sensor noise: denoise first on dim or small photos
+    if low_contrast or low_resolution:
+        steps.append("denoise")
+        reasons.append("low_contrast" if low_contrast else "low_resolution")
+    if low_contrast or blurry:
+        steps.append("contrast")
+        reasons.append("low_contrast" if low_contrast else "blurry")
+    # Skew is not measured: straighten every page that is not clean
+    if steps:
+        steps.append("deskew")
+    return steps, sorted(set(reasons)) or ["clean_page"]
+
+
+class _StepCosts:
+    """Running average cost (ms per megapixel) of each preprocessing step."""
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._costs: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, float], megapixels: float):
+        if megapixels <= 0:
+            return
+        with self._lock:
+            for step, ms in timings.items():
+                cost = ms / megapixels
+                previous = self._costs.get(step)
+                self._costs[step] = cost if previous is None else previous + self.smoothing * (cost - previous)
+
+    def estimate(self, steps: List[str], megapixels: float) -> Optional[float]:
+        """Estimated ms for steps on a page (None until each was observed)."""
+        with self._lock:
+            if any(step not in self._costs for step in steps):
+                return None
+            return round(sum(self._costs[step] for step in steps) * megapixels, 1)
+
+
+_step_costs = _StepCosts()
+
+
+def preprocess_with_policy(context: PageContext, quality: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+    image_path = context.original_path
     actions = []
+    steps, reasons = select_preprocessing_steps(quality)
+    skipped = [step for step in OPTIONAL_STEPS if step not in steps]
     try:
-        processed_path = preprocess_image(image_path)
+        original = context.original
+        timings: Dict[str, float] = {}
+        # Next to the upload: the request's scratch directory owns both files
+        processed_path, processed = preprocess_image_array(
+            image_path,
+            output_dir=Path(image_path).parent,
+            image=original.image if original is not None else None,
+            steps=steps,
+            timings=timings,
+        )
+        # The last-resort fallback of the save step hands back the upload
+        context.set_processed(processed_path, processed if processed_path != image_path else None)
+
+        resolution = quality.get("resolution", {})
+        megapixels = resolution.get("width", 0) * resolution.get("height", 0) / 1e6
+        _step_costs.record(timings, megapixels)
+        saved_ms = _step_costs.estimate(skipped, megapixels) if skipped else 0.0
+        if skipped:
+            logger.info(
+                "Adaptive preprocessing skipped %s for %s (%s): saved ~%s ms",
+                ", ".join(skipped), Path(image_path).name, ", ".join(reasons),
+                "?" if saved_ms is None else saved_ms,
+            )
         actions.append({
             "action": "preprocess_image",
-            "decision": "applied_existing_pipeline",
+            "decision": "applied_existing_pipeline" if not skipped else "applied_adaptive_pipeline",
             "reason": "agent selected preprocessing before OCR to improve readability",
+            "policy": reasons,
+            "steps": steps,
+            "skipped_steps": skipped,
+            "timings_ms": timings,
+            "estimated_savings_ms": saved_ms,
             "output": processed_path,
         })
         return processed_path, actions
     except Exception as exc:
         fallback_path = str(Path(image_path).with_name(f"agent_original_{Path(image_path).name}"))
         shutil.copyfile(image_path, fallback_path)
+        original = context.original
+        context.set_processed(fallback_path, original.image if original is not None else None)
         actions.append({
             "action": "preprocess_image",
             "decision": "fallback_to_original",
@@ -70,21 +181,18 @@ def preprocess_with_policy(image_path: str, quality: Dict[str, Any]) -> Tuple[st
         return fallback_path, actions
 
 
-def run_layout_detection(image_path: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+def run_layout_detection(context: PageContext) -> Tuple[RegionTable, Dict[str, Any]]:
+    image_path = context.processed_path or context.original_path
     try:
-        regions = detect_layout(image_path)
+        regions = detect_layout(image_path, page=context.processed)
         return regions, {
             "action": "detect_layout",
             "decision": "completed",
             "region_count": len(regions),
         }
     except Exception as exc:
-        image = cv2.imread(image_path)
-        if image is None:
-            regions = []
-        else:
-            height, width = image.shape[:2]
-            regions = [{"type": "paragraph", "bbox": [0, 0, int(width), int(height)]}]
+        dimensions = context.dimensions
+        regions = RegionTable.full_page(*dimensions) if dimensions else RegionTable()
         return regions, {
             "action": "detect_layout",
             "decision": "fallback_full_page_region",
@@ -93,11 +201,10 @@ def run_layout_detection(image_path: str) -> Tuple[List[Dict[str, Any]], Dict[st
         }
 
 
-def run_qwen_ocr(image_path: str) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
-    image = cv2.imread(image_path)
-    height = width = None
-    if image is not None:
-        height, width = image.shape[:2]
+def run_qwen_ocr(context: PageContext) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
+    # The API needs the encoded file; only the dimensions come from memory
+    image_path = context.processed_path or context.original_path
+    width, height = context.dimensions or (None, None)
 
     qwen_ocr = get_qwen_vl_ocr()
     text, diagram_regions = qwen_ocr.extract_text_from_image(
@@ -150,18 +257,122 @@ def critique_structured_output(structured_json: List[Dict[str, Any]], quality: D
             suspicious_items.append({"index": index, "reason": "high_symbol_noise"})
 
     human_review_required = bool(suspicious_items)
-    if quality.get("blur_score", 1000) < 80 or quality.get("contrast_score", 1000) < 35:
+    if quality.get("blur_score", 1000) < BLUR_THRESHOLD or quality.get("contrast_score", 1000) < CONTRAST_THRESHOLD:
         human_review_required = True
 
     return {
         "total_elements": len(structured_json),
         "total_characters": total_chars,
         "suspicious_items": suspicious_items[:10],
+        "suspicious_count": len(suspicious_items),
         "human_review_required": human_review_required,
         "summary": "review_recommended" if human_review_required else "output_accepted_by_agent",
     }
 
 
+def critique_score(critique: Dict[str, Any]) -> int:
+    """Lower is better: suspicious elements (all of them), plus one for a page without text."""
+    suspicious = critique.get("suspicious_count", len(critique.get("suspicious_items", [])))
+    return suspicious + (0 if critique.get("total_characters") else 1)
+
+
+def retry_keeps_content(before: Dict[str, Any], after: Dict[str, Any]) -> bool:
+    """Whether a retried page kept most of the characters and elements it had."""
+    return (
+        after.get("total_characters", 0) >= RETRY_MIN_CHARACTER_FRACTION * before.get("total_characters", 0)
+        and after.get("total_elements", 0) >= RETRY_MIN_ELEMENT_FRACTION * before.get("total_elements", 0)
+    )
+
+
+def reocr_suspicious_band(
+    context: PageContext,
+    structured_json: List[Dict[str, Any]],
+    critique: Dict[str, Any],
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Re-OCR, upscaled, the horizontal band of the page holding the suspicious
+    elements and splice the result in their place.
+
+    Elements come in reading order, so element i of n sits roughly at
+    i/n of the page's inked height; the band spans the suspicious elements
+    plus one neighbour on each side, and so does the replaced range.
+
+    Returns:
+        (merged structured_json, action)
+    """
+    indices = sorted(item["index"] for item in critique.get("suspicious_items", []))
+    page = context.processed
+    if not indices or page is None or not structured_json:
+        raise ValueError("no suspicious elements to retry")
+
+    count = len(structured_json)
+    start, end = max(0, indices[0] - 1), min(count, indices[-1] + 2)
+    ink_rows = np.flatnonzero(np.count_nonzero(page.binary, axis=1) > INK_ROW_FRACTION * page.shape[1])
+    top, bottom = (int(ink_rows[0]), int(ink_rows[-1]) + 1) if ink_rows.size else (0, page.shape[0])
+    y1 = top + (bottom - top) * start // count
+    y2 = top + math.ceil((bottom - top) * end / count)
+
+    crop = cv2.resize(page.image[y1:y2], None, fx=RETRY_UPSCALE, fy=RETRY_UPSCALE, interpolation=cv2.INTER_CUBIC)
+    source = Path(context.processed_path or context.original_path)
+    retry_path = str(source.with_name(f"{source.stem}_retry_{y1}_{y2}.png"))
+    cv2.imwrite(retry_path, crop)
+
+    text, _ = get_qwen_vl_ocr().extract_text_from_image(
+        retry_path,
+        image_width=crop.shape[1],
+        image_height=crop.shape[0],
+    )
+    if not (text or "").strip():
+        raise ValueError("re-OCR returned no text")
+    replacement = [dict(item, source="agent_retry_ocr") for item in parse_structured_text(text)]
+    return structured_json[:start] + replacement + structured_json[end:], {
+        "action": "self_correction",
+        "strategy": "suspicious_band",
+        "band": [y1, y2],
+        "replaced_elements": [start, end],
+        "new_elements": len(replacement),
+    }
+
+
+def reocr_with_strong_preprocessing(
+    context: PageContext,
+    structured_json: List[Dict[str, Any]],
+    critique: Dict[str, Any],
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Re-OCR the whole page after every preprocessing step, upscaled.
+
+    Returns:
+        (new structured_json, action)
+    """
+    image_path = context.original_path
+    original = context.original
+    # Own directory: the page's regular processed file keeps its content
+    _, processed = preprocess_image_array(
+        image_path,
+        output_dir=Path(image_path).parent / "retry",
+        image=original.image if original is not None else None,
+        steps=OPTIONAL_STEPS,
+    )
+    upscaled = cv2.resize(processed, None, fx=RETRY_UPSCALE, fy=RETRY_UPSCALE, interpolation=cv2.INTER_CUBIC)
+    retry_path = str(Path(image_path).parent / "retry" / f"{Path(image_path).stem}_strong.png")
+    cv2.imwrite(retry_path, upscaled)
+
+    text, _ = get_qwen_vl_ocr().extract_text_from_image(
+        retry_path,
+        image_width=upscaled.shape[1],
+        image_height=upscaled.shape[0],
+    )
+    if not (text or "").strip():
+        raise ValueError("re-OCR returned no text")
+    return [dict(item, source="agent_retry_ocr") for item in parse_structured_text(text)], {
+        "action": "self_correction",
+        "strategy": "strong_preprocessing",
+        "steps": list(OPTIONAL_STEPS),
+        "upscale": RETRY_UPSCALE,
+    }
+
+
 def _symbol_noise_ratio(value: str) -> float:
     if not value:
         return 0.0
@@ -1,19 +1,39 @@
+import io
 import json
 import logging
+import os
 import tempfile
-from dataclasses import asdict
+from dataclasses import fields, is_dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Iterator, List, Optional
+from urllib.parse import quote
 
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from app.agent import AgenticOCRAgent
+from app.agent.audit import AuditLog
+from app.agent.state import AgentState
+from app.services.region_table import RegionTable
+from app.services.storage import DOCX_MEDIA_TYPE, get_storage, output_key, report_key
+from app.services.retention import create_scratch_dir, remove_scratch_dir
 from app.utils.file_manager import FileManager
 
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Confidence reports up to this size are also inlined in a response header;
+# larger ones are only linked (X-Agent-Confidence-Report-Url), since proxies
+# commonly reject responses with more than ~8 KB of headers
+AGENT_REPORT_HEADER_MAX_BYTES = int(os.getenv("AGENT_REPORT_HEADER_MAX_BYTES", "2048"))
+
 
 @router.post("/agent/convert")
 async def agent_convert_to_word(
@@ -27,6 +47,7 @@ async def agent_convert_to_word(
     file_manager = FileManager()
     uploads_dir = file_manager.get_uploads_dir()
     outputs_dir = file_manager.get_outputs_dir()
+    scratch_dir = create_scratch_dir(uploads_dir, prefix="agent")
     saved_paths: List[str] = []
 
     try:
@@ -36,7 +57,7 @@ async def agent_convert_to_word(
                 delete=False,
                 suffix=suffix,
                 prefix=f"agent_{index}_",
-                dir=uploads_dir,
+                dir=scratch_dir,
             )
             content = await image.read()
             temp_file.write(content)
@@ -56,15 +77,21 @@ async def agent_convert_to_word(
         if not state.final_document_path or not Path(state.final_document_path).exists():
             raise HTTPException(status_code=500, detail="Agent did not generate a Word document")
 
+        # Publish to shared storage so any replica can serve /api/download
+        document_name = Path(state.final_document_path).name
+        try:
+            get_storage().put_file(output_key(document_name), Path(state.final_document_path), DOCX_MEDIA_TYPE)
+        except Exception as exc:
+            logger.warning("Publishing %s to storage failed: %s", document_name, exc)
+
         response_headers = {
-            "X-Agent-Session-Id": state.session_id,
-            "X-Agent-Review-Required": str(state.human_review_required).lower(),
-            "X-Agent-Confidence-Report": json.dumps(state.confidence_report),
+            "X-Document-Filename": document_name,
+            **_report_headers(state),
         }
         return FileResponse(
             state.final_document_path,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename=Path(state.final_document_path).name,
+            media_type=DOCX_MEDIA_TYPE,
+            filename=document_name,
             headers=response_headers,
         )
     except HTTPException:
@@ -72,6 +99,8 @@ async def agent_convert_to_word(
     except Exception as exc:
         logger.exception("Agentic conversion failed")
         raise HTTPException(status_code=500, detail=f"Agentic conversion failed: {str(exc)}")
+    finally:
+        remove_scratch_dir(scratch_dir)
 
 
 @router.post("/agent/analyze")
@@ -86,6 +115,7 @@ async def agent_analyze_only(
     file_manager = FileManager()
     uploads_dir = file_manager.get_uploads_dir()
     outputs_dir = file_manager.get_outputs_dir()
+    scratch_dir = create_scratch_dir(uploads_dir, prefix="agent")
     saved_paths: List[str] = []
 
     try:
@@ -95,7 +125,7 @@ async def agent_analyze_only(
                 delete=False,
                 suffix=suffix,
                 prefix=f"agent_analysis_{index}_",
-                dir=uploads_dir,
+                dir=scratch_dir,
             )
             content = await image.read()
             temp_file.write(content)
@@ -111,18 +141,109 @@ async def agent_analyze_only(
             user_goal=user_goal,
             session_id=session_id,
         )
-        payload = _json_safe(asdict(state))
-        return JSONResponse(content=payload)
+        return StreamingResponse(
+            _stream_state(state),
+            media_type="application/json",
+            headers=_report_headers(state),
+        )
     except Exception as exc:
         logger.exception("Agentic analysis failed")
         raise HTTPException(status_code=500, detail=f"Agentic analysis failed: {str(exc)}")
-
-
-def _json_safe(value):
+    finally:
+        remove_scratch_dir(scratch_dir)
+
+
+@router.get("/agent/reports/{session_id}")
+async def agent_report(session_id: str):
+    """Latest confidence report of an agent session."""
+    storage = get_storage()
+    key = report_key(session_id)
+    stored = await run_in_threadpool(storage.stat, key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    content = await run_in_threadpool(lambda: b"".join(storage.open_range(key)))
+    headers = {"Cache-Control": "private, no-cache"}
+    if stored.etag:
+        headers["ETag"] = f'"{stored.etag}"'
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def _report_headers(state: AgentState) -> dict:
+    """
+    Publish the confidence report and summarize it in response headers.
+
+    The full report is fetched from X-Agent-Confidence-Report-Url; it is
+    inlined in X-Agent-Confidence-Report only while it stays small.
+    """
+    report = state.confidence_report
+    headers = {
+        "X-Agent-Session-Id": state.session_id,
+        "X-Agent-Review-Required": str(state.human_review_required).lower(),
+        "X-Agent-Overall-Status": str(report.get("overall_status", "")),
+        "X-Agent-Pages-Requiring-Review": str(report.get("pages_requiring_review", 0)),
+    }
+    try:
+        get_storage().put_stream(report_key(state.session_id), io.BytesIO(_dumps(report)), "application/json")
+        headers["X-Agent-Confidence-Report-Url"] = f"/api/agent/reports/{quote(state.session_id, safe='')}"
+    except Exception as exc:
+        logger.warning("Publishing the confidence report of %s failed: %s", state.session_id, exc)
+
+    # Headers are latin-1: keep the ASCII-escaped encoding here
+    inline = json.dumps(report, default=_json_default)
+    if len(inline) <= AGENT_REPORT_HEADER_MAX_BYTES:
+        headers["X-Agent-Confidence-Report"] = inline
+    return headers
+
+
+def _stream_state(state: AgentState) -> Iterator[bytes]:
+    """The analysis response, encoded field by field and page by page."""
+    for chunk in _encode_fields(state):
+        if isinstance(chunk, list):
+            # page_results: one chunk per page
+            yield b"["
+            for index, page in enumerate(chunk):
+                yield (b"," if index else b"") + b"".join(_encode_fields(page))
+            yield b"]"
+        else:
+            yield chunk
+
+
+def _encode_fields(value: Any) -> Iterator[Any]:
+    """
+    A dataclass as JSON object pieces. Region tables are encoded straight
+    from their columns (RegionTable.to_json); lists of dataclasses are
+    yielded as-is for the caller to encode element by element.
+    """
+    yield b"{"
+    for position, item in enumerate(fields(value)):
+        field_value = getattr(value, item.name)
+        yield (b"," if position else b"") + _dumps(item.name) + b":"
+        if isinstance(field_value, RegionTable):
+            yield field_value.to_json().encode("utf-8")
+        elif isinstance(field_value, list) and field_value and is_dataclass(field_value[0]):
+            yield field_value
+        else:
+            yield _dumps(field_value)
+    yield b"}"
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _json_default(value: Any) -> Any:
     if isinstance(value, Path):
         return str(value)
-    if isinstance(value, dict):
-        return {key: _json_safe(item) for key, item in value.items()}
-    if isinstance(value, list):
-        return [_json_safe(item) for item in value]
-    return value
+    if isinstance(value, (RegionTable, AuditLog)):
+        return value.to_list()
+    if is_dataclass(value):
+        # Shallow: nested values come back through this hook
+        return {item.name: getattr(value, item.name) for item in fields(value)}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "tolist"):
+        # numpy scalars and arrays
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -11,11 +11,17 @@ import os
 import logging
 from typing import Optional, List, Dict
 import traceback
+import uuid
 import cv2
 import numpy as np
 
 from app.services.preprocessing import preprocess_image
 from app.services.layout import detect_layout
+from app.services.region_table import RegionTable
+from app.services.diagram_store import get_diagram_store
+from app.services.storage import DOCX_MEDIA_TYPE, get_storage, output_key
+from app.services.retention import create_scratch_dir, remove_scratch_dir
+from app.services.page_analysis import PageAnalysis, get_page_analysis, release_page_analysis
 from app.services.text_ocr import TextOCR
 from app.services.math_ocr import MathOCR
 from app.services.gemini_ocr import get_gemini_cleanup
@@ -119,7 +125,8 @@ async def process_single_image(
     image_index: int,
     total_images: int,
     uploads_dir: Path,
-    outputs_dir: Path
+    outputs_dir: Path,
+    document_id: Optional[str] = None
 ) -> Optional[dict]:
     """
     Process a single image through the full pipeline.
@@ -130,11 +137,14 @@ async def process_single_image(
         total_images: Total number of images
         uploads_dir: Directory for uploads
         outputs_dir: Directory for outputs
+        document_id: Document owning the diagram crops (see diagram_store.py)
         
     Returns:
         Dictionary with structured_json and diagram_dir, or None if processing failed
     """
     temp_files = []
+    # Per-request scratch directory: upload + preprocessed image, removed as a whole
+    scratch_dir = create_scratch_dir(uploads_dir, prefix=f"img{image_index}")
     
     try:
         logger.info(f"📸 Processing image {image_index + 1}/{total_images}: {image_file.filename}")
@@ -146,7 +156,7 @@ async def process_single_image(
         temp_input = tempfile.NamedTemporaryFile(
             delete=False, 
             suffix=Path(image_file.filename or 'image').suffix or '.jpg', 
-            dir=uploads_dir
+            dir=scratch_dir
         )
         # Read file content
         content = await image_file.read()
@@ -164,7 +174,7 @@ async def process_single_image(
         # Preprocess image
         logger.info(f"   🔧 Step 1/5: Preprocessing image...")
         try:
-            processed_image_path = preprocess_image(input_path)
+            processed_image_path = preprocess_image(input_path, output_dir=scratch_dir)
             temp_files.append(processed_image_path)
             logger.info(f"   ✅ Image preprocessed: {Path(processed_image_path).name}")
         except Exception as e:
@@ -173,14 +183,18 @@ async def process_single_image(
             # CRITICAL: Use original image if preprocessing fails - NEVER return None
             processed_image_path = input_path
         
+        # One shared analysis per page: layout and diagram extraction reuse
+        # its grayscale, binarization, edges and dilations
+        page = get_page_analysis(processed_image_path)
+        
         # Detect layout
         logger.info(f"   📐 Step 2/5: Detecting layout regions...")
-        layout_regions = []
+        layout_regions = RegionTable()
         detection_attempted = False
         detection_succeeded = False
         
         try:
-            layout_regions = detect_layout(processed_image_path)
+            layout_regions = detect_layout(processed_image_path, page=page)
             detection_attempted = True
             if layout_regions:
                 detection_succeeded = True
@@ -191,10 +205,7 @@ async def process_single_image(
                 # CRITICAL: Create a single region covering the entire image
                 # NEVER exit - always create full-image region
                 h, w = processed_image.shape[:2]
-                layout_regions = [{
-                    'type': 'paragraph',
-                    'bbox': [0, 0, w, h]
-                }]
+                layout_regions = RegionTable.full_page(w, h)
                 logger.info(f"   ✅ Created full-image region for OCR (detection found 0 regions)")
         except Exception as e:
             logger.warning(f"   ❌ Image {image_index + 1} layout detection failed: {e}")
@@ -202,10 +213,7 @@ async def process_single_image(
             # CRITICAL: Even if detection crashes, create full-image region
             # NEVER exit - always create full-image region
             h, w = processed_image.shape[:2]
-            layout_regions = [{
-                'type': 'paragraph',
-                'bbox': [0, 0, w, h]
-            }]
+            layout_regions = RegionTable.full_page(w, h)
             logger.info(f"   ✅ Created full-image region for OCR (detection crashed)")
         
         # CRITICAL: Ensure we ALWAYS have at least one region
@@ -213,17 +221,14 @@ async def process_single_image(
         if not layout_regions:
             logger.error(f"   🚨 CRITICAL: layout_regions is empty - creating full-image region")
             h, w = processed_image.shape[:2]
-            layout_regions = [{
-                'type': 'paragraph',
-                'bbox': [0, 0, w, h]
-            }]
+            layout_regions = RegionTable.full_page(w, h)
         
         # THREE-LAYER SYSTEM IMPLEMENTATION
         logger.info("=" * 60)
         logger.info(f"   🏗️  THREE-LAYER EXTRACTION SYSTEM")
         logger.info("=" * 60)
         
-        processed_image = cv2.imread(processed_image_path)
+        processed_image = page.image if page is not None else None
         if processed_image is None:
             logger.error(f"Image {image_index + 1}: Failed to load processed image")
             logger.info(f"   🔄 FALLBACK: Attempting to load original image...")
@@ -336,6 +341,22 @@ async def process_single_image(
         # ============================================================
         logger.info(f"   📄 Creating document structure...")
         
+        # ============================================================
+        # DIAGRAM LOCALIZATION - One contour pass per page
+        # Qwen markers snap to DiagramExtractor contours (tight crops);
+        # contours no marker claimed are the fallback for missed diagrams
+        # ============================================================
+        from app.services.diagram_extractor import diagram_extractor
+        from app.services.diagram_localization import localize_diagrams
+        
+        if page is None:
+            page = PageAnalysis(processed_image)
+        diagram_store = get_diagram_store(outputs_dir)
+        diagram_owner = document_id or f"{base_filename}_{uuid.uuid4().hex}"
+        logger.info(f"   🎨 Running dedicated diagram extraction...")
+        detected_diagrams = diagram_extractor.extract_diagrams(str(processed_image_path), page=page)
+        marker_boxes, unclaimed_diagrams = localize_diagrams(diagram_regions, page, detected_diagrams)
+        
         if final_text and final_text.strip():
             # Parse the text into structured elements
             lines = final_text.split('\n')
@@ -352,14 +373,13 @@ async def process_single_image(
                     logger.info(f"   🔍 Found diagram marker: {line_stripped}")
                     
                     if diagram_idx < len(diagram_regions):
-                        region = diagram_regions[diagram_idx]
-                        bbox = region.get('estimated_bbox')
+                        bbox = marker_boxes[diagram_idx]
                         logger.info(f"   📊 Processing diagram {diagram_idx}: bbox={bbox}")
                         
-                        if bbox and bbox.get('x2') and bbox.get('y2'):
-                            # Crop diagram region from original image
+                        if bbox:
+                            # Crop localized diagram region from original image
                             try:
-                                x1, y1, x2, y2 = bbox['x1'], bbox['y1'], bbox['x2'], bbox['y2']
+                                x1, y1, x2, y2 = bbox
                                 h, w = processed_image.shape[:2]
                                 # Ensure bounds are valid
                                 x1 = max(0, min(x1, w))
@@ -371,9 +391,8 @@ async def process_single_image(
                                 
                                 if x2 > x1 and y2 > y1:
                                     cropped_diagram = processed_image[y1:y2, x1:x2]
-                                    diagram_filename = f"diagram_{image_index}_{diagram_idx}.png"
-                                    diagram_path = outputs_dir / diagram_filename
-                                    cv2.imwrite(str(diagram_path), cropped_diagram)
+                                    # Content-addressed: identical crops share one file
+                                    diagram_path = diagram_store.put(cropped_diagram, owner=diagram_owner)
                                     
                                     structured_json.append({
                                         'type': 'diagram',
@@ -449,18 +468,13 @@ async def process_single_image(
         # ============================================================
         # DIAGRAM FALLBACK: Check if specialized diagram extractor found diagrams that Qwen missed
         # ============================================================
-        from app.services.diagram_extractor import diagram_extractor
-        
         qwen_diagram_count = sum(1 for e in structured_json if e.get('type') == 'diagram')
         
-        # Run dedicated diagram extraction
-        logger.info(f"   🎨 Running dedicated diagram extraction...")
-        detected_diagrams = diagram_extractor.extract_diagrams(str(processed_image_path))
-        
-        if qwen_diagram_count == 0 and detected_diagrams:
-            logger.info(f"   ⚠️  Qwen missed {len(detected_diagrams)} diagrams detected by dedicated extractor - inserting as fallback")
+        # Contours were computed once above; only those no marker claimed remain
+        if qwen_diagram_count == 0 and unclaimed_diagrams:
+            logger.info(f"   ⚠️  Qwen missed {len(unclaimed_diagrams)} diagrams detected by dedicated extractor - inserting as fallback")
             
-            for i, region in enumerate(detected_diagrams):
+            for i, region in enumerate(unclaimed_diagrams):
                 try:
                     bbox = region.get('bbox') # [x1, y1, x2, y2]
                     if bbox and len(bbox) == 4:
@@ -475,9 +489,7 @@ async def process_single_image(
                         
                         if x2 > x1 and y2 > y1:
                             cropped_diagram = processed_image[y1:y2, x1:x2]
-                            diagram_filename = f"diagram_extracted_{image_index}_{i}.png"
-                            diagram_path = outputs_dir / diagram_filename
-                            cv2.imwrite(str(diagram_path), cropped_diagram)
+                            diagram_path = diagram_store.put(cropped_diagram, owner=diagram_owner)
                             
                             # Calculate insertion position based on vertical location
                             # This places the diagram roughly where it appears in the original image
@@ -534,13 +546,20 @@ async def process_single_image(
             'image_index': image_index
         }
     finally:
+        # Persist this page's diagram references once, not per crop
+        try:
+            get_diagram_store(outputs_dir).flush()
+        except Exception as e:
+            logger.warning(f"Saving diagram references failed: {e}")
         # Clean up temp files
         for temp_file in temp_files:
+            release_page_analysis(temp_file)
             try:
                 if os.path.exists(temp_file):
                     os.unlink(temp_file)
             except Exception:
                 pass
+        remove_scratch_dir(scratch_dir)
 
 
 @router.post("/convert")
@@ -571,6 +590,8 @@ async def convert_image_to_word(images: List[UploadFile] = File(...)):
     
     all_structured_json = []
     outputs_dir = None
+    # Owner of this document's diagram crops; released once the .docx embeds them
+    document_id = uuid.uuid4().hex
     
     try:
         logger.info("=" * 60)
@@ -594,7 +615,8 @@ async def convert_image_to_word(images: List[UploadFile] = File(...)):
                     idx,
                     len(images),
                     uploads_dir,
-                    outputs_dir
+                    outputs_dir,
+                    document_id=document_id
                 )
                 
                 if result:
@@ -645,7 +667,8 @@ async def convert_image_to_word(images: List[UploadFile] = File(...)):
         logger.info("📝 Step 5/5: Generating merged Word document...")
         try:
             base_filename = f"merged_{len(images)}_images"
-            output_filename = f"{base_filename}_converted.docx"
+            # Unique per request: concurrent conversions and replicas never collide
+            output_filename = f"{base_filename}_{document_id[:12]}_converted.docx"
             output_path = outputs_dir / output_filename
             
             docx_generator = DOCXGenerator()
@@ -675,12 +698,22 @@ async def convert_image_to_word(images: List[UploadFile] = File(...)):
                 detail="Word document was not generated successfully"
             )
         
+        # Publish to shared storage so any replica can serve /api/download
+        try:
+            get_storage().put_file(output_key(output_path.name), output_path, DOCX_MEDIA_TYPE)
+        except Exception as e:
+            logger.warning(f"Publishing {output_path.name} to storage failed: {e}")
+        
+        download_name = f"{base_filename}_converted.docx"
         logger.info(f"Conversion complete. Returning file: {output_path.name}")
         return FileResponse(
             str(output_path),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            filename=output_path.name,
-            headers={"Content-Disposition": f'attachment; filename="{output_path.name}"'}
+            media_type=DOCX_MEDIA_TYPE,
+            filename=download_name,
+            headers={
+                "Content-Disposition": f'attachment; filename="{download_name}"',
+                "X-Document-Filename": output_path.name,
+            }
         )
         
     except HTTPException:
@@ -692,3 +725,9 @@ async def convert_image_to_word(images: List[UploadFile] = File(...)):
             status_code=500,
             detail=f"Conversion failed: {str(e)}"
         )
+    finally:
+        # Crops are embedded in the .docx; drop this document's references
+        try:
+            get_diagram_store(outputs_dir).release(document_id)
+        except Exception as e:
+            logger.warning(f"Diagram cleanup failed: {e}")
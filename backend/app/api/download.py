@@ -1,23 +1,209 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
-from pathlib import Path
+"""
+Download endpoint for generated documents.
+
+Documents are served from the configured storage backend
+(services/storage.py) with:
+- A strong ETag (SHA-256 of the content) and Last-Modified; matching
+  If-None-Match / If-Modified-Since requests get 304 Not Modified
+- Single byte ranges (206 Partial Content), honouring If-Range so a resumed
+  download never splices two versions of a file
+- Zero-copy sendfile for local files when the ASGI server offers the
+  http.response.zerocopy extension; chunked reads otherwise
+- Cache-Control (DOWNLOAD_CACHE_CONTROL, default "private, no-cache":
+  browsers keep the file but revalidate, which costs a 304)
+"""
 import os
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from typing import Optional
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 
-from app.utils.file_manager import FileManager
+from app.services.storage import get_storage, output_key
+
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, no-cache")
 
 router = APIRouter()
-file_manager = FileManager()
-
-@router.get("/download/{filename}")
-async def download_docx(filename: str):
-    outputs_dir = file_manager.get_outputs_dir()
-    file_path = outputs_dir / filename
-    
-    if not file_path.exists():
+
+
+class FileRangeResponse(Response):
+    """
+    Bytes [start, end] of a local file, via sendfile when the server can.
+
+    Starlette's FileResponse always reads the file through a thread in
+    64 KiB chunks and cannot serve a range.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: dict,
+                 media_type: str, send_body: bool = True):
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.send_body = send_body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            with open(self.path, 'rb') as file:
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": file,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode='rb') as file:
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank under us: end the response anyway
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+@router.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_docx(filename: str, request: Request):
+    """
+    Serve a generated document from the configured storage backend.
+
+    Works on any replica (see services/storage.py). Single byte ranges
+    (Range: bytes=start-end) are answered with 206 Partial Content.
+    """
+    storage = get_storage()
+    key = output_key(filename)
+    # Object stores answer over the network, and a local file is hashed on
+    # its first download: keep the event loop free
+    stored = await run_in_threadpool(storage.stat, key)
+
+    if stored is None:
         raise HTTPException(status_code=404, detail="File not found")
-    
-    return FileResponse(
-        str(file_path),
-        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        filename=filename
+
+    etag = f'"{stored.etag}"' if stored.etag else None
+    validators = {"Last-Modified": formatdate(stored.modified, usegmt=True), "Cache-Control": DOWNLOAD_CACHE_CONTROL}
+    if etag:
+        validators["ETag"] = etag
+
+    if _not_modified(request, etag, stored.modified):
+        return Response(status_code=304, headers=validators)
+
+    headers = {
+        **validators,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{stored.key.rsplit("/", 1)[-1]}"',
+    }
+
+    byte_range = None
+    if _if_range_matches(request.headers.get("if-range"), etag, stored.modified):
+        byte_range = _parse_range(request.headers.get("range"), stored.size)
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**validators, "Content-Range": f"bytes */{stored.size}"})
+
+    if byte_range is None:
+        start, end, status = 0, stored.size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stored.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    send_body = request.method != "HEAD"
+
+    if stored.local_path is not None:
+        # Local/shared volume: sendfile straight from the page cache
+        return FileRangeResponse(
+            str(stored.local_path), start, end, status, headers,
+            media_type=stored.content_type, send_body=send_body
+        )
+    if not send_body:
+        return Response(status_code=status, headers=headers, media_type=stored.content_type)
+    return StreamingResponse(
+        storage.open_range(key, start, end),
+        status_code=status,
+        media_type=stored.content_type,
+        headers=headers
     )
+
+
+def _not_modified(request: Request, etag: Optional[str], modified: float) -> bool:
+    """
+    Whether the client's cached copy is current (RFC 9110 section 13.2.2).
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted
+    without it.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        if etag is None:
+            return False
+        # Weak comparison: W/"x" matches "x"
+        candidates = {tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip() for tag in if_none_match.split(",")}
+        return etag in candidates
+
+    since = _parse_http_date(request.headers.get("if-modified-since"))
+    # HTTP dates have one-second resolution
+    return since is not None and int(modified) <= since
+
+
+def _if_range_matches(if_range: Optional[str], etag: Optional[str], modified: float) -> bool:
+    """
+    Whether a Range request may be honoured: no If-Range, or If-Range still
+    names the current version (strong comparison, as RFC 9110 requires).
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag is not None and if_range == etag
+    since = _parse_http_date(if_range)
+    return since is not None and int(modified) == since
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[int]:
+    parsed = parsedate_tz(value) if value else None
+    return mktime_tz(parsed) if parsed else None
+
+
+def _parse_range(header: Optional[str], size: int):
+    """
+    Parse a single-range Range header.
+
+    Returns:
+        None (no/unsupported range: send everything), (start, end) inclusive,
+        or "invalid" if the range cannot be satisfied
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
@@ -118,12 +118,29 @@ async def startup_event():
     logger.info("=" * 60)
     logger.info("NOTE: ML models load lazily on first request to save memory")
     logger.info("=" * 60)
+    
+    # Background retention sweeps for uploads/, outputs/ and preprocessing temp files
+    from app.services.retention import start_retention_task
+    app.state.retention_task = start_retention_task()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks."""
+    task = getattr(app.state, "retention_task", None)
+    if task is not None:
+        task.cancel()
 
 @app.get("/")
 async def root():
     logger.info("Health check endpoint accessed")
     return {"status": "ok", "message": "Handwritten Notes OCR API"}
 
+@app.get("/metrics/retention")
+async def retention_metrics():
+    """Bytes and files reclaimed by retention sweeps and scratch cleanup."""
+    from app.services.retention import get_retention_metrics
+    return get_retention_metrics()
+
 if __name__ == "__main__":
     logger.info("Starting server with uvicorn...")
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
@@ -0,0 +1,225 @@
+"""
+In-process micro-batching for local OCR models.
+
+Concurrent conversions each submit small crops (text lines, regions,
+equations). A MicroBatcher collects crops from ALL in-flight requests,
+forms a batch when either the size limit or the latency deadline is hit,
+runs ONE forward pass, and hands each result back to its waiting caller.
+
+CONFIGURATION (environment variables):
+- OCR_BATCH_MAX_SIZE: maximum crops per forward pass (default 16)
+- OCR_BATCH_MAX_LATENCY_MS: maximum time the first crop of a batch waits
+  for companions before the batch is flushed (default 20ms). This is the
+  tail-latency bound added by batching.
+"""
+import os
+import queue
+import threading
+import time
+import asyncio
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("OCR_BATCH_MAX_SIZE", "16"))
+DEFAULT_MAX_LATENCY_MS = float(os.getenv("OCR_BATCH_MAX_LATENCY_MS", "20"))
+
+
+class MicroBatcher:
+    """
+    Queue crops from many callers and run them through a batch function.
+
+    The batch function receives a list of items and MUST return a list of
+    results of the same length and order. If it raises, every caller in
+    that batch receives the exception.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_latency_ms: float = DEFAULT_MAX_LATENCY_MS
+    ):
+        """
+        Initialize micro-batcher.
+
+        Args:
+            name: Name used in logs and for the worker thread
+            batch_fn: Function running one forward pass over a list of items
+            max_batch_size: Maximum items per batch
+            max_latency_ms: Maximum wait for a batch to fill up
+        """
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(
+            target=self._run,
+            name=f"microbatch-{name}",
+            daemon=True
+        )
+        self._worker.start()
+
+        # Counters for throughput monitoring
+        self.batches_run = 0
+        self.items_processed = 0
+
+        logger.info(
+            f"🧺 Micro-batcher '{name}' started "
+            f"(max_batch_size={self.max_batch_size}, max_latency={max_latency_ms}ms)"
+        )
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queue one item for batched inference.
+
+        Returns:
+            Future resolving to the item's result
+        """
+        if self._stopped.is_set():
+            raise RuntimeError(f"Micro-batcher '{self.name}' is stopped")
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def infer(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking single-item inference through the shared batch."""
+        return self.submit(item).result(timeout=timeout)
+
+    def infer_many(self, items: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """
+        Submit several items at once (e.g. all lines of one page).
+
+        Items from one caller may be split across batches or mixed with
+        other callers' items; results are returned in input order.
+        """
+        futures = [self.submit(item) for item in items]
+        return [future.result(timeout=timeout) for future in futures]
+
+    async def infer_async(self, item: Any) -> Any:
+        """Await a batched result without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(item))
+
+    def stop(self) -> None:
+        """Stop the worker after draining queued items."""
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return throughput counters."""
+        return {
+            "name": self.name,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "avg_batch_size": (self.items_processed / self.batches_run) if self.batches_run else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self) -> None:
+        """Worker loop: collect a batch until full or deadline, then run it."""
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            deadline = time.monotonic() + self.max_latency
+            shutdown = False
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    shutdown = True
+                    break
+                batch.append(entry)
+
+            self._dispatch(batch)
+            if shutdown:
+                break
+
+        # Drain anything left after stop() so no caller waits forever
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not None:
+                self._dispatch([entry])
+
+    def _dispatch(self, batch: List) -> None:
+        """Run one forward pass and resolve every caller's future."""
+        # Skip callers that gave up (cancelled futures)
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        items = [item for item, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if results is None or len(results) != len(items):
+                raise RuntimeError(
+                    f"Batch function for '{self.name}' returned "
+                    f"{0 if results is None else len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            logger.warning(f"⚠️  Micro-batch '{self.name}' failed ({len(items)} items): {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_processed += len(items)
+        logger.debug(f"   🧺 '{self.name}' ran batch of {len(items)}")
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+# Global registry of shared batchers (one per model)
+_batchers: Dict[str, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(
+    name: str,
+    batch_fn: Callable[[List[Any]], List[Any]],
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    max_latency_ms: float = DEFAULT_MAX_LATENCY_MS
+) -> MicroBatcher:
+    """
+    Get or create the process-wide batcher for a model.
+
+    Args:
+        name: Unique model name (e.g. 'paddle_crnn_lines')
+        batch_fn: Batch function (only used on first creation)
+        max_batch_size: Maximum items per batch
+        max_latency_ms: Latency deadline in milliseconds
+
+    Returns:
+        Shared MicroBatcher instance
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(name)
+        if batcher is None:
+            batcher = MicroBatcher(name, batch_fn, max_batch_size, max_latency_ms)
+            _batchers[name] = batcher
+        return batcher
+
+
+def batcher_stats() -> List[Dict[str, Any]]:
+    """Return throughput counters for all shared batchers."""
+    with _batchers_lock:
+        return [batcher.stats() for batcher in _batchers.values()]
@@ -0,0 +1,150 @@
+"""
+Overlap merging for candidate bounding boxes.
+
+Merging used to compare every candidate against every merged box in nested
+Python loops and grew boxes in place without re-checking earlier ones, so
+it was O(n^2) and the result depended on the input order.
+
+This engine merges to a FIXED POINT instead:
+1. Candidate pairs come from a sort-and-sweep along one axis: boxes sorted
+   by x1 (or y1), each box paired only with the boxes whose start falls
+   inside its extent (np.searchsorted, vectorized). The axis producing
+   fewer pairs is chosen per round, so stacked text lines or side-by-side
+   columns do not degenerate into all-pairs.
+2. The overlap test runs vectorized over all candidate pairs.
+3. Union-find groups transitively overlapping boxes; each group becomes
+   its enclosing box.
+4. Rounds repeat until no group changes: a grown box that now overlaps
+   another box is merged too, whatever the input order was.
+
+Each round is O(n log n + k) for k overlapping pairs along the sweep axis.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Boxes merge if their intersection exceeds this fraction of the smaller box
+DEFAULT_MIN_OVERLAP = 0.5
+
+
+def merge_overlapping_boxes(
+    boxes: np.ndarray,
+    min_overlap: float = DEFAULT_MIN_OVERLAP,
+    max_rounds: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge boxes whose intersection exceeds min_overlap of the smaller box,
+    repeating until no two result boxes qualify.
+
+    Args:
+        boxes: (n, 4) array of x1, y1, x2, y2
+        min_overlap: Intersection fraction of the smaller box that triggers a
+            merge (0 merges any positive-area overlap)
+        max_rounds: Optional cap on merge rounds (default: until fixed point)
+
+    Returns:
+        (merged, labels): merged (m, 4) boxes, sorted by area (largest
+        first), and for each input box the index of the merged box that
+        contains it
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    n = len(boxes)
+    labels = np.arange(n)
+    if n == 0:
+        return boxes.copy(), labels
+
+    current = boxes
+    rounds = 0
+    while max_rounds is None or rounds < max_rounds:
+        rounds += 1
+        i, j = _overlapping_pairs(current, min_overlap)
+        if len(i) == 0:
+            break
+        group = _connected_groups(len(current), i, j)
+        current = _group_bounds(current, group)
+        labels = group[labels]
+
+    # Largest first, matching the previous merge order
+    area = (current[:, 2] - current[:, 0]) * (current[:, 3] - current[:, 1])
+    order = np.argsort(-area, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return current[order], rank[labels]
+
+
+def _overlapping_pairs(boxes: np.ndarray, min_overlap: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs (i < j in sweep order) of boxes that should merge."""
+    axis = _sweep_axis(boxes)
+    start, end = boxes[:, axis], boxes[:, axis + 2]
+    order = np.argsort(start, kind='stable')
+    sorted_start = start[order]
+
+    # Boxes after i in sweep order that start before i ends
+    stop = np.searchsorted(sorted_start, end[order], side='left')
+    counts = np.maximum(stop - np.arange(len(order)) - 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    first = np.repeat(np.arange(len(order)), counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    i = order[first]
+    j = order[first + 1 + offset]
+
+    a, b = boxes[i], boxes[j]
+    inter_w = np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0])
+    inter_h = np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1])
+    positive = (inter_w > 0) & (inter_h > 0)
+    inter = np.where(positive, inter_w * inter_h, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    merge = positive & (inter > min_overlap * np.minimum(area_a, area_b))
+    return i[merge], j[merge]
+
+
+def _sweep_axis(boxes: np.ndarray) -> int:
+    """0 to sweep along x, 1 along y: whichever yields fewer candidate pairs."""
+    pairs = []
+    for axis in (0, 1):
+        sorted_start = np.sort(boxes[:, axis])
+        stop = np.searchsorted(sorted_start, np.sort(boxes[:, axis + 2]), side='left')
+        pairs.append(int(stop.sum()))
+    return 0 if pairs[0] <= pairs[1] else 1
+
+
+def _connected_groups(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """
+    Union-find over pairs.
+
+    Returns:
+        Dense group index (0..groups-1) per node
+    """
+    parent = np.arange(n)
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    roots = np.array([find(x) for x in range(n)])
+    _, group = np.unique(roots, return_inverse=True)
+    return group
+
+
+def _group_bounds(boxes: np.ndarray, group: np.ndarray) -> np.ndarray:
+    """Enclosing box of each group."""
+    count = int(group.max()) + 1
+    merged = np.empty((count, 4), dtype=np.int64)
+    merged[:, :2] = np.iinfo(np.int64).max
+    merged[:, 2:] = np.iinfo(np.int64).min
+    np.minimum.at(merged[:, 0], group, boxes[:, 0])
+    np.minimum.at(merged[:, 1], group, boxes[:, 1])
+    np.maximum.at(merged[:, 2], group, boxes[:, 2])
+    np.maximum.at(merged[:, 3], group, boxes[:, 3])
+    return merged
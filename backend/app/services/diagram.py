@@ -10,6 +10,8 @@ import tempfile
 import os
 from PIL import Image
 
+from app.services.diagram_vectorizer import get_diagram_vectorizer, potrace_available
+
 
 class DiagramExtractor:
     """
@@ -27,7 +29,7 @@ class DiagramExtractor:
         self.output_dir = output_dir or Path(tempfile.gettempdir()) / "diagrams"
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Check if Potrace is available for SVG conversion
+        # Check if Potrace is available for SVG conversion (checked once per process)
         self.potrace_available = self._check_potrace()
         if self.potrace_available:
             print("Potrace available for SVG conversion")
@@ -58,6 +60,7 @@ class DiagramExtractor:
             }
         """
         extracted_diagrams = []
+        enhanced_images = []
         
         for idx, region in enumerate(diagram_regions):
             bbox = region.get('bbox', [])
@@ -80,7 +83,7 @@ class DiagramExtractor:
                 continue
             
             # Process and save diagram
-            diagram_info = self._process_diagram(
+            diagram_info, enhanced_image = self._process_diagram(
                 diagram_image,
                 bbox,
                 base_filename,
@@ -88,6 +91,16 @@ class DiagramExtractor:
             )
             
             extracted_diagrams.append(diagram_info)
+            enhanced_images.append((idx, enhanced_image))
+        
+        # Optional: Convert all diagrams to SVG concurrently (bounded Potrace pool)
+        if self.potrace_available and enhanced_images:
+            try:
+                svgs = get_diagram_vectorizer().vectorize_many([img for _, img in enhanced_images])
+                for diagram_info, (idx, _), svg in zip(extracted_diagrams, enhanced_images, svgs):
+                    diagram_info["svg_path"] = self._write_svg(svg, base_filename, idx)
+            except Exception as e:
+                print(f"SVG conversion failed: {e}")
         
         return extracted_diagrams
     
@@ -97,9 +110,10 @@ class DiagramExtractor:
         bbox: List[int],
         base_filename: str,
         index: int
-    ) -> Dict:
+    ) -> Tuple[Dict, np.ndarray]:
         """
-        Process a single diagram: save as image and optionally convert to SVG.
+        Process a single diagram: enhance and save as image.
+        SVG conversion runs afterwards for all diagrams at once.
         
         Args:
             diagram_image: Cropped diagram image
@@ -108,7 +122,7 @@ class DiagramExtractor:
             index: Diagram index
             
         Returns:
-            Dictionary with diagram information
+            Tuple of (diagram information, enhanced image)
         """
         x1, y1, x2, y2 = bbox
         
@@ -135,16 +149,7 @@ class DiagramExtractor:
             "height": y2 - y1
         }
         
-        # Optional: Convert to SVG using Potrace
-        if self.potrace_available:
-            try:
-                svg_path = self._convert_to_svg(enhanced_image, base_filename, index)
-                if svg_path and Path(svg_path).exists():
-                    result["svg_path"] = svg_path
-            except Exception as e:
-                print(f"SVG conversion failed for diagram {index}: {e}")
-        
-        return result
+        return result, enhanced_image
     
     def _enhance_diagram_image(self, image: np.ndarray) -> np.ndarray:
         """
@@ -189,6 +194,9 @@ class DiagramExtractor:
         """
         Convert diagram image to SVG using Potrace.
         
+        The bitmap is piped to Potrace in memory (see diagram_vectorizer.py);
+        identical crops are served from the SVG cache.
+        
         Args:
             image: Diagram image
             base_filename: Base filename
@@ -198,77 +206,25 @@ class DiagramExtractor:
             Path to SVG file or None if conversion failed
         """
         try:
-            import subprocess
-            
-            # Convert to grayscale if needed
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = image
-            
-            # Save as temporary PBM (Portable Bitmap) for Potrace
-            pbm_filename = f"{base_filename}_diagram_{index:03d}.pbm"
-            pbm_path = self.output_dir / pbm_filename
-            
-            # Convert to binary (black and white) for better vectorization
-            _, binary = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-            
-            # Save as PBM
-            # PBM format: P4 (binary PBM) - simpler for Potrace
-            h, w = binary.shape
-            with open(pbm_path, 'wb') as f:
-                # Write PBM header
-                f.write(f"P4\n{w} {h}\n".encode())
-                # Write binary data
-                # Invert (Potrace expects black on white)
-                inverted = 255 - binary
-                # Pack bits (PBM format uses 1 bit per pixel)
-                packed = np.packbits(inverted.flatten(), bitorder='big')
-                f.write(packed.tobytes())
-            
-            # Generate SVG filename
-            svg_filename = f"{base_filename}_diagram_{index:03d}.svg"
-            svg_path = self.output_dir / svg_filename
-            
-            # Run Potrace to convert PBM to SVG
-            # Potrace options:
-            # -s: SVG output
-            # --tight: Remove redundant points
-            # --flat: Suppress curve optimization (faster, simpler)
-            result = subprocess.run(
-                [
-                    'potrace',
-                    '-s',  # SVG output
-                    '--tight',  # Tighten paths
-                    '--flat',  # Flat curves (simpler)
-                    '-o', str(svg_path),  # Output file
-                    str(pbm_path)  # Input file
-                ],
-                capture_output=True,
-                text=True,
-                timeout=30  # 30 second timeout
-            )
-            
-            # Clean up temporary PBM file
-            if pbm_path.exists():
-                pbm_path.unlink()
-            
-            if result.returncode == 0 and svg_path.exists():
-                return str(svg_path)
-            else:
-                print(f"Potrace conversion failed: {result.stderr}")
-                return None
-                
-        except FileNotFoundError:
-            print("Potrace not found in PATH")
-            return None
-        except subprocess.TimeoutExpired:
-            print(f"Potrace conversion timed out for diagram {index}")
-            return None
+            svg = get_diagram_vectorizer().vectorize(image)
+            return self._write_svg(svg, base_filename, index)
         except Exception as e:
             print(f"SVG conversion error: {e}")
             return None
     
+    def _write_svg(self, svg: Optional[str], base_filename: str, index: int) -> Optional[str]:
+        """
+        Save SVG text next to the diagram PNG.
+        
+        Returns:
+            Path to SVG file or None if there is no SVG
+        """
+        if not svg:
+            return None
+        svg_path = self.output_dir / f"{base_filename}_diagram_{index:03d}.svg"
+        svg_path.write_text(svg, encoding='utf-8')
+        return str(svg_path)
+    
     def _check_potrace(self) -> bool:
         """
         Check if Potrace is available in the system.
@@ -276,19 +232,7 @@ class DiagramExtractor:
         Returns:
             True if Potrace is available, False otherwise
         """
-        try:
-            import subprocess
-            result = subprocess.run(
-                ['potrace', '--version'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            return result.returncode == 0
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            return False
-        except Exception:
-            return False
+        return potrace_available()
     
     def cleanup(self):
         """
@@ -9,6 +9,9 @@ from typing import List, Dict, Tuple, Optional
 import logging
 from pathlib import Path
 
+from app.services.box_merge import merge_overlapping_boxes
+from app.services.page_analysis import PageAnalysis, get_page_analysis
+
 logger = logging.getLogger(__name__)
 
 class DiagramExtractor:
@@ -19,49 +22,36 @@ class DiagramExtractor:
     def __init__(self):
         pass
         
-    def extract_diagrams(self, image_path: str) -> List[Dict]:
+    def extract_diagrams(self, image_path: str, page: Optional[PageAnalysis] = None) -> List[Dict]:
         """
         Detect diagram regions in the image.
         
         Args:
             image_path: Path to the image file
+            page: Shared PageAnalysis of the image (looked up by path if not given)
             
         Returns:
             List of diagram dictionaries with 'bbox' [x1, y1, x2, y2] and 'confidence'
         """
         logger.info(f"🎨 Starting dedicated diagram extraction for: {Path(image_path).name}")
         
-        # Load image
-        img = cv2.imread(image_path)
-        if img is None:
+        # Load image (gray, binary and edges are shared with layout detection)
+        if page is None:
+            page = get_page_analysis(image_path)
+        if page is None:
             logger.error(f"❌ Could not load image: {image_path}")
             return []
             
-        h, w = img.shape[:2]
+        h, w = page.shape
         
-        # 1. Preprocessing
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = img.copy()
-            
-        # 2. Edge Detection (Canny)
-        # Finds all structural edges (text strokes + diagram lines)
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        edges = cv2.Canny(blurred, 50, 150)
+        # 1. Preprocessing + 2. Edge Detection (Canny on 5x5 Gaussian blur)
+        # Finds all structural edges (text strokes + diagram lines); the
+        # dilation below reads them from the page
         
         # 3. Text Removal Mask
         # We want to remove things that look like lines of text
         # Adaptive threshold to find all ink
-        binary = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY_INV, 11, 2
-        )
-        
-        # Morphological operations to identify text lines
-        # Long horizontal kernel to connect characters into lines
-        kernel_text = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 3))
-        text_lines = cv2.dilate(binary, kernel_text, iterations=1)
+        binary = page.binary
         
         # Subtract text lines from edges
         # This leaves "non-linear" or "vertical" or "complex" structures
@@ -69,8 +59,7 @@ class DiagramExtractor:
         # We want the SHAPE of the diagram.
         
         # Dilate edges to make them solid
-        kernel_edges = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        dilated_edges = cv2.dilate(edges, kernel_edges, iterations=2)
+        dilated_edges = page.dilate('edges', (3, 3), iterations=2)
         
         # 4. Find Diagram Candidates
         # Combine edges and exclude known text line areas
@@ -121,16 +110,9 @@ class DiagramExtractor:
             if density < 0.02:
                 continue
                 
-            # Filter 5: Text Line Structure
-            # Check if the region is composed mainly of horizontal lines (text paragraph)
-            roi_text_lines = text_lines[y:y+h_rect, x:x+w_rect]
-            text_line_density = cv2.countNonZero(roi_text_lines) / area
-            
-            # If the region is almost entirely covered by "text line" detection, it's likely a paragraph
-            # Diagrams will have vertical lines, circles, etc. that don't match the horizontal kernel perfectly
-            # But this is risky if the diagram has many labels.
-            
-            # Instead, let's accept it as a diagram candidate
+            # Filter 5 (text line structure, a 40x3 dilation of the binary
+            # page) was never applied: a diagram with many labels looks
+            # like a paragraph to it, so candidates are accepted here
             
             diagrams.append({
                 'bbox': [x, y, x + w_rect, y + h_rect],
@@ -146,46 +128,29 @@ class DiagramExtractor:
         return merged_diagrams
         
     def _merge_overlaps(self, diagrams: List[Dict]) -> List[Dict]:
-        """Merge overlapping diagram regions."""
+        """
+        Merge overlapping diagram regions.
+        
+        Regions merge if their intersection exceeds 50% of the smaller one,
+        repeated to a fixed point (see box_merge.py), so the result does not
+        depend on candidate order.
+        """
         if not diagrams:
             return []
-            
-        # Sort by area (largest first)
-        sorted_diagrams = sorted(diagrams, key=lambda d: (d['bbox'][2]-d['bbox'][0])*(d['bbox'][3]-d['bbox'][1]), reverse=True)
+        
+        merged_boxes, labels = merge_overlapping_boxes([d['bbox'] for d in diagrams], min_overlap=0.5)
+        
+        confidence = np.full(len(merged_boxes), -np.inf)
+        np.maximum.at(confidence, labels, [d.get('confidence', 0.0) for d in diagrams])
         
         merged = []
+        for box, score in zip(merged_boxes.tolist(), confidence.tolist()):
+            merged.append({
+                'bbox': box,
+                'confidence': score,
+                'type': 'diagram'
+            })
         
-        for current in sorted_diagrams:
-            is_overlap = False
-            cx1, cy1, cx2, cy2 = current['bbox']
-            c_area = (cx2-cx1) * (cy2-cy1)
-            
-            for existing in merged:
-                ex1, ey1, ex2, ey2 = existing['bbox']
-                
-                # Calculate intersection
-                ix1 = max(cx1, ex1)
-                iy1 = max(cy1, ey1)
-                ix2 = min(cx2, ex2)
-                iy2 = min(cy2, ey2)
-                
-                if ix2 > ix1 and iy2 > iy1:
-                    intersection = (ix2 - ix1) * (iy2 - iy1)
-                    # If intersection is significant (> 50% of smaller rect), merge
-                    if intersection > 0.5 * min(c_area, (ex2-ex1)*(ey2-ey1)):
-                        # Merge into existing (expand existing bbox)
-                        existing['bbox'] = [
-                            min(cx1, ex1),
-                            min(cy1, ey1),
-                            max(cx2, ex2),
-                            max(cy2, ey2)
-                        ]
-                        is_overlap = True
-                        break
-            
-            if not is_overlap:
-                merged.append(current)
-                
         return merged
 
 # Singleton instance
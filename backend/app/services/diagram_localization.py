@@ -0,0 +1,146 @@
+"""
+Diagram localization: snap Qwen diagram markers to detected contours.
+
+Qwen-VL-OCR only reports WHERE a diagram is as [[DIAGRAM:position=X%]],
+which QwenVLOCR._parse_response turns into an estimated_bbox spanning the
+full page width and a fixed 25% of its height. Cropping that band wrote
+oversized PNGs full of surrounding text, and a second, independent
+DiagramExtractor pass ran afterwards just to catch diagrams Qwen missed.
+
+This stage combines both in one pass per page:
+1. DiagramExtractor contour candidates are computed once (or passed in).
+2. Each marker snaps to the nearest unused candidate by vertical distance
+   between the marker's estimated centre and the candidate's centre
+   (globally closest pairs first, each candidate used once).
+3. Markers with no candidate within DIAGRAM_SNAP_MAX_DISTANCE fall back to
+   their estimated band, shrunk to the ink it actually contains.
+4. Candidates no marker claimed are returned so the caller can insert them
+   when Qwen emitted no markers at all.
+
+All boxes are [x1, y1, x2, y2] in page coordinates, padded by
+DIAGRAM_CROP_PADDING and clipped to the page.
+
+CONFIGURATION (environment variables):
+- DIAGRAM_SNAP_MAX_DISTANCE: Max marker-to-candidate distance as a fraction
+  of page height (default: 0.35)
+- DIAGRAM_CROP_PADDING: Pixels of margin around each crop (default: 8)
+"""
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.page_analysis import PageAnalysis
+from app.services.region_features import INK_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+SNAP_MAX_DISTANCE = float(os.getenv("DIAGRAM_SNAP_MAX_DISTANCE", "0.35"))
+CROP_PADDING = int(os.getenv("DIAGRAM_CROP_PADDING", "8"))
+
+# Rows/columns with fewer ink pixels than this are treated as specks when
+# shrinking a fallback band
+MIN_INK_PIXELS = 3
+
+
+def localize_diagrams(
+    markers: List[Dict],
+    page: PageAnalysis,
+    candidates: Optional[List[Dict]] = None
+) -> Tuple[List[Optional[List[int]]], List[Dict]]:
+    """
+    Assign a tight bounding box to every diagram marker.
+
+    Args:
+        markers: Diagram regions from QwenVLOCR._parse_response (in marker
+            order), with 'position_percent' and optional 'estimated_bbox'
+        page: Shared PageAnalysis of the page
+        candidates: DiagramExtractor results for the page (computed if None)
+
+    Returns:
+        (boxes, unmatched): one [x1, y1, x2, y2] box per marker (None if
+        nothing could be localized), and the candidates no marker claimed
+    """
+    if candidates is None:
+        from app.services.diagram_extractor import diagram_extractor
+        candidates = diagram_extractor.extract_diagrams(page.path or "<page>", page=page)
+
+    h, w = page.shape
+    boxes: List[Optional[List[int]]] = [None] * len(markers)
+    claimed = set()
+
+    if markers and candidates:
+        marker_y = np.array([_marker_center(marker, h) for marker in markers], dtype=np.float64)
+        bbox = np.array([candidate['bbox'] for candidate in candidates], dtype=np.float64)
+        candidate_y = (bbox[:, 1] + bbox[:, 3]) / 2
+        distance = np.abs(marker_y[:, None] - candidate_y[None, :])
+
+        # Closest pairs first; each marker and candidate used once
+        limit = SNAP_MAX_DISTANCE * h
+        for flat in np.argsort(distance, axis=None, kind='stable'):
+            m, c = divmod(int(flat), len(candidates))
+            if distance[m, c] > limit:
+                break
+            if boxes[m] is not None or c in claimed:
+                continue
+            boxes[m] = _pad(candidates[c]['bbox'], w, h)
+            claimed.add(c)
+            logger.debug(f"   🎯 Diagram marker {m} snapped to contour {candidates[c]['bbox']}")
+
+    for m, marker in enumerate(markers):
+        if boxes[m] is None:
+            boxes[m] = _shrink_to_ink(marker.get('estimated_bbox'), page)
+
+    unmatched = [candidate for c, candidate in enumerate(candidates or []) if c not in claimed]
+    snapped = len(claimed)
+    logger.info(
+        f"   🎯 Localized {len(markers)} diagram marker(s): {snapped} snapped to contours, "
+        f"{len(markers) - snapped} from estimates; {len(unmatched)} unclaimed contour(s)"
+    )
+    return boxes, unmatched
+
+
+def _marker_center(marker: Dict, height: int) -> float:
+    """Vertical centre of a marker's estimated position."""
+    bbox = marker.get('estimated_bbox')
+    if bbox and bbox.get('y2'):
+        return (bbox['y1'] + bbox['y2']) / 2
+    return marker.get('position_percent', 50) / 100.0 * height
+
+
+def _pad(bbox: List[int], width: int, height: int) -> List[int]:
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    return [
+        max(0, x1 - CROP_PADDING),
+        max(0, y1 - CROP_PADDING),
+        min(width, x2 + CROP_PADDING),
+        min(height, y2 + CROP_PADDING),
+    ]
+
+
+def _shrink_to_ink(estimated_bbox: Optional[Dict], page: PageAnalysis) -> Optional[List[int]]:
+    """
+    Shrink an estimated band to the rows and columns that contain ink.
+
+    Returns:
+        Padded [x1, y1, x2, y2], or None if the band is missing or blank
+    """
+    if not estimated_bbox or not estimated_bbox.get('x2') or not estimated_bbox.get('y2'):
+        return None
+
+    h, w = page.shape
+    x1 = max(0, min(int(estimated_bbox['x1']), w))
+    x2 = max(0, min(int(estimated_bbox['x2']), w))
+    y1 = max(0, min(int(estimated_bbox['y1']), h))
+    y2 = max(0, min(int(estimated_bbox['y2']), h))
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    ink = page.gray[y1:y2, x1:x2] < INK_THRESHOLD
+    rows = np.flatnonzero(ink.sum(axis=1) >= MIN_INK_PIXELS)
+    cols = np.flatnonzero(ink.sum(axis=0) >= MIN_INK_PIXELS)
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+
+    return _pad([x1 + cols[0], y1 + rows[0], x1 + cols[-1] + 1, y1 + rows[-1] + 1], w, h)
@@ -0,0 +1,245 @@
+"""
+Content-addressed store for diagram crops.
+
+convert.py used to write every crop as a full-quality PNG named
+diagram_{image_index}_{diagram_idx}.png straight into the shared outputs/
+directory. Two concurrent requests overwrote each other's files, and the
+same crop from a repeated upload was stored again.
+
+DiagramStore instead:
+- Names each crop by the SHA-256 of its pixels (shape + bytes), under
+  outputs/diagrams/<first 2 hex digits>/<digest>.png, so identical crops
+  share one file and different crops can never collide
+- Encodes compactly: line art (near-gray, few mid-tones) is reduced to a
+  16-color palette PNG; everything else is an optimized PNG
+- Counts references per document: put(image, owner) adds the owner to the
+  crop's reference set, release(owner) drops all of a document's
+  references and deletes crops nobody references any more
+
+Reference sets are kept in memory and mirrored to refs.json (atomic
+replace) so they survive restarts. refs.json is written once per document,
+not per crop: by release() and by flush() (end of a page's conversion).
+Encoding and writing a new crop happen outside the store lock, which only
+covers the existence check, the rename and the reference sets.
+
+PNG only: python-docx cannot embed WebP, and crops end up in .docx files.
+
+CONFIGURATION (environment variables):
+- DIAGRAM_PALETTE_COLORS: Palette size for line art (default: 16, 0 disables)
+- DIAGRAM_PNG_COMPRESSION: zlib level 0-9 for PNG output (default: 9)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PALETTE_COLORS = int(os.getenv("DIAGRAM_PALETTE_COLORS", "16"))
+PNG_COMPRESSION = int(os.getenv("DIAGRAM_PNG_COMPRESSION", "9"))
+
+# Line-art detection: channels differ by at most this much (99th percentile)
+# and at most this fraction of pixels are mid-tones
+GRAY_TOLERANCE = 12
+MAX_MIDTONE_FRACTION = 0.2
+
+
+def content_digest(image: np.ndarray) -> str:
+    """SHA-256 of a crop's shape, dtype and pixels."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.sha256(f"{image.shape}{image.dtype}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def is_line_art(image: np.ndarray) -> bool:
+    """Near-grayscale crop made mostly of dark strokes on a light background."""
+    if image.ndim == 3:
+        spread = image.max(axis=2).astype(np.int16) - image.min(axis=2)
+        if np.percentile(spread, 99) > GRAY_TOLERANCE:
+            return False
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    midtones = np.count_nonzero((gray > 64) & (gray < 192))
+    return midtones <= MAX_MIDTONE_FRACTION * gray.size
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    Encode a BGR or grayscale crop as a compact PNG.
+
+    Line art becomes a PALETTE_COLORS palette PNG (Pillow), or 8-bit gray
+    with the same number of levels if Pillow is unavailable.
+    """
+    if PALETTE_COLORS > 0 and is_line_art(image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        try:
+            from io import BytesIO
+            from PIL import Image
+            buffer = BytesIO()
+            Image.fromarray(gray).quantize(colors=PALETTE_COLORS).save(buffer, format='PNG', optimize=True)
+            return buffer.getvalue()
+        except ImportError:
+            step = 256 // PALETTE_COLORS
+            image = (gray // step * step + step // 2).astype(np.uint8)
+
+    ok, encoded = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION])
+    if not ok:
+        raise ValueError("PNG encoding failed")
+    return encoded.tobytes()
+
+
+class DiagramStore:
+    """
+    Deduplicated, reference-counted diagram files.
+    """
+
+    def __init__(self, root: Path):
+        """
+        Initialize diagram store.
+
+        Args:
+            root: Directory holding the crops (created if missing)
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._refs_path = self.root / "refs.json"
+        self._lock = threading.Lock()
+        self._refs: Dict[str, Set[str]] = self._load_refs()
+        self._dirty = False
+
+    def path_for(self, digest: str) -> Path:
+        """File path of a stored crop."""
+        return self.root / digest[:2] / f"{digest}.png"
+
+    def put(self, image: np.ndarray, owner: str) -> Path:
+        """
+        Store a crop (once per distinct content) and reference it from owner.
+
+        Args:
+            image: BGR or grayscale crop
+            owner: Id of the document using the crop
+
+        Returns:
+            Path of the stored file
+        """
+        digest = content_digest(image)
+        path = self.path_for(digest)
+
+        with self._lock:
+            if path.exists():
+                # Retention ages crops by mtime: a reused crop is in use again
+                os.utime(path)
+                self._add_ref(digest, owner)
+                logger.debug(f"   ♻️  Reusing stored diagram {digest[:12]}")
+                return path
+
+        # Encode and write-then-rename (readers never see a partial file)
+        # without holding the lock; identical concurrent crops race harmlessly
+        path.parent.mkdir(exist_ok=True)
+        data = encode_png(image)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+
+        with self._lock:
+            os.replace(tmp, path)
+            self._add_ref(digest, owner)
+        logger.debug(f"   💾 Stored diagram {digest[:12]} ({len(data)} bytes)")
+        return path
+
+    def release(self, owner: str) -> int:
+        """
+        Drop every reference held by owner and delete unreferenced crops.
+
+        Returns:
+            Number of files deleted
+        """
+        removed = 0
+        with self._lock:
+            for digest in [d for d, owners in self._refs.items() if owner in owners]:
+                owners = self._refs[digest]
+                owners.discard(owner)
+                self._dirty = True
+                if owners:
+                    continue
+                del self._refs[digest]
+                try:
+                    self.path_for(digest).unlink()
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            self._flush_locked()
+        if removed:
+            logger.info(f"   🧹 Released {removed} diagram file(s) for {owner}")
+        return removed
+
+    def flush(self):
+        """Persist reference changes made since the last write of refs.json."""
+        with self._lock:
+            self._flush_locked()
+
+    def refcount(self, digest: str) -> int:
+        """Number of documents referencing a crop."""
+        with self._lock:
+            return len(self._refs.get(digest, ()))
+
+    def _load_refs(self) -> Dict[str, Set[str]]:
+        try:
+            data = json.loads(self._refs_path.read_text(encoding='utf-8'))
+            return {digest: set(owners) for digest, owners in data.items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Could not read diagram references, starting empty: {e}")
+            return {}
+
+    def _add_ref(self, digest: str, owner: str):
+        owners = self._refs.setdefault(digest, set())
+        if owner not in owners:
+            owners.add(owner)
+            self._dirty = True
+
+    def _flush_locked(self):
+        if self._dirty:
+            self._save_refs()
+            self._dirty = False
+
+    def _save_refs(self):
+        tmp = self._refs_path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({digest: sorted(owners) for digest, owners in self._refs.items()}),
+            encoding='utf-8'
+        )
+        os.replace(tmp, self._refs_path)
+
+
+# Global instance
+_diagram_store = None
+_diagram_store_lock = threading.Lock()
+
+
+def get_diagram_store(outputs_dir: Optional[Path] = None) -> DiagramStore:
+    """
+    Get or create the DiagramStore under outputs/diagrams.
+
+    Args:
+        outputs_dir: Outputs directory (default: FileManager outputs dir)
+
+    Returns:
+        DiagramStore instance
+    """
+    global _diagram_store
+    with _diagram_store_lock:
+        if _diagram_store is None:
+            if outputs_dir is None:
+                from app.utils.file_manager import FileManager
+                outputs_dir = FileManager().get_outputs_dir()
+            _diagram_store = DiagramStore(Path(outputs_dir) / "diagrams")
+    return _diagram_store
@@ -0,0 +1,185 @@
+"""
+Potrace SVG vectorization service for diagram crops.
+
+DiagramExtractor._convert_to_svg used to write a PBM file per diagram,
+run `potrace` synchronously on it and read the SVG back from disk, one
+diagram at a time. The PBM was also packed with np.packbits over the
+flattened image, so any crop whose width was not a multiple of 8 came out
+sheared: P4 rows must each be padded to a whole byte.
+
+This service:
+1. Encodes a correctly padded P4 bitmap in memory (np.packbits per row)
+2. Pipes it to `potrace -s -o - -` over stdin/stdout (no temp files)
+3. Runs up to POTRACE_WORKERS conversions concurrently; each worker
+   thread drives one potrace process, so concurrency is bounded
+4. Caches SVGs in an LRU keyed by a hash of the binarized crop, so
+   repeated diagrams are vectorized once
+
+CONFIGURATION (environment variables):
+- POTRACE_WORKERS: Concurrent potrace processes (default: min(4, CPUs))
+- POTRACE_TIMEOUT: Seconds per conversion (default: 30)
+- POTRACE_CACHE_SIZE: SVGs kept in the cache (default: 256)
+"""
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+POTRACE_WORKERS = max(1, int(os.getenv("POTRACE_WORKERS", str(min(4, os.cpu_count() or 1)))))
+POTRACE_TIMEOUT = float(os.getenv("POTRACE_TIMEOUT", "30"))
+POTRACE_CACHE_SIZE = int(os.getenv("POTRACE_CACHE_SIZE", "256"))
+
+# Pixels at or below this gray level are traced as ink
+BINARY_THRESHOLD = 127
+
+# -s: SVG output, --tight: remove whitespace border, --flat: whole image
+# as a single path (simpler SVG)
+POTRACE_ARGS = ['-s', '--tight', '--flat']
+
+
+_potrace_available: Optional[bool] = None
+
+
+def potrace_available() -> bool:
+    """Whether the potrace binary can be run (checked once)."""
+    global _potrace_available
+    if _potrace_available is None:
+        try:
+            result = subprocess.run(['potrace', '--version'], capture_output=True, timeout=5)
+            _potrace_available = result.returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            _potrace_available = False
+    return _potrace_available
+
+
+def ink_mask(image: np.ndarray) -> np.ndarray:
+    """Boolean mask of dark (ink) pixels of a BGR or grayscale crop."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return gray <= BINARY_THRESHOLD
+
+
+def encode_pbm(mask: np.ndarray) -> bytes:
+    """
+    Encode a boolean mask as binary PBM (P4), 1 = black.
+
+    Each row is packed separately so it is padded to a byte boundary, as
+    the format requires.
+    """
+    h, w = mask.shape
+    packed = np.packbits(mask.astype(np.uint8), axis=1, bitorder='big')
+    return f"P4\n{w} {h}\n".encode() + packed.tobytes()
+
+
+class DiagramVectorizer:
+    """
+    Bounded pool of potrace conversions with an SVG cache.
+    """
+
+    def __init__(
+        self,
+        workers: int = POTRACE_WORKERS,
+        timeout: float = POTRACE_TIMEOUT,
+        cache_size: int = POTRACE_CACHE_SIZE
+    ):
+        """
+        Initialize vectorizer.
+
+        Args:
+            workers: Concurrent potrace processes
+            timeout: Seconds allowed per conversion
+            cache_size: SVGs kept in the LRU cache (0 disables caching)
+        """
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="potrace")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """
+        Queue one crop for vectorization.
+
+        Returns:
+            Future resolving to the SVG text, or None if conversion failed
+        """
+        mask = ink_mask(image)
+        key = self._cache_key(mask)
+
+        with self._lock:
+            svg = self._cache.get(key)
+            if svg is not None:
+                self._cache.move_to_end(key)
+        if svg is not None:
+            future: Future = Future()
+            future.set_result(svg)
+            return future
+
+        return self._executor.submit(self._convert, mask, key)
+
+    def vectorize(self, image: np.ndarray) -> Optional[str]:
+        """Vectorize one crop (blocking)."""
+        return self.submit(image).result()
+
+    def vectorize_many(self, images: List[np.ndarray]) -> List[Optional[str]]:
+        """Vectorize crops concurrently; results are in input order."""
+        futures = [self.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def _cache_key(self, mask: np.ndarray) -> str:
+        digest = hashlib.sha1(np.packbits(mask, axis=1).tobytes())
+        digest.update(f"{mask.shape[0]}x{mask.shape[1]}".encode())
+        return digest.hexdigest()
+
+    def _convert(self, mask: np.ndarray, key: str) -> Optional[str]:
+        try:
+            result = subprocess.run(
+                ['potrace', *POTRACE_ARGS, '-o', '-', '-'],
+                input=encode_pbm(mask),
+                capture_output=True,
+                timeout=self.timeout
+            )
+        except FileNotFoundError:
+            logger.warning("⚠️  Potrace not found in PATH")
+            return None
+        except subprocess.TimeoutExpired:
+            logger.warning(f"⚠️  Potrace conversion timed out after {self.timeout}s")
+            return None
+
+        if result.returncode != 0 or not result.stdout:
+            logger.warning(f"⚠️  Potrace conversion failed: {result.stderr.decode(errors='replace').strip()}")
+            return None
+
+        svg = result.stdout.decode('utf-8')
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = svg
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return svg
+
+
+# Global instance
+_diagram_vectorizer = None
+
+
+def get_diagram_vectorizer() -> DiagramVectorizer:
+    """
+    Get or create DiagramVectorizer instance.
+
+    Returns:
+        DiagramVectorizer instance
+    """
+    global _diagram_vectorizer
+    if _diagram_vectorizer is None:
+        _diagram_vectorizer = DiagramVectorizer()
+    return _diagram_vectorizer
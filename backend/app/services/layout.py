@@ -5,133 +5,147 @@ Uses computer vision techniques to detect and classify regions:
 """
 import cv2
 import numpy as np
-from typing import List, Dict, Tuple, Any
+from typing import List, Tuple, Optional
 from pathlib import Path
 import re
+import math
 import logging
 
+from app.services.tiled_layout import should_tile, detect_text_boxes_tiled, mask_scale
+from app.services.region_features import ink_integral, compute_region_features, compute_region_features_banded
+from app.services.region_table import RegionTable, type_code
+from app.services.page_analysis import PageAnalysis, get_page_analysis
+
 logger = logging.getLogger(__name__)
 
 
-def detect_layout(image_path: str) -> List[Dict[str, Any]]:
+def detect_layout(image_path: str, page: Optional[PageAnalysis] = None) -> RegionTable:
     """
     Detect and classify document regions with preserved reading order.
     
     Args:
         image_path: Path to preprocessed image
+        page: Shared PageAnalysis of the image (looked up by path if not given)
         
     Returns:
-        List of region dictionaries with type and bbox [x1, y1, x2, y2]
+        RegionTable in reading order; iterating yields region dictionaries
+        with type and bbox [x1, y1, x2, y2]
     """
     logger.info(f"📐 Starting layout detection for: {Path(image_path).name}")
     
-    # Load image
-    img = cv2.imread(image_path)
-    if img is None:
+    # Load image (transforms are shared with the other analysis stages)
+    if page is None:
+        page = get_page_analysis(image_path)
+    if page is None:
         logger.error(f"❌ Could not load image: {image_path}")
         raise ValueError(f"Could not load image: {image_path}")
     
-    logger.debug(f"   Image dimensions: {img.shape[1]}x{img.shape[0]}")
-    
-    # Convert to grayscale if needed
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
-        img = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+    logger.debug(f"   Image dimensions: {page.shape[1]}x{page.shape[0]}")
     
     # Detect all regions
     logger.debug("🔍 Detecting regions...")
-    regions = _detect_regions(gray, img)
+    regions = _detect_regions(page)
     logger.info(f"   Found {len(regions)} regions")
     
     # Classify regions
     logger.debug("🏷️  Classifying regions...")
-    classified_regions = _classify_regions(regions, gray, img)
+    classified_regions = _classify_regions(regions, page.gray, page.bgr, _page_integral(page))
     
     # Count by type
     type_counts = {}
-    for r in classified_regions:
-        type_counts[r['type']] = type_counts.get(r['type'], 0) + 1
+    for region_type in classified_regions.types:
+        type_counts[region_type] = type_counts.get(region_type, 0) + 1
     logger.info(f"   Region types: {type_counts}")
     
-    # Sort by reading order (top-to-bottom, left-to-right)
+    # Sort by reading order (columns, then top-to-bottom, left-to-right)
     logger.debug("📋 Sorting regions by reading order...")
-    sorted_regions = _sort_reading_order(classified_regions)
-    
-    # Format output
-    output = []
-    for region in sorted_regions:
-        x1, y1, x2, y2 = region['bbox']
-        output.append({
-            "type": region['type'],
-            "bbox": [x1, y1, x2, y2]
-        })
-    
-    return output
+    return _sort_reading_order(classified_regions)
 
 
-def _detect_regions(gray: np.ndarray, img: np.ndarray) -> List[Dict]:
+def _detect_regions(page: PageAnalysis) -> RegionTable:
     """
     Detect all document regions using contour analysis.
+    
+    Very large pages (see tiled_layout.LAYOUT_TILED_MIN_PIXELS) are processed
+    in overlapping tiles to cap peak memory; their region features come from
+    banded ink integrals instead of a full-page table.
     """
-    regions = []
+    gray = page.gray
+    h, w = gray.shape
+    integral = _page_integral(page)
     
-    # Apply adaptive thresholding for better text detection
-    binary = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-        cv2.THRESH_BINARY_INV, 11, 2
-    )
+    if should_tile(gray.shape):
+        boxes = detect_text_boxes_tiled(gray, kernel_width=40)
+    else:
+        boxes = _detect_text_boxes(page)
     
-    # Morphological operations to connect text components
-    kernel_horizontal = cv2.getStructuringElement(cv2.MORPH_RECT, (40, 1))
-    kernel_vertical = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 40))
+    text_features = _filter_text_boxes(_region_features(gray, boxes, integral), w, h)
     
-    # Horizontal dilation for text lines
-    dilated_h = cv2.dilate(binary, kernel_horizontal, iterations=1)
+    # Detect diagram regions (non-text areas)
+    diagram_regions = _detect_diagram_regions(gray, text_features, integral)
+    
+    # Text regions start as paragraphs; _classify_regions refines them
+    return RegionTable.concat([RegionTable(text_features['bbox']), diagram_regions])
+
+
+def _page_integral(page: PageAnalysis) -> Optional[np.ndarray]:
+    """Shared full-page ink integral, or None on tiled pages (4 bytes per pixel)."""
+    if should_tile(page.shape):
+        return None
+    return page.ink_integral
+
+
+def _region_features(gray: np.ndarray, boxes, integral: Optional[np.ndarray] = None, areas=None) -> np.ndarray:
+    """Region features from the page integral, or from banded integrals on tiled pages."""
+    if integral is None:
+        if should_tile(gray.shape):
+            return compute_region_features_banded(boxes, gray, areas=areas)
+        integral = ink_integral(gray)
+    return compute_region_features(boxes, integral, areas=areas)
+
+
+def _detect_text_boxes(page: PageAnalysis) -> List[Tuple[int, int, int, int]]:
+    """
+    Find text-line bounding boxes over the whole page.
+    """
+    # Adaptive thresholding + horizontal dilation (40x1) connects characters
+    # into text lines; both come from the shared page cache
+    dilated_h = page.dilate('binary', (40, 1))
     
     # Find contours
     contours, _ = cv2.findContours(dilated_h, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
-    h, w = gray.shape
+    boxes = []
+    for contour in contours:
+        x, y, w_rect, h_rect = cv2.boundingRect(contour)
+        boxes.append((x, y, x + w_rect, y + h_rect))
+    return boxes
+
+
+def _filter_text_boxes(features: np.ndarray, w: int, h: int) -> np.ndarray:
+    """
+    Filter raw box features by size and aspect ratio (vectorized).
+    """
     # RELAXED thresholds: Much lower minimum area (0.01% instead of 0.1%)
     # This allows detection of smaller text regions
     min_area = (w * h) * 0.0001  # 0.01% of image area (was 0.1%)
     max_area = (w * h) * 0.95   # 95% of image area
     
-    for contour in contours:
-        x, y, w_rect, h_rect = cv2.boundingRect(contour)
-        area = w_rect * h_rect
-        
-        # Filter by size - RELAXED thresholds
-        if min_area < area < max_area:
-            # Filter by aspect ratio and dimensions - RELAXED
-            aspect_ratio = w_rect / h_rect if h_rect > 0 else 0
-            
-            # RELAXED: Lower height threshold (5 instead of 10), wider aspect ratio range
-            # Valid text regions should have reasonable aspect ratios
-            if 0.05 < aspect_ratio < 100 and h_rect > 5:  # Was: 0.1 < aspect_ratio < 50 and h_rect > 10
-                x1, y1 = x, y
-                x2, y2 = x + w_rect, y + h_rect
-                
-                regions.append({
-                    'bbox': (x1, y1, x2, y2),
-                    'area': area,
-                    'aspect_ratio': aspect_ratio,
-                    'width': w_rect,
-                    'height': h_rect,
-                    'x': x,
-                    'y': y
-                })
-    
-    # Detect diagram regions (non-text areas)
-    diagram_regions = _detect_diagram_regions(gray, regions)
-    regions.extend(diagram_regions)
+    area = features['area']
+    aspect_ratio = features['aspect_ratio']
     
-    return regions
+    # Filter by size, aspect ratio and dimensions - RELAXED
+    # Lower height threshold (5 instead of 10), wider aspect ratio range
+    # (Was: 0.1 < aspect_ratio < 50 and h_rect > 10)
+    keep = (
+        (area > min_area) & (area < max_area) &
+        (aspect_ratio > 0.05) & (aspect_ratio < 100) &
+        (features['height'] > 5)
+    )
+    return features[keep]
 
 
-def _detect_diagram_regions(gray: np.ndarray, text_regions: List[Dict]) -> List[Dict]:
+def _detect_diagram_regions(gray: np.ndarray, text_features: np.ndarray, integral: np.ndarray = None) -> RegionTable:
     """
     Detect diagram/image regions by finding large non-text areas.
     
@@ -139,26 +153,78 @@ def _detect_diagram_regions(gray: np.ndarray, text_regions: List[Dict]) -> List[
     - Only detects regions with NO readable characters
     - Much stricter size thresholds
     - If in doubt, returns empty list (treat as text)
+    
+    Args:
+        gray: Grayscale page
+        text_features: Feature array of the text regions (region_features)
+        integral: Ink summed-area table (computed, or banded on tiled pages,
+            if not given)
     """
     h, w = gray.shape
-    text_mask = np.zeros((h, w), dtype=np.uint8)
     
-    # Mark text regions
-    for region in text_regions:
-        x1, y1, x2, y2 = region['bbox']
-        text_mask[y1:y2, x1:x2] = 255
+    # Very large pages use a downscaled mask (diagrams are >= 5% of the page,
+    # so a coarse mask finds the same components with bounded memory)
+    scale = mask_scale(gray.shape)
+    mask_h = max(1, int(round(h * scale)))
+    mask_w = max(1, int(round(w * scale)))
     
-    # Invert to find non-text regions
-    non_text = 255 - text_mask
+    # Mark text regions directly on the non-text mask (no separate inversion buffer)
+    non_text = np.full((mask_h, mask_w), 255, dtype=np.uint8)
+    for x1, y1, x2, y2 in text_features['bbox']:
+        non_text[int(y1 * scale):int(math.ceil(y2 * scale)), int(x1 * scale):int(math.ceil(x2 * scale))] = 0
     
     # Find large connected components
     num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(
         non_text, connectivity=8
     )
+    del labels, non_text
+    
+    if scale != 1.0:
+        # Map component statistics back to page coordinates
+        stats = stats.astype(np.float64)
+        stats[:, :4] /= scale
+        stats[:, cv2.CC_STAT_AREA] /= scale * scale
+        stats = stats.astype(np.int64)
+    
+    # Features of all components (skip background label 0) in one pass
+    stats = stats[1:]
+    boxes = np.stack([
+        stats[:, cv2.CC_STAT_LEFT],
+        stats[:, cv2.CC_STAT_TOP],
+        stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH],
+        stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT],
+    ], axis=1)
+    candidates = _region_features(gray, boxes, integral, areas=stats[:, cv2.CC_STAT_AREA])
     
-    diagram_regions = []
     # Much stricter threshold - only very large regions (5% instead of 2%)
     min_diagram_area = (w * h) * 0.05  # 5% of image area
+    candidates = candidates[candidates['area'] > min_diagram_area]
+    
+    # CRITICAL: Filter out page background
+    # Check 1: Area too large (> 90% of image) - Relaxed from 50%
+    too_large = candidates['area'] > (w * h) * 0.90
+    
+    # Check 2: Touches multiple edges (likely margins/background)
+    # Relaxed: Only filter if touching 3 or more edges (almost full page)
+    margin = 5  # pixels
+    bbox = candidates['bbox']
+    edges_touched = (
+        (bbox[:, 0] < margin).astype(int) + (bbox[:, 1] < margin) +
+        (bbox[:, 2] > w - margin) + (bbox[:, 3] > h - margin)
+    )
+    is_background = too_large | (edges_touched >= 3)
+    if is_background.any():
+        logger.debug(f"   Skipping {int(is_background.sum())} potential diagram(s) (likely background)")
+    
+    # Avoid very elongated regions (likely margins/gaps)
+    # Much stricter aspect ratio - only square-ish regions (was 0.2-5)
+    aspect_ratio = candidates['aspect_ratio']
+    candidates = candidates[~is_background & (aspect_ratio > 0.7) & (aspect_ratio < 1.5)]
+    
+    diagram_regions = []
+    if len(candidates) == 0:
+        logger.info("   Detected 0 diagram regions (conservative detection)")
+        return RegionTable()
     
     # Try to import OCR for character detection
     try:
@@ -173,93 +239,47 @@ def _detect_diagram_regions(gray: np.ndarray, text_regions: List[Dict]) -> List[
         ocr_reader = None
         ocr_available = False
     
-    for i in range(1, num_labels):  # Skip background (label 0)
-        area = stats[i, cv2.CC_STAT_AREA]
-        if area > min_diagram_area:
-            x = stats[i, cv2.CC_STAT_LEFT]
-            y = stats[i, cv2.CC_STAT_TOP]
-            w_rect = stats[i, cv2.CC_STAT_WIDTH]
-            h_rect = stats[i, cv2.CC_STAT_HEIGHT]
-            
-            x1, y1 = x, y
-            x2, y2 = x + w_rect, y + h_rect
-            
-            # CRITICAL: Filter out page background
-            # The background will be a very large component that touches the edges
-            is_background = False
-            
-            # Check 1: Area too large (> 90% of image) - Relaxed from 50%
-            if area > (w * h) * 0.90:
-                is_background = True
-                logger.debug(f"   Skipping potential diagram (too large, likely background: {area/(w*h)*100:.1f}%)")
-            
-            # Check 2: Touches multiple edges (likely margins/background)
-            edges_touched = 0
-            margin = 5  # pixels
-            if x < margin: edges_touched += 1
-            if y < margin: edges_touched += 1
-            if x + w_rect > w - margin: edges_touched += 1
-            if y + h_rect > h - margin: edges_touched += 1
-            
-            # Relaxed: Only filter if touching 3 or more edges (almost full page)
-            if edges_touched >= 3:
-                is_background = True
-                logger.debug(f"   Skipping potential diagram (touches {edges_touched} edges, likely background)")
-                
-            if is_background:
-                continue
-            
-            # Avoid very elongated regions (likely margins/gaps)
-            aspect_ratio = w_rect / h_rect if h_rect > 0 else 0
-            
-            # Much stricter aspect ratio - only square-ish regions
-            if 0.7 < aspect_ratio < 1.5:  # Very square (was 0.2-5)
-                # CRITICAL: Check for readable characters before adding as diagram
-                region_img = gray[y1:y2, x1:x2]
-                has_characters = False
-                
-                if ocr_available and ocr_reader and region_img.size > 0:
-                    try:
-                        # Quick OCR check
-                        check_img = region_img.copy()
-                        if check_img.shape[0] > 200 or check_img.shape[1] > 200:
-                            scale = min(200 / check_img.shape[0], 200 / check_img.shape[1])
-                            new_h = int(check_img.shape[0] * scale)
-                            new_w = int(check_img.shape[1] * scale)
-                            check_img = cv2.resize(check_img, (new_w, new_h))
-                        
-                        results = ocr_reader.readtext(check_img, detail=0)
-                        for text in results:
-                            if text and text.strip():
-                                text_clean = text.strip()
-                                if any(c.isalnum() for c in text_clean) or any(c in '+-=×÷∑∫√≤≥≠≈' for c in text_clean):
-                                    has_characters = True
-                                    break
-                    except:
-                        # If check fails, assume text (conservative)
-                        has_characters = True
+    for candidate in candidates:
+        x1, y1, x2, y2 = (int(v) for v in candidate['bbox'])
+        area = int(candidate['area'])
+        
+        # CRITICAL: Check for readable characters before adding as diagram
+        region_img = gray[y1:y2, x1:x2]
+        has_characters = False
+        
+        if ocr_available and ocr_reader and region_img.size > 0:
+            try:
+                # Quick OCR check
+                check_img = region_img.copy()
+                if check_img.shape[0] > 200 or check_img.shape[1] > 200:
+                    scale = min(200 / check_img.shape[0], 200 / check_img.shape[1])
+                    new_h = int(check_img.shape[0] * scale)
+                    new_w = int(check_img.shape[1] * scale)
+                    check_img = cv2.resize(check_img, (new_w, new_h))
                 
-                # Only add as diagram if NO characters detected
-                if not has_characters:
-                    diagram_regions.append({
-                        'type': 'diagram',  # Explicitly set type
-                        'bbox': (x1, y1, x2, y2),
-                        'area': area,
-                        'aspect_ratio': aspect_ratio,
-                        'width': w_rect,
-                        'height': h_rect,
-                        'x': x,
-                        'y': y
-                    })
-                    logger.debug(f"   Detected diagram region (no characters, area={area/(w*h)*100:.1f}%)")
-                else:
-                    logger.debug(f"   Skipped potential diagram (contains characters) → treating as text")
+                results = ocr_reader.readtext(check_img, detail=0)
+                for text in results:
+                    if text and text.strip():
+                        text_clean = text.strip()
+                        if any(c.isalnum() for c in text_clean) or any(c in '+-=×÷∑∫√≤≥≠≈' for c in text_clean):
+                            has_characters = True
+                            break
+            except:
+                # If check fails, assume text (conservative)
+                has_characters = True
+        
+        # Only add as diagram if NO characters detected
+        if not has_characters:
+            diagram_regions.append((x1, y1, x2, y2))
+            logger.debug(f"   Detected diagram region (no characters, area={area/(w*h)*100:.1f}%)")
+        else:
+            logger.debug(f"   Skipped potential diagram (contains characters) → treating as text")
     
     logger.info(f"   Detected {len(diagram_regions)} diagram regions (conservative detection)")
-    return diagram_regions
+    return RegionTable(diagram_regions, [type_code('diagram')] * len(diagram_regions))
 
 
-def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) -> List[Dict]:
+def _classify_regions(regions: RegionTable, gray: np.ndarray, img: np.ndarray, integral: np.ndarray = None) -> RegionTable:
     """
     Classify regions into: heading, paragraph, equation, diagram.
     
@@ -268,9 +288,12 @@ def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) ->
     - If region contains letters, numbers, or math symbols → treat as TEXT
     - Handwritten text irregularity does NOT mean diagram
     - If in doubt → treat as TEXT, not diagram
+    
+    Densities come from one vectorized feature pass (region_features).
     """
-    classified = []
+    codes = regions.type_codes.copy()
     h, w = gray.shape
+    features = _region_features(gray, regions.bbox, integral)
     
     # Try to import OCR for character detection (optional, fail gracefully)
     try:
@@ -286,20 +309,19 @@ def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) ->
         ocr_available = False
         logger.debug("   OCR not available for diagram detection - will use conservative heuristics only")
     
-    for region in regions:
-        x1, y1, x2, y2 = region['bbox']
+    for i, feature in enumerate(features):
+        x1, y1, x2, y2 = (int(v) for v in feature['bbox'])
         
         # CRITICAL: If region is already classified as diagram (by _detect_diagram_regions), preserve it
-        if region.get('type') == 'diagram':
-            classified.append(region)
+        if codes[i] == type_code('diagram'):
             continue
             
         # Extract region properties
-        region_height = region['height']
-        region_width = region['width']
-        aspect_ratio = region['aspect_ratio']
-        area = region['area']
-        y_position = region['y']
+        region_height = int(feature['height'])
+        region_width = int(feature['width'])
+        aspect_ratio = float(feature['aspect_ratio'])
+        area = int(feature['area'])
+        y_position = y1
         
         # Extract region image for analysis
         region_img = gray[y1:y2, x1:x2]
@@ -338,13 +360,10 @@ def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) ->
                 logger.debug(f"   OCR check failed for region, defaulting to TEXT: {e}")
                 has_readable_characters = True  # Default to text if check fails
         
-        # Calculate text density (using horizontal projections)
-        horizontal_projection = np.sum(region_img < 128, axis=1)
-        text_density = np.mean(horizontal_projection > region_width * 0.1)
-        
-        # Calculate vertical line density (for equations/diagrams)
-        vertical_projection = np.sum(region_img < 128, axis=0)
-        vertical_density = np.mean(vertical_projection > region_height * 0.1)
+        # Text density (rows with ink) and vertical line density (for
+        # equations/diagrams) from the summed-area table
+        text_density = float(feature['text_density'])
+        vertical_density = float(feature['vertical_density'])
         
         # Calculate compactness (for diagrams)
         region_area = region_height * region_width
@@ -384,13 +403,13 @@ def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) ->
                 logger.debug(f"   Classified as labeled diagram (density={text_density:.2f}, compactness={compactness:.2f})")
         
         if is_diagram:
-            region['type'] = 'diagram'
+            codes[i] = type_code('diagram')
         else:
             # Force text if not a diagram
             pass
         
         if is_diagram:
-            region['type'] = 'diagram'
+            codes[i] = type_code('diagram')
         else:
             # Classify text regions
             # Headings are typically:
@@ -425,85 +444,34 @@ def _classify_regions(regions: List[Dict], gray: np.ndarray, img: np.ndarray) ->
             )
             
             if is_heading:
-                region['type'] = 'heading'
+                codes[i] = type_code('heading')
             elif is_equation:
-                region['type'] = 'equation'
+                codes[i] = type_code('equation')
             else:
-                region['type'] = 'paragraph'
+                codes[i] = type_code('paragraph')
             
         # FORCE DIAGRAM HEURISTIC:
         # If a region is large (> 15% of page) and NOT extremely dense text, it's likely a diagram/chart
         # This overrides previous classification
         if area > (w * h) * 0.15 and text_density < 0.8:
-             region['type'] = 'diagram'
+             codes[i] = type_code('diagram')
              logger.debug(f"   FORCE DIAGRAM: Large region ({area/(w*h)*100:.1f}%) classified as diagram")
         
-        classified.append(region)
     
-    return classified
+    return RegionTable(regions.bbox, codes)
 
 
-def _sort_reading_order(regions: List[Dict]) -> List[Dict]:
+def _sort_reading_order(regions: RegionTable) -> RegionTable:
     """
-    Sort regions by reading order: top-to-bottom, left-to-right.
-    Uses a sophisticated algorithm to handle multi-column layouts.
+    Sort regions by reading order.
+    Columns are read one after another; see reading_order.py.
     """
-    if not regions:
-        return []
-    
-    # Group regions by approximate row (y-coordinate)
-    # Regions with similar y-coordinates are in the same row
-    y_threshold = 30  # Pixels
-    
-    # Sort by y-coordinate first
-    sorted_by_y = sorted(regions, key=lambda r: r['y'])
-    
-    # Group into rows
-    rows = []
-    current_row = [sorted_by_y[0]]
-    
-    for region in sorted_by_y[1:]:
-        # Check if region is in the same row (similar y-coordinate)
-        avg_y_current = np.mean([r['y'] + r['height']/2 for r in current_row])
-        region_center_y = region['y'] + region['height']/2
-        
-        if abs(region_center_y - avg_y_current) < y_threshold:
-            current_row.append(region)
-        else:
-            # Start new row
-            rows.append(current_row)
-            current_row = [region]
-    
-    # Don't forget the last row
-    if current_row:
-        rows.append(current_row)
-    
-    # Sort each row by x-coordinate (left-to-right)
-    final_order = []
-    for row in rows:
-        row_sorted = sorted(row, key=lambda r: r['x'])
-        final_order.extend(row_sorted)
-    
-    return final_order
+    return regions.sort_reading_order()
 
 
-def detect_layout_from_array(image: np.ndarray) -> List[Dict[str, Any]]:
+def detect_layout_from_array(image: np.ndarray) -> RegionTable:
     """
     Detect layout from numpy array image.
     Useful when image is already loaded in memory.
     """
-    # Save temporarily
-    import tempfile
-    from pathlib import Path
-    
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    cv2.imwrite(temp_file.name, image)
-    temp_path = temp_file.name
-    
-    try:
-        result = detect_layout(temp_path)
-    finally:
-        # Clean up temp file
-        Path(temp_path).unlink()
-    
-    return result
+    return detect_layout("<array>", page=PageAnalysis(image))
@@ -2,11 +2,28 @@ import torch
 from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
 import numpy as np
-from typing import Dict, Any
+from typing import Dict, Any, List
 import easyocr
+import os
 import re
 
 from app.services.layout_analyzer import LayoutResult
+from app.services.batching import get_batcher
+
+TROCR_MODEL_NAME = "microsoft/trocr-base-handwritten"
+
+# Dynamic int8 quantization of Linear layers (CPU only)
+TROCR_QUANTIZE = os.getenv("TROCR_QUANTIZE", "true").lower() == "true"
+
+# Generation length cap derived from region width: handwritten lines
+# average well under TOKENS_PER_ASPECT BPE tokens per line-height of width
+TROCR_TOKENS_PER_ASPECT = 2.0
+TROCR_MIN_NEW_TOKENS = 8
+TROCR_MAX_NEW_TOKENS = 96
+
+# Regions whose greedy decode is empty are retried with beam search,
+# reusing the already-computed encoder outputs
+TROCR_RETRY_BEAMS = 4
 
 class OCREngine:
     def __init__(self):
@@ -19,16 +36,25 @@ class OCREngine:
             print("WARNING: No GPU detected - using CPU (slower)")
         
         try:
-            self.trocr_processor = TrOCRProcessor.from_pretrained("microsoft/trocr-base-handwritten")
-            self.trocr_model = VisionEncoderDecoderModel.from_pretrained("microsoft/trocr-base-handwritten")
+            self.trocr_processor = TrOCRProcessor.from_pretrained(TROCR_MODEL_NAME)
+            self.trocr_model = VisionEncoderDecoderModel.from_pretrained(TROCR_MODEL_NAME)
             self.trocr_model.to(self.device)
             self.trocr_model.eval()
-            print(f"TrOCR model loaded on {self.device}")
+            self.trocr_quantized = False
+            if self.device == "cpu" and TROCR_QUANTIZE:
+                self.trocr_model = self._quantize(self.trocr_model)
+            print(f"TrOCR model loaded on {self.device} (int8 quantized: {self.trocr_quantized})")
         except Exception as e:
             print(f"Warning: Could not load TrOCR: {e}")
             self.trocr_model = None
             self.trocr_processor = None
         
+        # Shared micro-batcher: regions from all concurrent requests share
+        # one TrOCR generate() call
+        self.trocr_batcher = None
+        if self.trocr_model is not None:
+            self.trocr_batcher = get_batcher("trocr_regions", self._trocr_batch)
+        
         try:
             self.easyocr_reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available())
             print("EasyOCR model loaded")
@@ -43,12 +69,14 @@ class OCREngine:
             'structure': []
         }
         
-        for idx in layout_result.reading_order:
-            region = layout_result.text_regions[idx]
+        regions = [layout_result.text_regions[idx] for idx in layout_result.reading_order]
+        region_imgs = []
+        for region in regions:
             x, y, w, h = region.bbox
-            region_img = layout_result.image[y:y+h, x:x+w]
-            text = self._ocr_region(region_img)
-            
+            region_imgs.append(layout_result.image[y:y+h, x:x+w])
+        texts = self._ocr_regions(region_imgs)
+        
+        for region, text in zip(regions, texts):
             if text:
                 is_equation = self._is_equation(text)
                 structure_info = self._detect_structure(text, region.region_type)
@@ -70,23 +98,98 @@ class OCREngine:
         
         return ocr_results
     
-    def _ocr_region(self, region_img: np.ndarray) -> str:
-        if len(region_img.shape) == 3:
-            pil_image = Image.fromarray(region_img).convert('RGB')
-        else:
-            pil_image = Image.fromarray(region_img).convert('L').convert('RGB')
+    def _ocr_regions(self, region_imgs: List[np.ndarray]) -> List[str]:
+        texts = [""] * len(region_imgs)
+        if self.trocr_batcher is not None and region_imgs:
+            try:
+                texts = [text.strip() for text in self.trocr_batcher.infer_many(region_imgs)]
+            except Exception as e:
+                print(f"Batched TrOCR error: {e}, falling back to per-region OCR")
+                return [self._ocr_region(img) for img in region_imgs]
         
+        # EasyOCR fallback for regions TrOCR left empty
+        return [text if text else self._easyocr_region(img) for text, img in zip(texts, region_imgs)]
+    
+    def _quantize(self, model):
+        try:
+            quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.trocr_quantized = True
+            return quantized
+        except Exception as e:
+            print(f"Warning: TrOCR int8 quantization failed, using fp32: {e}")
+            return model
+    
+    def _max_new_tokens(self, region_img: np.ndarray) -> int:
+        h, w = region_img.shape[:2]
+        aspect = w / h if h > 0 else 1.0
+        tokens = int(aspect * TROCR_TOKENS_PER_ASPECT) + TROCR_MIN_NEW_TOKENS
+        return max(TROCR_MIN_NEW_TOKENS, min(tokens, TROCR_MAX_NEW_TOKENS))
+    
+    def _trocr_batch(self, region_imgs: List[np.ndarray]) -> List[str]:
+        return self._trocr_generate(region_imgs)[0]
+    
+    def _trocr_generate(self, region_imgs: List[np.ndarray]):
+        """Batched TrOCR generation. Returns (texts, greedy_tokens, retry_tokens)."""
+        if not region_imgs:
+            return [], 0, 0
+        
+        pil_images = [self._to_pil(img) for img in region_imgs]
+        pixel_values = self.trocr_processor(images=pil_images, return_tensors="pt").pixel_values.to(self.device)
+        max_new_tokens = max(self._max_new_tokens(img) for img in region_imgs)
+        
+        with torch.inference_mode():
+            # Encode once; greedy decode and any beam-search retry share these outputs
+            encoder_outputs = self.trocr_model.get_encoder()(pixel_values=pixel_values)
+            generated_ids = self.trocr_model.generate(
+                encoder_outputs=encoder_outputs,
+                max_new_tokens=max_new_tokens,
+                num_beams=1,
+                use_cache=True,
+            )
+            texts = self.trocr_processor.batch_decode(generated_ids, skip_special_tokens=True)
+            token_count = self._count_tokens(generated_ids)
+            retry_token_count = 0
+            
+            retry = [i for i, text in enumerate(texts) if not text.strip()]
+            if retry:
+                index = torch.tensor(retry, device=encoder_outputs.last_hidden_state.device)
+                encoder_outputs.last_hidden_state = encoder_outputs.last_hidden_state.index_select(0, index)
+                retry_ids = self.trocr_model.generate(
+                    encoder_outputs=encoder_outputs,
+                    max_new_tokens=max_new_tokens,
+                    num_beams=TROCR_RETRY_BEAMS,
+                    use_cache=True,
+                )
+                retry_token_count = self._count_tokens(retry_ids)
+                for i, text in zip(retry, self.trocr_processor.batch_decode(retry_ids, skip_special_tokens=True)):
+                    texts[i] = text
+        
+        return texts, token_count, retry_token_count
+    
+    def _count_tokens(self, generated_ids) -> int:
+        """Generated tokens, not counting padding."""
+        pad_token_id = self.trocr_model.config.pad_token_id
+        if pad_token_id is None:
+            return int(generated_ids.numel())
+        return int((generated_ids != pad_token_id).sum())
+    
+    def _to_pil(self, region_img: np.ndarray) -> Image.Image:
+        if len(region_img.shape) == 3:
+            return Image.fromarray(region_img).convert('RGB')
+        return Image.fromarray(region_img).convert('L').convert('RGB')
+    
+    def _ocr_region(self, region_img: np.ndarray) -> str:
         if self.trocr_model is not None and self.trocr_processor is not None:
             try:
-                pixel_values = self.trocr_processor(images=pil_image, return_tensors="pt").pixel_values.to(self.device)
-                with torch.no_grad():
-                    generated_ids = self.trocr_model.generate(pixel_values)
-                text = self.trocr_processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+                text = self._trocr_batch([region_img])[0]
                 if text.strip():
                     return text.strip()
             except Exception as e:
                 print(f"TrOCR error: {e}, falling back to EasyOCR")
         
+        return self._easyocr_region(region_img)
+    
+    def _easyocr_region(self, region_img: np.ndarray) -> str:
         if self.easyocr_reader is not None:
             try:
                 if isinstance(region_img, Image.Image):
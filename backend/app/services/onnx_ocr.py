@@ -0,0 +1,301 @@
+"""
+ONNX Runtime backend for the PaddleOCR HYBRID pipeline (DB + CRNN).
+
+Runs exported PaddleOCR detection (DB) and recognition (CRNN/SVTR-LCNet)
+models with ONNX Runtime on CPU. No paddlepaddle import at runtime:
+startup is faster and the resident memory footprint is much smaller.
+
+OnnxPaddleOCR mirrors the parts of the PaddleOCR object that TextOCR uses
+(ocr(), text_recognizer, text_classifier), so it plugs into the existing
+extract_text() pipeline unchanged.
+
+MODEL EXPORT (one-time, on a machine with paddle2onnx installed):
+    paddle2onnx --model_dir en_PP-OCRv3_det_infer --model_filename inference.pdmodel \\
+        --params_filename inference.pdiparams --save_file det.onnx --opset_version 11
+    paddle2onnx --model_dir en_PP-OCRv4_rec_infer --model_filename inference.pdmodel \\
+        --params_filename inference.pdiparams --save_file rec.onnx --opset_version 11
+Copy det.onnx, rec.onnx and en_dict.txt (from ppocr/utils/en_dict.txt)
+into ONNX_OCR_MODEL_DIR.
+
+CONFIGURATION (environment variables):
+- ONNX_OCR_MODEL_DIR: directory with det.onnx, rec.onnx, en_dict.txt
+- ONNX_INTRA_OP_THREADS: threads per operator (default: min(4, CPU count))
+- ONNX_INTER_OP_THREADS: parallel operators (default 1, sequential graph)
+- ONNX_CPU_MEM_ARENA: keep the CPU memory arena (default false). The
+  recognizer sees a different input width per batch; without the arena
+  memory is returned after each run instead of growing to the largest shape.
+"""
+import os
+import math
+import time
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.batching import DEFAULT_MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_DIR = Path(__file__).parent.parent.parent / "models" / "onnx"
+
+# DB detector settings (same values as TextOCR's PaddleOCR configuration)
+DET_LIMIT_SIDE_LEN = 960
+DET_DB_THRESH = 0.3
+DET_DB_BOX_THRESH = 0.5
+DET_DB_UNCLIP_RATIO = 1.6
+DET_MAX_CANDIDATES = 1000
+DET_MIN_SIZE = 3
+DET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+DET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# CRNN recognizer input shape (PP-OCRv4 English: 3 x 48 x 320)
+REC_IMAGE_HEIGHT = 48
+REC_IMAGE_WIDTH = 320
+# Same cap as the request batcher that feeds the recognizer
+REC_BATCH_NUM = DEFAULT_MAX_BATCH_SIZE
+
+
+def _create_session(model_path: Path):
+    """Create a CPU inference session with tuned threading and memory settings."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = int(os.getenv("ONNX_INTRA_OP_THREADS", str(min(4, os.cpu_count() or 1))))
+    options.inter_op_num_threads = int(os.getenv("ONNX_INTER_OP_THREADS", "1"))
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.enable_cpu_mem_arena = os.getenv("ONNX_CPU_MEM_ARENA", "false").lower() == "true"
+    # Input shapes vary per image/batch: memory pattern planning only helps static shapes
+    options.enable_mem_pattern = False
+
+    return ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class OnnxTextRecognizer:
+    """Batched CRNN recognizer with CTC greedy decoding."""
+
+    def __init__(self, model_path: Path, dict_path: Path):
+        self.session = _create_session(model_path)
+        self.input_name = self.session.get_inputs()[0].name
+
+        with open(dict_path, "r", encoding="utf-8") as f:
+            chars = [line.rstrip("\r\n") for line in f]
+        # Index 0 is the CTC blank; PaddleOCR appends the space character
+        self.characters = ["blank"] + chars + [" "]
+
+    def __call__(self, img_list: List[np.ndarray]) -> Tuple[List[Tuple[str, float]], float]:
+        """
+        Recognize a list of line crops (BGR).
+
+        Returns:
+            Tuple of ([(text, score), ...] in input order, elapsed seconds)
+        """
+        start = time.time()
+        results: List[Tuple[str, float]] = [("", 0.0)] * len(img_list)
+
+        # Sort by aspect ratio so each batch pads to a similar width
+        order = np.argsort([img.shape[1] / float(max(img.shape[0], 1)) for img in img_list])
+
+        for offset in range(0, len(img_list), REC_BATCH_NUM):
+            indices = order[offset:offset + REC_BATCH_NUM]
+            max_wh_ratio = REC_IMAGE_WIDTH / REC_IMAGE_HEIGHT
+            for i in indices:
+                h, w = img_list[i].shape[:2]
+                max_wh_ratio = max(max_wh_ratio, w / float(max(h, 1)))
+
+            batch = np.stack([self._resize_norm(img_list[i], max_wh_ratio) for i in indices])
+            preds = self.session.run(None, {self.input_name: batch})[0]
+
+            for i, decoded in zip(indices, self._ctc_decode(preds)):
+                results[i] = decoded
+
+        return results, time.time() - start
+
+    def _resize_norm(self, img: np.ndarray, max_wh_ratio: float) -> np.ndarray:
+        """Resize to fixed height, normalize to [-1, 1] and right-pad to batch width."""
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        target_w = int(REC_IMAGE_HEIGHT * max_wh_ratio)
+        h, w = img.shape[:2]
+        resized_w = min(target_w, int(math.ceil(REC_IMAGE_HEIGHT * w / float(max(h, 1)))))
+        resized = cv2.resize(img, (max(resized_w, 1), REC_IMAGE_HEIGHT)).astype(np.float32)
+        resized = (resized / 255.0 - 0.5) / 0.5
+
+        padded = np.zeros((3, REC_IMAGE_HEIGHT, target_w), dtype=np.float32)
+        padded[:, :, :resized.shape[1]] = resized.transpose(2, 0, 1)
+        return padded
+
+    def _ctc_decode(self, preds: np.ndarray) -> List[Tuple[str, float]]:
+        """Greedy CTC decoding: collapse repeats, drop blanks."""
+        indices = preds.argmax(axis=2)
+        probs = preds.max(axis=2)
+        decoded = []
+        for seq, seq_probs in zip(indices, probs):
+            keep = np.ones(len(seq), dtype=bool)
+            keep[1:] = seq[1:] != seq[:-1]
+            keep &= seq != 0
+            chars = [self.characters[i] for i in seq[keep] if i < len(self.characters)]
+            score = float(seq_probs[keep].mean()) if keep.any() else 0.0
+            decoded.append(("".join(chars), score))
+        return decoded
+
+
+class OnnxTextDetector:
+    """DB text detector with PaddleOCR-equivalent post-processing."""
+
+    def __init__(self, model_path: Path):
+        self.session = _create_session(model_path)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, img: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Detect text line boxes in a BGR image.
+
+        Returns:
+            Tuple of (boxes array N x 4 x 2 in reading order, elapsed seconds)
+        """
+        start = time.time()
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        src_h, src_w = img.shape[:2]
+
+        tensor = self._preprocess(img)
+        prob_map = self.session.run(None, {self.input_name: tensor})[0][0, 0]
+        boxes = self._boxes_from_bitmap(prob_map, src_w, src_h)
+        return self._sort_boxes(boxes), time.time() - start
+
+    def _preprocess(self, img: np.ndarray) -> np.ndarray:
+        """Limit the long side and round dimensions to multiples of 32."""
+        h, w = img.shape[:2]
+        ratio = min(1.0, float(DET_LIMIT_SIDE_LEN) / max(h, w))
+        resize_h = max(32, int(round(h * ratio / 32) * 32))
+        resize_w = max(32, int(round(w * ratio / 32) * 32))
+        resized = cv2.resize(img, (resize_w, resize_h)).astype(np.float32) / 255.0
+        resized = (resized - DET_MEAN) / DET_STD
+        tensor = resized.transpose(2, 0, 1)[np.newaxis].astype(np.float32)
+        return tensor
+
+    def _boxes_from_bitmap(self, pred: np.ndarray, dest_width: int, dest_height: int) -> np.ndarray:
+        height, width = pred.shape
+        bitmap = (pred > DET_DB_THRESH).astype(np.uint8) * 255
+        contours, _ = cv2.findContours(bitmap, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        for contour in contours[:DET_MAX_CANDIDATES]:
+            points, sside = self._mini_box(contour)
+            if sside < DET_MIN_SIZE:
+                continue
+            if self._box_score(pred, points) < DET_DB_BOX_THRESH:
+                continue
+
+            expanded = self._unclip(points)
+            points, sside = self._mini_box(expanded.reshape(-1, 1, 2))
+            if sside < DET_MIN_SIZE + 2:
+                continue
+
+            points[:, 0] = np.clip(np.round(points[:, 0] / width * dest_width), 0, dest_width)
+            points[:, 1] = np.clip(np.round(points[:, 1] / height * dest_height), 0, dest_height)
+            boxes.append(points.astype(np.int32))
+
+        return np.array(boxes, dtype=np.int32).reshape(-1, 4, 2)
+
+    def _mini_box(self, contour: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Minimum-area rectangle with points ordered TL, TR, BR, BL."""
+        rect = cv2.minAreaRect(contour.astype(np.float32))
+        points = sorted(cv2.boxPoints(rect).tolist(), key=lambda p: p[0])
+        left = sorted(points[:2], key=lambda p: p[1])
+        right = sorted(points[2:], key=lambda p: p[1])
+        ordered = np.array([left[0], right[0], right[1], left[1]], dtype=np.float32)
+        return ordered, min(rect[1])
+
+    def _box_score(self, pred: np.ndarray, box: np.ndarray) -> float:
+        """Mean probability inside the box polygon."""
+        h, w = pred.shape
+        xmin = int(np.clip(np.floor(box[:, 0].min()), 0, w - 1))
+        xmax = int(np.clip(np.ceil(box[:, 0].max()), 0, w - 1))
+        ymin = int(np.clip(np.floor(box[:, 1].min()), 0, h - 1))
+        ymax = int(np.clip(np.ceil(box[:, 1].max()), 0, h - 1))
+        mask = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=np.uint8)
+        shifted = box.copy()
+        shifted[:, 0] -= xmin
+        shifted[:, 1] -= ymin
+        cv2.fillPoly(mask, [shifted.astype(np.int32)], 1)
+        return cv2.mean(pred[ymin:ymax + 1, xmin:xmax + 1], mask)[0]
+
+    def _unclip(self, box: np.ndarray) -> np.ndarray:
+        """
+        Expand the box by DB's unclip offset (area * ratio / perimeter).
+
+        PaddleOCR uses pyclipper polygon offsetting; for the rectangular
+        boxes produced here this is equivalent to growing each side.
+        """
+        area = cv2.contourArea(box)
+        perimeter = cv2.arcLength(box, True)
+        if perimeter <= 0:
+            return box
+        distance = area * DET_DB_UNCLIP_RATIO / perimeter
+        (cx, cy), (rw, rh), angle = cv2.minAreaRect(box)
+        return cv2.boxPoints(((cx, cy), (rw + 2 * distance, rh + 2 * distance), angle))
+
+    def _sort_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        """Top-to-bottom, then left-to-right for boxes on the same line."""
+        if len(boxes) == 0:
+            return boxes
+        ordered = sorted(boxes, key=lambda b: (b[0][1], b[0][0]))
+        for i in range(len(ordered) - 1):
+            for j in range(i, -1, -1):
+                if abs(ordered[j + 1][0][1] - ordered[j][0][1]) < 10 and ordered[j + 1][0][0] < ordered[j][0][0]:
+                    ordered[j], ordered[j + 1] = ordered[j + 1], ordered[j]
+                else:
+                    break
+        return np.array(ordered)
+
+
+class OnnxPaddleOCR:
+    """
+    Drop-in replacement for the PaddleOCR reader used by TextOCR.
+
+    Output formats of ocr() match PaddleOCR 2.7:
+    - det + rec: [[[box, (text, score)], ...]]
+    - det only:  [[box, ...]]
+    - rec only:  [[(text, score)]]
+    """
+
+    def __init__(self, model_dir: Optional[Path] = None):
+        model_dir = Path(model_dir or os.getenv("ONNX_OCR_MODEL_DIR") or DEFAULT_MODEL_DIR)
+        det_path = model_dir / "det.onnx"
+        rec_path = model_dir / "rec.onnx"
+        dict_path = model_dir / "en_dict.txt"
+        for path in (det_path, rec_path, dict_path):
+            if not path.exists():
+                raise FileNotFoundError(f"ONNX OCR model file not found: {path}")
+
+        self.text_detector = OnnxTextDetector(det_path)
+        self.text_recognizer = OnnxTextRecognizer(rec_path, dict_path)
+        # No angle classifier is exported; TextOCR skips it when None
+        self.text_classifier = None
+        logger.info(f"✅ ONNX Runtime OCR backend loaded from {model_dir}")
+
+    def ocr(self, img: np.ndarray, det: bool = True, rec: bool = True, cls: bool = False):
+        """Run detection and/or recognition with PaddleOCR-compatible output."""
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+
+        if not det:
+            rec_res, _ = self.text_recognizer([img]) if rec else ([], 0.0)
+            return [rec_res]
+
+        boxes, _ = self.text_detector(img)
+        if not rec:
+            return [[box.tolist() for box in boxes]]
+
+        crops = []
+        for box in boxes:
+            x_min, y_min = box.min(axis=0)
+            x_max, y_max = box.max(axis=0)
+            crops.append(img[y_min:max(y_max, y_min + 1), x_min:max(x_max, x_min + 1)])
+        rec_res, _ = self.text_recognizer(crops) if crops else ([], 0.0)
+        return [[[box.tolist(), res] for box, res in zip(boxes, rec_res)]]
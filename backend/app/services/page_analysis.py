@@ -0,0 +1,231 @@
+"""
+Per-page cache of shared image transforms.
+
+Layout detection, the dedicated diagram extractor and the agent's quality
+check each loaded the same page and recomputed the same transforms:
+grayscale, the adaptive binarization (Gaussian, block 11, C=2), Canny
+edges, the ink integral image and several large-kernel dilations.
+
+PageAnalysis computes each of these lazily on first use and memoizes it,
+so every transform runs at most once per page no matter how many stages
+ask for it:
+- gray, binary, blurred, edges, ink_integral: cached properties
+- dilate(source, kernel, iterations): memoized by (source, kernel size,
+  iterations)
+- laplacian_variance, contrast: scalar quality statistics
+
+Pages large enough for the tiled layout engine (tiled_layout.should_tile)
+are the exception: their full-size buffers (1-4 bytes per pixel each) are
+computed on demand and never memoized, so a 40 MP page does not keep
+hundreds of MB attached while it sits in a PageContext or the LRU. Scalar
+statistics are still memoized.
+
+Stages that only get a path call get_page_analysis(path), which returns the
+same object for the same file (keyed by path, size and mtime) from a small
+LRU. Callers that finish with a page can drop it with release_page_analysis.
+
+CONFIGURATION (environment variables):
+- PAGE_ANALYSIS_CACHE_SIZE: Pages kept in the LRU (default: 2)
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.services.region_features import ink_integral
+from app.services.tiled_layout import should_tile
+
+logger = logging.getLogger(__name__)
+
+PAGE_ANALYSIS_CACHE_SIZE = int(os.getenv("PAGE_ANALYSIS_CACHE_SIZE", "2"))
+
+# Adaptive threshold shared by layout and diagram extraction
+BINARY_BLOCK_SIZE = 11
+BINARY_C = 2
+
+# Canny on a 5x5 Gaussian blur (diagram edges)
+CANNY_LOW = 50
+CANNY_HIGH = 150
+
+
+class PageAnalysis:
+    """
+    Lazily computed, memoized transforms of one page image.
+    """
+
+    def __init__(self, image: np.ndarray, path: Optional[str] = None):
+        """
+        Initialize page analysis.
+
+        Args:
+            image: BGR (or grayscale) page as loaded by cv2.imread
+            path: Source file, for logging
+        """
+        if image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+        self.image = image
+        self.path = path
+        # Tiled-size pages: full-size transforms are not kept (see module docs)
+        self.keep_buffers = not should_tile(image.shape)
+        self._cache: Dict[Tuple, np.ndarray] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def load(cls, image_path: str) -> Optional["PageAnalysis"]:
+        """Read a page from disk (None if it cannot be loaded)."""
+        image = cv2.imread(str(image_path))
+        if image is None:
+            return None
+        return cls(image, str(image_path))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(height, width) of the page."""
+        return self.image.shape[:2]
+
+    def _memo(self, key: Tuple, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+            value = compute()
+            if self.keep_buffers or not isinstance(value, np.ndarray):
+                self._cache[key] = value
+            return value
+
+    # ------------------------------------------------------------------
+    # Base transforms
+    # ------------------------------------------------------------------
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """Page as 3-channel BGR."""
+        if self.image.ndim == 3:
+            return self.image
+        return self._memo(('bgr',), lambda: cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Grayscale page."""
+        if self.image.ndim == 2:
+            return self.image
+        return self._memo(('gray',), lambda: cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY))
+
+    @property
+    def binary(self) -> np.ndarray:
+        """Inverted adaptive binarization (ink = 255)."""
+        return self._memo(('binary',), lambda: cv2.adaptiveThreshold(
+            self.gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV, BINARY_BLOCK_SIZE, BINARY_C
+        ))
+
+    @property
+    def blurred(self) -> np.ndarray:
+        """5x5 Gaussian blur of the grayscale page."""
+        return self._memo(('blurred',), lambda: cv2.GaussianBlur(self.gray, (5, 5), 0))
+
+    @property
+    def edges(self) -> np.ndarray:
+        """Canny edges of the blurred page."""
+        return self._memo(('edges',), lambda: cv2.Canny(self.blurred, CANNY_LOW, CANNY_HIGH))
+
+    @property
+    def ink_integral(self) -> np.ndarray:
+        """Summed-area table of the ink mask (see region_features)."""
+        return self._memo(('ink_integral',), lambda: ink_integral(self.gray))
+
+    # ------------------------------------------------------------------
+    # Morphology
+    # ------------------------------------------------------------------
+
+    def dilate(self, source: str, kernel: Tuple[int, int], iterations: int = 1) -> np.ndarray:
+        """
+        Dilation of a cached transform with a rectangular kernel.
+
+        Args:
+            source: Name of the transform ('binary', 'edges', ...)
+            kernel: (width, height) of the rectangular structuring element
+            iterations: Dilation iterations
+
+        Returns:
+            Dilated mask (memoized per source, kernel and iterations)
+        """
+        def compute():
+            element = cv2.getStructuringElement(cv2.MORPH_RECT, kernel)
+            return cv2.dilate(getattr(self, source), element, iterations=iterations)
+
+        return self._memo(('dilate', source, tuple(kernel), iterations), compute)
+
+    # ------------------------------------------------------------------
+    # Quality statistics
+    # ------------------------------------------------------------------
+
+    @property
+    def laplacian_variance(self) -> float:
+        """Variance of the Laplacian (sharpness; low means blurry)."""
+        return float(self._memo(
+            ('laplacian_variance',),
+            lambda: np.float64(cv2.Laplacian(self.gray, cv2.CV_64F).var())
+        ))
+
+    @property
+    def contrast(self) -> float:
+        """Standard deviation of the grayscale page."""
+        return float(self._memo(('contrast',), lambda: np.float64(self.gray.std())))
+
+
+_pages: "OrderedDict[Tuple[str, int, int], PageAnalysis]" = OrderedDict()
+_pages_lock = threading.Lock()
+
+
+def _page_key(image_path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        path = Path(image_path).resolve()
+        stat = path.stat()
+    except OSError:
+        return None
+    return (str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def get_page_analysis(image_path: str) -> Optional[PageAnalysis]:
+    """
+    Shared PageAnalysis for a file (None if it cannot be loaded).
+
+    The same file (same size and mtime) returns the same object, so
+    transforms computed by one stage are reused by the next.
+    """
+    key = _page_key(image_path)
+    if key is None:
+        return None
+
+    with _pages_lock:
+        page = _pages.get(key)
+        if page is not None:
+            _pages.move_to_end(key)
+            return page
+
+    page = PageAnalysis.load(image_path)
+    if page is None or PAGE_ANALYSIS_CACHE_SIZE <= 0:
+        return page
+
+    with _pages_lock:
+        page = _pages.setdefault(key, page)
+        _pages.move_to_end(key)
+        while len(_pages) > PAGE_ANALYSIS_CACHE_SIZE:
+            _pages.popitem(last=False)
+    return page
+
+
+def release_page_analysis(image_path: str):
+    """Drop the cached analysis of a file (all versions)."""
+    try:
+        path = str(Path(image_path).resolve())
+    except OSError:
+        return
+    with _pages_lock:
+        for key in [key for key in _pages if key[0] == path]:
+            del _pages[key]
@@ -5,47 +5,89 @@ Handles: grayscale conversion, denoising, contrast enhancement, deskewing, resiz
 import cv2
 import numpy as np
 from pathlib import Path
+from typing import Collection, Dict, Optional, Tuple
 import tempfile
+import time
 from skimage import exposure
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Steps callers may skip (see preprocess_image_array)
+OPTIONAL_STEPS = ("denoise", "contrast", "deskew")
 
-def preprocess_image(image_path: str) -> str:
+
+def preprocess_image(
+    image_path: str,
+    output_dir: Optional[Path] = None,
+    image: Optional[np.ndarray] = None
+) -> str:
     """
     Preprocess notebook image for optimal OCR performance.
     
     Args:
         image_path: Path to input image (JPEG/PNG)
+        output_dir: Directory for the processed image (default: the shared
+            ocr_preprocessing temp directory); pass the request's scratch
+            directory so it is removed with the request
+        image: Already decoded image_path (skips reading the file again)
         
     Returns:
         Path to processed image (temporarily saved)
     """
+    processed_path, _ = preprocess_image_array(image_path, output_dir, image)
+    return processed_path
+
+
+def preprocess_image_array(
+    image_path: str,
+    output_dir: Optional[Path] = None,
+    image: Optional[np.ndarray] = None,
+    steps: Optional[Collection[str]] = None,
+    timings: Optional[Dict[str, float]] = None
+) -> Tuple[str, np.ndarray]:
+    """
+    Like preprocess_image, but also return the processed array as saved,
+    for callers that keep working on it in memory.
+
+    Args:
+        steps: Optional steps to run, a subset of OPTIONAL_STEPS (default:
+            all); grayscale conversion and resizing always run
+        timings: Filled with the milliseconds spent per step, if given
+    """
+    steps = OPTIONAL_STEPS if steps is None else steps
+
+    def run_step(name, func, value):
+        started = time.perf_counter()
+        result = func(value)
+        if timings is not None:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
     # Load image
-    img = cv2.imread(image_path)
+    img = image if image is not None else cv2.imread(image_path)
     if img is None:
         raise ValueError(f"Could not load image: {image_path}")
     
     # Step 1: Convert to grayscale
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
     
     # Step 2: Remove noise
-    denoised = _remove_noise(gray)
+    denoised = run_step("denoise", _remove_noise, gray) if "denoise" in steps else gray
     
     # Step 3: Increase contrast
-    contrasted = _increase_contrast(denoised)
+    contrasted = run_step("contrast", _increase_contrast, denoised) if "contrast" in steps else denoised
     
     # Step 4: Correct skew (deskew) - gracefully handle failures
-    deskewed = _deskew_image(contrasted)
+    deskewed = run_step("deskew", _deskew_image, contrasted) if "deskew" in steps else contrasted
     
     # Step 5: Resize to optimal OCR resolution (preserving aspect ratio)
-    resized = _resize_for_ocr(deskewed)
+    resized = _as_uint8(run_step("resize", _resize_for_ocr, deskewed))
     
     # Save processed image temporarily
-    processed_path = _save_temp_image(resized, image_path)
+    processed_path = _save_temp_image(resized, image_path, output_dir)
     
-    return processed_path
+    return processed_path, resized
 
 
 def _remove_noise(image: np.ndarray) -> np.ndarray:
@@ -233,7 +275,16 @@ def _resize_for_ocr(image: np.ndarray, target_dpi: int = 300) -> np.ndarray:
         return image
 
 
-def _save_temp_image(image: np.ndarray, original_path: str) -> str:
+def _as_uint8(image: np.ndarray) -> np.ndarray:
+    """Ensure image is uint8 (float images in [0, 1] are scaled)."""
+    if image.dtype == np.uint8:
+        return image
+    if image.max() <= 1.0:
+        return (image * 255).astype(np.uint8)
+    return image.astype(np.uint8)
+
+
+def _save_temp_image(image: np.ndarray, original_path: str, output_dir: Optional[Path] = None) -> str:
     """
     Save processed image to temporary file.
     Preserves original filename with '_processed' suffix.
@@ -243,15 +294,10 @@ def _save_temp_image(image: np.ndarray, original_path: str) -> str:
         if image is None or image.size == 0:
             raise ValueError("Invalid image to save")
         
-        # Ensure image is uint8
-        if image.dtype != np.uint8:
-            if image.max() <= 1.0:
-                image = (image * 255).astype(np.uint8)
-            else:
-                image = image.astype(np.uint8)
+        image = _as_uint8(image)
         
         original_path_obj = Path(original_path)
-        temp_dir = Path(tempfile.gettempdir()) / "ocr_preprocessing"
+        temp_dir = Path(output_dir) if output_dir else Path(tempfile.gettempdir()) / "ocr_preprocessing"
         temp_dir.mkdir(exist_ok=True, parents=True)
         
         # Create processed filename
@@ -0,0 +1,356 @@
+"""
+Reading-order sorting for detected layout regions.
+
+The previous sorter grouped regions into rows with a fixed 30-pixel
+threshold and recomputed the row mean for every region (quadratic in the
+row size). Two-column notes came out interleaved line by line.
+
+This module uses a recursive XY-cut on interval coverage:
+- SECTIONS: a block without a page-high gutter is cut at horizontal gaps
+  into sections whose lines share the same gutters (e.g. a one-column
+  introduction above two-column notes).
+- COLUMNS: an x-coverage sweep over the block's regions finds gutters
+  (x ranges no region covers). A few wide regions (titles, full-width
+  equations) may cross a gutter; they become "spanners".
+- SEGMENTS: spanners cut the block vertically. Content between two
+  spanners is read column by column, then the spanner, then the next
+  segment.
+- ROWS: blocks without gutters are ordered by a sweep line over region
+  centres with a running row mean (O(1) per region) and a tolerance
+  derived from line height instead of a fixed pixel count.
+
+Every step is a sort plus linear sweeps, so a page is O(n log n) per
+recursion level and scales to thousands of regions.
+
+CONFIGURATION (environment variables):
+- READING_ORDER_MIN_GUTTER: minimum gutter width in pixels (default 20);
+  the effective minimum is max(this, 1.5 x median region height)
+"""
+import os
+import bisect
+import logging
+from typing import Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIN_GUTTER = int(os.getenv("READING_ORDER_MIN_GUTTER", "20"))
+
+# A gutter may be crossed by at most this fraction of the block's peak
+# x coverage (and of its regions)
+MAX_SPANNER_RATIO = 0.25
+
+# Each column must hold at least this many regions to count as a column
+MIN_COLUMN_REGIONS = 3
+
+# Gutters must be at least this many median line heights wide; word gaps
+# left after the 40px dilation are usually about one line height
+GUTTER_HEIGHT_RATIO = 1.5
+
+# Regions join a row if their centre is within this fraction of the
+# (row or region) height from the row's mean centre
+ROW_TOLERANCE = 0.5
+
+# A vertical gap this many times the median line spacing ends a section
+SECTION_GAP_RATIO = 2.0
+
+MAX_DEPTH = 8
+
+# Only the widest low-coverage runs are tried as gutters
+MAX_GUTTER_CANDIDATES = 8
+
+Box = Tuple[float, float, float, float]
+
+
+def sort_reading_order(regions: List[Dict]) -> List[Dict]:
+    """
+    Sort region dictionaries into reading order.
+
+    Args:
+        regions: Regions with 'bbox' as (x1, y1, x2, y2)
+
+    Returns:
+        New list with the same region dictionaries in reading order
+    """
+    if not regions:
+        return []
+    boxes = [tuple(float(v) for v in region['bbox']) for region in regions]
+    order = reading_order(boxes)
+    return [regions[i] for i in order]
+
+
+def reading_order(boxes: Sequence[Box]) -> List[int]:
+    """
+    Compute reading order for (x1, y1, x2, y2) boxes.
+
+    Returns:
+        Indices into boxes in reading order
+    """
+    if not boxes:
+        return []
+    order: List[int] = []
+    _order_block(boxes, list(range(len(boxes))), order, 0)
+    return order
+
+
+def _order_block(boxes: Sequence[Box], indices: List[int], out: List[int], depth: int) -> None:
+    """Append the reading order of one block of regions to out."""
+    if len(indices) < 2 * MIN_COLUMN_REGIONS or depth >= MAX_DEPTH:
+        out.extend(_order_rows(boxes, indices))
+        return
+
+    split = _find_columns(boxes, indices)
+    if split is None:
+        # No gutter across the whole block: cut it into sections with
+        # different column structure and order each section on its own
+        sections = _find_sections(boxes, indices)
+        if len(sections) == 1:
+            out.extend(_order_rows(boxes, indices))
+            return
+        for section in sections:
+            _order_block(boxes, section, out, depth + 1)
+        return
+
+    gutters, spanners = split
+    spanner_set = set(spanners)
+    spanners.sort(key=lambda i: (boxes[i][1], boxes[i][0]))
+    spanner_centres = [(boxes[i][1] + boxes[i][3]) / 2 for i in spanners]
+    gutter_centres = [(a + b) / 2 for a, b in gutters]
+
+    # segments[s][c]: regions above spanner s (or after the last), in column c
+    segments = [[[] for _ in range(len(gutters) + 1)] for _ in range(len(spanners) + 1)]
+    for i in indices:
+        if i in spanner_set:
+            continue
+        x1, y1, x2, y2 = boxes[i]
+        s = bisect.bisect_left(spanner_centres, (y1 + y2) / 2)
+        c = bisect.bisect_left(gutter_centres, (x1 + x2) / 2)
+        segments[s][c].append(i)
+
+    for s, columns in enumerate(segments):
+        for column in columns:
+            if column:
+                _order_block(boxes, column, out, depth + 1)
+        if s < len(spanners):
+            out.append(spanners[s])
+
+
+def _find_columns(boxes: Sequence[Box], indices: List[int]):
+    """
+    Find column gutters in a block.
+
+    Sweeps the sorted x endpoints into elementary segments with a coverage
+    count. A low-coverage run (at most the spanner allowance) is a gutter
+    if its minimum-coverage stretch is interior and at least the minimum
+    gutter wide; regions covering that stretch are spanners. Using the
+    minimum stretch keeps the ragged ends of a column's lines out of the
+    gutter.
+
+    Returns:
+        (gutters, spanners) with gutters as sorted (x_start, x_end), or
+        None if the block is a single column
+    """
+    heights = sorted(boxes[i][3] - boxes[i][1] for i in indices)
+    min_gutter = max(MIN_GUTTER, GUTTER_HEIGHT_RATIO * heights[len(heights) // 2])
+
+    events = []
+    for i in indices:
+        events.append((boxes[i][0], 1))
+        events.append((boxes[i][2], -1))
+    events.sort()
+
+    # Elementary segments (x_start, x_end, coverage) between distinct x
+    segments = []
+    coverage = 0
+    for k, (x, delta) in enumerate(events):
+        coverage += delta
+        if k + 1 < len(events) and events[k + 1][0] > x:
+            segments.append((x, events[k + 1][0], coverage))
+    if not segments:
+        return None
+
+    peak = max(c for _, _, c in segments)
+    allowance = int(peak * MAX_SPANNER_RATIO)
+
+    candidates = []
+    run: List[Tuple[float, float, int]] = []
+    for segment in segments + [(segments[-1][1], segments[-1][1], peak + 1)]:
+        if segment[2] <= allowance:
+            run.append(segment)
+            continue
+        # Interior runs only: the first segment starts at the block's left
+        # edge, the sentinel closes the run at the right edge
+        if run and run[0][0] > segments[0][0] and segment[0] < segments[-1][1]:
+            gutter = _widest_minimum(run)
+            if gutter[1] - gutter[0] >= min_gutter:
+                candidates.append(gutter)
+        run = []
+
+    if not candidates:
+        return None
+
+    # Keep the widest gutters whose columns all hold enough regions
+    candidates.sort(key=lambda g: g[0] - g[1])
+    candidates = candidates[:MAX_GUTTER_CANDIDATES]
+    gutters: List[Tuple[float, float]] = []
+    spanners = set()
+    for gutter in candidates:
+        crossing = {i for i in indices if boxes[i][0] < gutter[1] and boxes[i][2] > gutter[0]}
+        if len(spanners | crossing) > len(indices) * MAX_SPANNER_RATIO:
+            continue
+        trial = sorted(gutters + [gutter])
+        if _column_sizes_ok(boxes, indices, trial, spanners | crossing):
+            gutters = trial
+            spanners |= crossing
+
+    if not gutters:
+        return None
+    return gutters, list(spanners)
+
+
+def _widest_minimum(run: List[Tuple[float, float, int]]) -> Tuple[float, float]:
+    """Widest contiguous stretch of a run at the run's minimum coverage."""
+    minimum = min(c for _, _, c in run)
+    best = (0.0, 0.0)
+    start = None
+    for x1, x2, c in run + [(run[-1][1], run[-1][1], minimum + 1)]:
+        if c == minimum:
+            if start is None:
+                start = x1
+            end = x2
+        elif start is not None:
+            if end - start > best[1] - best[0]:
+                best = (start, end)
+            start = None
+    return best
+
+
+def _find_sections(boxes: Sequence[Box], indices: List[int]) -> List[List[int]]:
+    """
+    Cut a block at horizontal gaps into sections of consistent columns.
+
+    The block is first cut into bands (maximal runs of vertically
+    overlapping regions). Consecutive bands stay in one section while at
+    least one of the section's gutters stays free; a band crossing all of
+    them, or one after a gap much larger than the line spacing, starts a
+    new section. Two-column text therefore stays together even though its
+    lines are separated by gaps, while a one-column paragraph above it
+    becomes a section of its own.
+    """
+    heights = sorted(boxes[i][3] - boxes[i][1] for i in indices)
+    min_gutter = max(MIN_GUTTER, GUTTER_HEIGHT_RATIO * heights[len(heights) // 2])
+
+    bands: List[List[int]] = []
+    band_tops: List[float] = []
+    band_bottoms: List[float] = []
+    for i in sorted(indices, key=lambda j: boxes[j][1]):
+        if bands and boxes[i][1] < band_bottoms[-1]:
+            bands[-1].append(i)
+            band_bottoms[-1] = max(band_bottoms[-1], boxes[i][3])
+        else:
+            bands.append([i])
+            band_tops.append(boxes[i][1])
+            band_bottoms.append(boxes[i][3])
+
+    # Gaps clearly larger than the usual line spacing also end a section
+    spacing = sorted(band_tops[k] - band_bottoms[k - 1] for k in range(1, len(bands)))
+    max_spacing = SECTION_GAP_RATIO * spacing[len(spacing) // 2] if spacing else 0.0
+
+    sections: List[List[int]] = []
+    shared: List[Tuple[float, float]] = []
+    for k, band in enumerate(bands):
+        gaps = _x_gaps(boxes, band, min_gutter)
+        if sections and (shared or not gaps) and band_tops[k] - band_bottoms[k - 1] <= max_spacing:
+            # Join while some shared gutter stays free (a band with a line
+            # in one column only keeps all of them free)
+            common = _intersect_gaps(shared, _x_gaps(boxes, band, min_gutter, outer=True), min_gutter)
+            if common or not shared:
+                sections[-1].extend(band)
+                shared = common
+                continue
+        sections.append(list(band))
+        shared = gaps
+    return sections
+
+
+def _x_gaps(
+    boxes: Sequence[Box],
+    band: List[int],
+    min_gutter: float,
+    outer: bool = False
+) -> List[Tuple[float, float]]:
+    """
+    X gaps of at least min_gutter between a band's regions.
+
+    With outer=True the free space left and right of the band is included.
+    """
+    gaps = []
+    reach = None
+    for i in sorted(band, key=lambda j: boxes[j][0]):
+        x1, x2 = boxes[i][0], boxes[i][2]
+        if reach is None:
+            if outer:
+                gaps.append((float('-inf'), x1))
+        elif x1 - reach >= min_gutter:
+            gaps.append((reach, x1))
+        reach = x2 if reach is None else max(reach, x2)
+    if outer:
+        gaps.append((reach, float('inf')))
+    return gaps
+
+
+def _intersect_gaps(a: List[Tuple[float, float]], b: List[Tuple[float, float]], min_width: float) -> List[Tuple[float, float]]:
+    """Intersect two sorted gap lists, keeping overlaps of at least min_width."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if end - start >= min_width:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _column_sizes_ok(boxes, indices, gutters, spanners) -> bool:
+    """Check that every column between gutters holds enough regions."""
+    centres = [(a + b) / 2 for a, b in gutters]
+    counts = [0] * (len(gutters) + 1)
+    for i in indices:
+        if i not in spanners:
+            counts[bisect.bisect_left(centres, (boxes[i][0] + boxes[i][2]) / 2)] += 1
+    return min(counts) >= MIN_COLUMN_REGIONS
+
+
+def _order_rows(boxes: Sequence[Box], indices: List[int]) -> List[int]:
+    """
+    Group regions into rows with a sweep over vertical centres, then read
+    each row left to right.
+    """
+    by_centre = sorted(indices, key=lambda i: (boxes[i][1] + boxes[i][3]) / 2)
+    order: List[int] = []
+    row: List[int] = []
+    centre_sum = 0.0
+    height_sum = 0.0
+
+    for i in by_centre:
+        x1, y1, x2, y2 = boxes[i]
+        centre = (y1 + y2) / 2
+        height = y2 - y1
+        if row:
+            mean_centre = centre_sum / len(row)
+            mean_height = height_sum / len(row)
+            if abs(centre - mean_centre) < ROW_TOLERANCE * max(mean_height, height):
+                row.append(i)
+                centre_sum += centre
+                height_sum += height
+                continue
+            order.extend(sorted(row, key=lambda j: boxes[j][0]))
+        row = [i]
+        centre_sum = centre
+        height_sum = height
+
+    order.extend(sorted(row, key=lambda j: boxes[j][0]))
+    return order
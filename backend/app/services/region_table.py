@@ -0,0 +1,222 @@
+"""
+Compact columnar container for layout regions.
+
+Layout regions used to travel through detect_layout, convert.py and the
+agent as one Python dict per region with redundant keys (bbox, x, y,
+width, height, area, aspect_ratio). Pages with thousands of components
+allocated thousands of dicts and serialized slowly.
+
+RegionTable stores only two NumPy columns:
+- bbox: (n, 4) int32 array of x1, y1, x2, y2
+- type_codes: (n,) uint8 index into REGION_TYPES
+
+Everything else (x, y, width, height, area, aspect ratio) is derived on
+demand as vectorized views. Filtering, sorting and IoU queries operate on
+whole columns. to_json() formats all rows in one call without building
+per-region dicts.
+
+COMPATIBILITY:
+- len(table), bool(table) and iteration behave like the old list; iterating
+  yields {"type": ..., "bbox": [x1, y1, x2, y2]} dicts, so consumers such as
+  document_builder keep working
+- to_list() returns the same list of dicts detect_layout used to return
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.services.reading_order import reading_order
+
+REGION_TYPES = ('paragraph', 'heading', 'equation', 'diagram')
+_TYPE_CODES = {name: code for code, name in enumerate(REGION_TYPES)}
+
+_JSON_ROW = '{"type":"%s","bbox":[%d,%d,%d,%d]}'
+
+
+def type_code(name: str) -> int:
+    """Return the code of a region type name (unknown types map to paragraph)."""
+    return _TYPE_CODES.get(name, 0)
+
+
+class RegionTable:
+    """
+    Layout regions stored as NumPy columns.
+    """
+
+    __slots__ = ('bbox', 'type_codes')
+
+    def __init__(self, bbox: Optional[np.ndarray] = None, type_codes: Optional[np.ndarray] = None):
+        """
+        Initialize region table.
+
+        Args:
+            bbox: (n, 4) array of x1, y1, x2, y2
+            type_codes: (n,) array of REGION_TYPES indices (default paragraph)
+        """
+        self.bbox = np.asarray(bbox if bbox is not None else [], dtype=np.int32).reshape(-1, 4)
+        if type_codes is None:
+            type_codes = np.zeros(len(self.bbox), dtype=np.uint8)
+        self.type_codes = np.asarray(type_codes, dtype=np.uint8).reshape(-1)
+        if len(self.type_codes) != len(self.bbox):
+            raise ValueError(f"RegionTable: {len(self.bbox)} boxes but {len(self.type_codes)} types")
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_regions(cls, regions: Iterable[Dict[str, Any]]) -> "RegionTable":
+        """Build a table from region dicts with 'bbox' (x1, y1, x2, y2) and 'type'."""
+        regions = list(regions)
+        bbox = [region['bbox'] for region in regions]
+        codes = [type_code(region.get('type', 'paragraph')) for region in regions]
+        return cls(bbox, codes)
+
+    @classmethod
+    def full_page(cls, width: int, height: int, region_type: str = 'paragraph') -> "RegionTable":
+        """Single region covering the whole page (OCR fallback)."""
+        return cls([[0, 0, int(width), int(height)]], [type_code(region_type)])
+
+    @classmethod
+    def concat(cls, tables: Sequence["RegionTable"]) -> "RegionTable":
+        """Concatenate tables row-wise."""
+        if not tables:
+            return cls()
+        return cls(
+            np.concatenate([table.bbox for table in tables]),
+            np.concatenate([table.type_codes for table in tables])
+        )
+
+    # ------------------------------------------------------------------
+    # Derived columns (vectorized)
+    # ------------------------------------------------------------------
+
+    @property
+    def x1(self) -> np.ndarray:
+        return self.bbox[:, 0]
+
+    @property
+    def y1(self) -> np.ndarray:
+        return self.bbox[:, 1]
+
+    @property
+    def x2(self) -> np.ndarray:
+        return self.bbox[:, 2]
+
+    @property
+    def y2(self) -> np.ndarray:
+        return self.bbox[:, 3]
+
+    @property
+    def width(self) -> np.ndarray:
+        return self.bbox[:, 2] - self.bbox[:, 0]
+
+    @property
+    def height(self) -> np.ndarray:
+        return self.bbox[:, 3] - self.bbox[:, 1]
+
+    @property
+    def area(self) -> np.ndarray:
+        return self.width.astype(np.int64) * self.height
+
+    @property
+    def aspect_ratio(self) -> np.ndarray:
+        height = self.height
+        return np.divide(self.width, height, out=np.zeros(len(self), dtype=np.float64), where=height > 0)
+
+    @property
+    def types(self) -> List[str]:
+        return [REGION_TYPES[code] for code in self.type_codes]
+
+    # ------------------------------------------------------------------
+    # Sequence protocol
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.bbox)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_list())
+
+    def __getitem__(self, index: Union[int, slice, np.ndarray, List[int]]):
+        """
+        table[i] returns a region dict; slices, index arrays and boolean
+        masks return a new RegionTable.
+        """
+        if isinstance(index, (int, np.integer)):
+            x1, y1, x2, y2 = self.bbox[index].tolist()
+            return {"type": REGION_TYPES[self.type_codes[index]], "bbox": [x1, y1, x2, y2]}
+        return RegionTable(self.bbox[index], self.type_codes[index])
+
+    def __repr__(self) -> str:
+        counts = {name: int(np.count_nonzero(self.type_codes == code)) for code, name in enumerate(REGION_TYPES)}
+        return f"RegionTable({len(self)} regions, {counts})"
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def filter(self, mask: np.ndarray) -> "RegionTable":
+        """Rows where mask is True."""
+        return self[np.asarray(mask, dtype=bool)]
+
+    def of_type(self, *names: str) -> "RegionTable":
+        """Rows with one of the given types."""
+        return self.filter(np.isin(self.type_codes, [type_code(name) for name in names]))
+
+    def sort_by(self, column: str, descending: bool = False) -> "RegionTable":
+        """Stable sort by a column ('x1', 'y1', 'area', ...)."""
+        order = np.argsort(getattr(self, column), kind='stable')
+        return self[order[::-1] if descending else order]
+
+    def sort_reading_order(self) -> "RegionTable":
+        """Rows in reading order (see reading_order.py)."""
+        if len(self) == 0:
+            return self
+        return self[np.asarray(reading_order(self.bbox.tolist()), dtype=np.intp)]
+
+    def iou(self, box: Sequence[int]) -> np.ndarray:
+        """IoU of every row with one (x1, y1, x2, y2) box."""
+        return self.iou_matrix(RegionTable([box]))[:, 0]
+
+    def iou_matrix(self, other: Optional["RegionTable"] = None) -> np.ndarray:
+        """
+        Pairwise IoU between the rows of this table and another (or itself).
+
+        Returns:
+            (len(self), len(other)) float array
+        """
+        other = self if other is None else other
+        a = self.bbox.astype(np.int64)[:, None, :]
+        b = other.bbox.astype(np.int64)[None, :, :]
+        inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+        inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+        inter = inter_w * inter_h
+        union = self.area[:, None] + other.area[None, :] - inter
+        return np.divide(inter, union, out=np.zeros(inter.shape, dtype=np.float64), where=union > 0)
+
+    def overlapping(self, box: Sequence[int], min_iou: float = 0.0) -> "RegionTable":
+        """Rows whose IoU with box exceeds min_iou."""
+        return self.filter(self.iou(box) > min_iou)
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        """Regions as [{"type": ..., "bbox": [x1, y1, x2, y2]}, ...]."""
+        types = self.types
+        return [{"type": t, "bbox": b} for t, b in zip(types, self.bbox.tolist())]
+
+    def to_json(self) -> str:
+        """
+        JSON array of the regions, formatted in a single call straight from
+        the columns (no intermediate dicts).
+        """
+        n = len(self)
+        if n == 0:
+            return "[]"
+        values = np.empty((n, 5), dtype=object)
+        values[:, 0] = np.asarray(REGION_TYPES, dtype=object)[self.type_codes]
+        values[:, 1:] = self.bbox
+        return "[" + ",".join([_JSON_ROW] * n) % tuple(values.ravel().tolist()) + "]"
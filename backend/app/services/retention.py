@@ -0,0 +1,338 @@
+"""
+Retention and garbage collection for uploads/, outputs/, preprocessing
+scratch files and documents and agent reports published to local/shared
+storage.
+
+Nothing used to delete generated .docx files, diagram crops,
+agent_original_* copies or /tmp/ocr_preprocessing/*_processed.png files
+left behind by crashed requests, so on a long-running node the
+directories grew until the disk filled.
+
+This module provides:
+1. Per-request scratch directories (uploads/.scratch/<id>): every upload
+   and intermediate image of a request lives there. remove_scratch_dir()
+   renames the directory to *.trash first (atomic), then deletes it, so a
+   half-deleted directory is never mistaken for a live one.
+2. sweep(): TTL eviction (files older than RETENTION_TTL_HOURS), then
+   quota eviction (oldest first until each root is under
+   RETENTION_MAX_BYTES). Files younger than RETENTION_MIN_AGE_SECONDS are
+   never evicted, so in-flight requests keep their files. The quota pass
+   also skips live scratch directories (a long agent run can outlast the
+   grace period) and the reference-counted outputs/diagrams store; both
+   still expire by TTL.
+3. A background task (start_retention_task) running sweep() every
+   RETENTION_INTERVAL_SECONDS in a worker thread.
+4. Metrics: bytes and files reclaimed, per sweep and in total
+   (get_retention_metrics, served at /metrics/retention).
+
+CONFIGURATION (environment variables):
+- RETENTION_ENABLED: Run the background task (default: true)
+- RETENTION_TTL_HOURS: Maximum file age (default: 24)
+- RETENTION_MAX_BYTES: Quota per root directory (default: 2 GiB)
+- RETENTION_MIN_AGE_SECONDS: Grace period for fresh files (default: 600)
+- RETENTION_INTERVAL_SECONDS: Time between sweeps (default: 600)
+"""
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+RETENTION_TTL_HOURS = float(os.getenv("RETENTION_TTL_HOURS", "24"))
+RETENTION_MAX_BYTES = int(os.getenv("RETENTION_MAX_BYTES", str(2 * 1024 ** 3)))
+RETENTION_MIN_AGE_SECONDS = float(os.getenv("RETENTION_MIN_AGE_SECONDS", "600"))
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "600"))
+
+SCRATCH_DIRNAME = ".scratch"
+TRASH_SUFFIX = ".trash"
+# DiagramStore directory under outputs/ (crops are deleted by release())
+DIAGRAMS_DIRNAME = "diagrams"
+
+# Bookkeeping files that must survive sweeps
+PROTECTED_NAMES = {"refs.json"}
+
+# Where preprocess_image used to write when not given a scratch directory
+PREPROCESSING_TMP_DIR = Path(tempfile.gettempdir()) / "ocr_preprocessing"
+
+
+# ----------------------------------------------------------------------
+# Per-request scratch directories
+# ----------------------------------------------------------------------
+
+def create_scratch_dir(uploads_dir: Path, prefix: str = "req") -> Path:
+    """
+    Create a private scratch directory for one request.
+
+    Args:
+        uploads_dir: Uploads directory (scratch dirs live in uploads/.scratch)
+        prefix: Name prefix, for log readability
+
+    Returns:
+        Path of the new directory
+    """
+    scratch = Path(uploads_dir) / SCRATCH_DIRNAME / f"{prefix}_{uuid.uuid4().hex}"
+    scratch.mkdir(parents=True)
+    return scratch
+
+
+def remove_scratch_dir(scratch: Optional[Path]) -> int:
+    """
+    Remove a scratch directory: rename it out of the way, then delete it.
+
+    Returns:
+        Bytes reclaimed
+    """
+    if scratch is None or not Path(scratch).exists():
+        return 0
+    trash = Path(str(scratch) + TRASH_SUFFIX)
+    try:
+        os.replace(scratch, trash)
+    except OSError as e:
+        logger.warning(f"⚠️  Could not move scratch dir {scratch}: {e}")
+        trash = Path(scratch)
+    size, count = _tree_size(trash)
+    shutil.rmtree(trash, ignore_errors=True)
+    _metrics.record(size, count, scratch=True)
+    return size
+
+
+# ----------------------------------------------------------------------
+# Sweeps
+# ----------------------------------------------------------------------
+
+class RetentionMetrics:
+    """Counters for reclaimed space (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.bytes_reclaimed_total = 0
+        self.files_removed_total = 0
+        self.scratch_dirs_removed_total = 0
+        self.last_sweep: Dict[str, Any] = {}
+
+    def record(self, bytes_reclaimed: int, files_removed: int, scratch: bool = False):
+        with self._lock:
+            self.bytes_reclaimed_total += bytes_reclaimed
+            self.files_removed_total += files_removed
+            if scratch:
+                self.scratch_dirs_removed_total += 1
+
+    def record_sweep(self, report: Dict[str, Any]):
+        with self._lock:
+            self.sweeps += 1
+            self.last_sweep = report
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sweeps": self.sweeps,
+                "bytes_reclaimed_total": self.bytes_reclaimed_total,
+                "files_removed_total": self.files_removed_total,
+                "scratch_dirs_removed_total": self.scratch_dirs_removed_total,
+                "last_sweep": dict(self.last_sweep),
+            }
+
+
+_metrics = RetentionMetrics()
+
+
+def get_retention_metrics() -> Dict[str, Any]:
+    """Retention counters and the last sweep report."""
+    return _metrics.snapshot()
+
+
+def sweep(
+    roots: List[Path],
+    ttl_seconds: float = RETENTION_TTL_HOURS * 3600,
+    max_bytes: int = RETENTION_MAX_BYTES,
+    min_age_seconds: float = RETENTION_MIN_AGE_SECONDS,
+    now: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Evict expired files, then the oldest files of roots over quota.
+
+    Args:
+        roots: Directories to sweep (each gets its own quota)
+        ttl_seconds: Files older than this are deleted
+        max_bytes: Per-root quota
+        min_age_seconds: Files younger than this are never deleted
+        now: Current time (for tests)
+
+    Returns:
+        Report with bytes/files reclaimed per root and in total
+    """
+    started = time.time()
+    now = now if now is not None else started
+    report: Dict[str, Any] = {"roots": {}, "bytes_reclaimed": 0, "files_removed": 0}
+
+    for root in roots:
+        root = Path(root)
+        if not root.is_dir():
+            continue
+        files = _list_files(root)
+        kept: List[Tuple[float, int, Path]] = []
+        reclaimed = removed = 0
+
+        # 1. TTL
+        for mtime, size, path in files:
+            age = now - mtime
+            if age > ttl_seconds and age > min_age_seconds and _unlink(path):
+                reclaimed += size
+                removed += 1
+            else:
+                kept.append((mtime, size, path))
+
+        # 2. Quota, oldest first
+        total = sum(size for _, size, _ in kept)
+        if total > max_bytes:
+            for mtime, size, path in sorted(kept, key=lambda item: item[0]):
+                if total <= max_bytes:
+                    break
+                if now - mtime <= min_age_seconds or _quota_exempt(root, path):
+                    continue
+                if _unlink(path):
+                    total -= size
+                    reclaimed += size
+                    removed += 1
+
+        _remove_empty_dirs(root, now, min_age_seconds)
+        report["roots"][str(root)] = {"bytes_reclaimed": reclaimed, "files_removed": removed, "bytes_kept": total}
+        report["bytes_reclaimed"] += reclaimed
+        report["files_removed"] += removed
+
+    report["finished_at"] = time.time()
+    report["duration_ms"] = round((report["finished_at"] - started) * 1000, 1)
+    _metrics.record(report["bytes_reclaimed"], report["files_removed"])
+    _metrics.record_sweep(report)
+    if report["files_removed"]:
+        logger.info(
+            f"🧹 Retention sweep reclaimed {report['bytes_reclaimed'] / 1024 ** 2:.1f} MiB "
+            f"({report['files_removed']} files) in {report['duration_ms']}ms"
+        )
+    return report
+
+
+def default_roots() -> List[Path]:
+    """
+    uploads/, outputs/, the preprocessing temp directory and the published
+    documents and agent reports of a local or shared storage root
+    (STORAGE_ROOT).
+
+    S3 storage is not swept: expire its objects with a bucket lifecycle rule.
+    """
+    from app.services.storage import LocalStorage, get_storage
+    from app.utils.file_manager import FileManager
+    file_manager = FileManager()
+    roots = [file_manager.get_uploads_dir(), file_manager.get_outputs_dir(), PREPROCESSING_TMP_DIR]
+    try:
+        storage = get_storage()
+    except Exception as e:
+        logger.warning(f"⚠️  Retention cannot sweep document storage: {e}")
+        storage = None
+    if isinstance(storage, LocalStorage):
+        roots.extend([storage.root / "outputs", storage.root / "reports"])
+
+    # Without STORAGE_ROOT, storage outputs/ is the local outputs/ directory
+    unique: List[Path] = []
+    for root in roots:
+        if Path(root).resolve() not in {Path(seen).resolve() for seen in unique}:
+            unique.append(Path(root))
+    return unique
+
+
+async def retention_loop(interval_seconds: float = RETENTION_INTERVAL_SECONDS):
+    """Run sweep() forever in a worker thread, every interval_seconds."""
+    roots = default_roots()
+    while True:
+        try:
+            await asyncio.to_thread(sweep, roots)
+        except Exception as e:
+            logger.warning(f"⚠️  Retention sweep failed: {e}")
+        await asyncio.sleep(interval_seconds)
+
+
+def start_retention_task() -> Optional[asyncio.Task]:
+    """Start the background sweep task (None if disabled)."""
+    if not RETENTION_ENABLED:
+        logger.info("Retention sweeps disabled (RETENTION_ENABLED=false)")
+        return None
+    logger.info(
+        f"🧹 Retention: TTL {RETENTION_TTL_HOURS}h, quota {RETENTION_MAX_BYTES / 1024 ** 3:.1f} GiB per directory, "
+        f"every {RETENTION_INTERVAL_SECONDS:.0f}s"
+    )
+    return asyncio.create_task(retention_loop())
+
+
+# ----------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------
+
+def _list_files(root: Path) -> List[Tuple[float, int, Path]]:
+    """(mtime, size, path) of every regular file under root."""
+    files = []
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False) and entry.name not in PROTECTED_NAMES:
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((stat.st_mtime, stat.st_size, Path(entry.path)))
+            except OSError:
+                continue
+    return files
+
+
+def _quota_exempt(root: Path, path: Path) -> bool:
+    """Files in a live scratch directory or the diagram store."""
+    parts = path.relative_to(root).parts
+    if parts[0] == DIAGRAMS_DIRNAME:
+        return True
+    if SCRATCH_DIRNAME in parts[:-1]:
+        scratch = parts[parts.index(SCRATCH_DIRNAME) + 1]
+        return scratch != parts[-1] and not scratch.endswith(TRASH_SUFFIX)
+    return False
+
+
+def _tree_size(root: Path) -> Tuple[int, int]:
+    files = _list_files(root)
+    return sum(size for _, size, _ in files), len(files)
+
+
+def _unlink(path: Path) -> bool:
+    try:
+        path.unlink()
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.debug(f"   Could not delete {path}: {e}")
+        return False
+
+
+def _remove_empty_dirs(root: Path, now: float, min_age_seconds: float):
+    """Delete empty subdirectories (deepest first) past the grace period."""
+    for directory, _, _ in sorted(os.walk(root), key=lambda item: -item[0].count(os.sep)):
+        path = Path(directory)
+        if path == root:
+            continue
+        try:
+            if now - path.stat().st_mtime > min_age_seconds:
+                path.rmdir()
+        except OSError:
+            pass
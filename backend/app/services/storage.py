@@ -0,0 +1,359 @@
+"""
+Pluggable storage for generated documents.
+
+Documents used to live only in the local outputs/ directory and
+/api/download/{filename} served straight from it, so with several replicas
+a document generated on one node could not be downloaded from another
+without sticky sessions.
+
+StorageBackend is the seam: convert.py and agent_convert.py publish every
+generated document under a key (outputs/<filename>), and download.py reads
+it back through the same backend, streaming in chunks with optional byte
+ranges. Agent confidence reports are published the same way
+(reports/<session_id>.json) and served by /api/agent/reports/{session_id}.
+
+Backends:
+- local: files under STORAGE_ROOT (default: the backend directory, so
+  outputs/<filename> is the existing outputs/ folder and publishing is a
+  no-op)
+- shared: identical to local, with STORAGE_ROOT pointing at a volume
+  mounted on every replica (NFS, EFS, ...)
+- s3: any S3-compatible object store (AWS S3, MinIO, ...), via boto3.
+  Retention (retention.py) only sweeps local and shared roots: expire S3
+  objects (outputs/ and reports/) with a bucket lifecycle rule
+
+Local backends expose local_path so the download route can hand the file
+to the server's zero-copy sendfile path; S3 objects are streamed.
+
+Every object carries the SHA-256 of its content (StoredObject.etag), used
+as the strong ETag for conditional downloads: local backends hash once per
+(path, size, mtime) and remember it; S3 objects carry it as metadata set
+at upload.
+
+Request scratch files (uploads, preprocessed images) stay on local disk:
+they never outlive the request (see retention.py).
+
+CONFIGURATION (environment variables):
+- STORAGE_BACKEND: local, shared or s3 (default: local)
+- STORAGE_ROOT: Root directory for local/shared (default: backend dir)
+- STORAGE_CHUNK_SIZE: Streaming chunk size in bytes (default: 1 MiB)
+- S3_BUCKET, S3_PREFIX (default: empty), S3_ENDPOINT_URL (e.g. a MinIO
+  server), S3_REGION; credentials come from the usual AWS variables
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_ROOT = os.getenv("STORAGE_ROOT")
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", str(1024 * 1024)))
+
+# Content hashes remembered by local backends (one entry per document version)
+HASH_CACHE_SIZE = 4096
+
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+@dataclass
+class StoredObject:
+    """Metadata of a stored object."""
+    key: str
+    size: int
+    modified: float              # Unix timestamp
+    content_type: str
+    local_path: Optional[Path] = None
+    etag: Optional[str] = None   # SHA-256 of the content (hex)
+
+
+def output_key(filename: str) -> str:
+    """Storage key of a generated document."""
+    return f"outputs/{Path(filename).name}"
+
+
+def report_key(session_id: str) -> str:
+    """Storage key of an agent session's latest confidence report."""
+    # Client-supplied session ids are hashed unless they are a plain token
+    if not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", session_id):
+        session_id = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+    return f"reports/{session_id}.json"
+
+
+def _hash_stream(stream: BinaryIO, chunk_size: int = STORAGE_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _guess_type(key: str) -> str:
+    if key.endswith(".docx"):
+        return DOCX_MEDIA_TYPE
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class StorageBackend(ABC):
+    """
+    Interface of a storage backend. Keys are '/'-separated relative paths.
+
+    Abstract: a backend missing any method fails when it is constructed.
+    """
+
+    @abstractmethod
+    def put_file(self, key: str, source: Path, content_type: Optional[str] = None) -> StoredObject:
+        """Store a local file under key (streamed, never read whole)."""
+
+    @abstractmethod
+    def put_stream(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> StoredObject:
+        """Store the contents of a readable binary stream under key."""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredObject]:
+        """Metadata of key, or None if it does not exist."""
+
+    @abstractmethod
+    def open_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Stream bytes [start, end] (inclusive, like HTTP ranges) of key.
+
+        Args:
+            key: Object key
+            start: First byte
+            end: Last byte (default: end of object)
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Delete key if it exists."""
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files under a root directory (local disk or a shared volume).
+    """
+
+    def __init__(self, root: Path, chunk_size: int = STORAGE_CHUNK_SIZE):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self._hashes: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._hash_lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put_file(self, key: str, source: Path, content_type: Optional[str] = None) -> StoredObject:
+        target = self._path(key)
+        if Path(source).resolve() != target:
+            with open(source, 'rb') as stream:
+                return self.put_stream(key, stream, content_type)
+        return self.stat(key)
+
+    def put_stream(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> StoredObject:
+        target = self._path(key)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename: readers on other replicas never see a partial file
+        tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex}.tmp")
+        digest = hashlib.sha256()
+        try:
+            with open(tmp, 'wb') as out:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+            os.replace(tmp, target)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        # Hashed while copying: downloads never re-read the file for it
+        info = target.stat()
+        self._remember_hash((str(target), info.st_size, info.st_mtime_ns), digest.hexdigest())
+        return self.stat(key)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            path = self._path(key)
+            info = path.stat()
+        except (OSError, ValueError):
+            return None
+        if not path.is_file():
+            return None
+        return StoredObject(
+            key, info.st_size, info.st_mtime, _guess_type(key),
+            local_path=path, etag=self._content_hash(path, info)
+        )
+
+    def _content_hash(self, path: Path, info: os.stat_result) -> Optional[str]:
+        """SHA-256 of a file, computed once per (path, size, mtime)."""
+        cache_key = (str(path), info.st_size, info.st_mtime_ns)
+        with self._hash_lock:
+            cached = self._hashes.get(cache_key)
+            if cached is not None:
+                self._hashes.move_to_end(cache_key)
+                return cached
+        try:
+            with open(path, 'rb') as stream:
+                digest = _hash_stream(stream, self.chunk_size)
+        except OSError:
+            return None
+        self._remember_hash(cache_key, digest)
+        return digest
+
+    def _remember_hash(self, cache_key: Tuple[str, int, int], digest: str):
+        with self._hash_lock:
+            self._hashes[cache_key] = digest
+            self._hashes.move_to_end(cache_key)
+            while len(self._hashes) > HASH_CACHE_SIZE:
+                self._hashes.popitem(last=False)
+
+    def open_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        path = self._path(key)
+        with open(path, 'rb') as stream:
+            stream.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str):
+        try:
+            self._path(key).unlink()
+        except (FileNotFoundError, ValueError):
+            pass
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-compatible object store (AWS S3, MinIO, ...). Requires boto3.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        chunk_size: int = STORAGE_CHUNK_SIZE
+    ):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.chunk_size = chunk_size
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_file(self, key: str, source: Path, content_type: Optional[str] = None) -> StoredObject:
+        with open(source, 'rb') as stream:
+            digest = _hash_stream(stream, self.chunk_size)
+        # upload_file streams from disk (multipart for large files)
+        self.client.upload_file(
+            str(source), self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type or _guess_type(key), "Metadata": {"sha256": digest}}
+        )
+        return self.stat(key)
+
+    def put_stream(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> StoredObject:
+        # The hash goes into object metadata, which must be known before the
+        # upload starts: spool (to disk past a few MiB) while hashing
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+            for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                digest.update(chunk)
+                spool.write(chunk)
+            spool.seek(0)
+            self.client.upload_fileobj(
+                spool, self.bucket, self._key(key),
+                ExtraArgs={"ContentType": content_type or _guess_type(key), "Metadata": {"sha256": digest.hexdigest()}}
+            )
+        return self.stat(key)
+
+    def stat(self, key: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError:
+            return None
+        return StoredObject(
+            key,
+            int(head["ContentLength"]),
+            head["LastModified"].timestamp(),
+            head.get("ContentType") or _guess_type(key),
+            # Objects uploaded elsewhere may lack the metadata: fall back to
+            # the store's own (content-derived) ETag
+            etag=head.get("Metadata", {}).get("sha256") or head.get("ETag", "").strip('"') or None,
+        )
+
+    def open_range(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(key), Range=byte_range)
+        body = response["Body"]
+        try:
+            for chunk in body.iter_chunks(self.chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+
+# Global instance
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """
+    Get or create the configured storage backend.
+
+    Returns:
+        StorageBackend instance
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "s3":
+                bucket = os.getenv("S3_BUCKET")
+                if not bucket:
+                    raise RuntimeError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+                _storage = S3Storage(
+                    bucket,
+                    prefix=os.getenv("S3_PREFIX", ""),
+                    endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+                    region=os.getenv("S3_REGION"),
+                )
+            elif STORAGE_BACKEND in ("local", "shared"):
+                if STORAGE_ROOT:
+                    root = Path(STORAGE_ROOT)
+                else:
+                    from app.utils.file_manager import FileManager
+                    root = FileManager().base_dir
+                _storage = LocalStorage(root)
+            else:
+                raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+            logger.info(f"🗄️  Storage backend: {type(_storage).__name__} ({STORAGE_BACKEND})")
+    return _storage
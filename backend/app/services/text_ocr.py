@@ -13,13 +13,21 @@ CRITICAL RULES:
 - Text presence > Text perfection
 """
 import cv2
+import os
 import numpy as np
 from typing import Tuple, Optional, List, Dict
 from PIL import Image
 import logging
 
+from app.services.batching import get_batcher, DEFAULT_MAX_BATCH_SIZE
+
 logger = logging.getLogger(__name__)
 
+# Inference backend for the DB + CRNN pipeline:
+# - 'paddle': PaddleOCR with paddlepaddle (default)
+# - 'onnx': exported DB/CRNN models on ONNX Runtime (no paddle import)
+TEXT_OCR_BACKEND = os.getenv("TEXT_OCR_BACKEND", "paddle").lower()
+
 
 class TextOCR:
     """
@@ -46,46 +54,72 @@ class TextOCR:
         self.paddleocr_available = False
         self.paddleocr_detector = None
         self.paddleocr_recognizer = None
+        self.line_batcher = None
+        self.backend = None
         
-        try:
-            from paddleocr import PaddleOCR
+        if TEXT_OCR_BACKEND == 'onnx':
+            try:
+                from app.services.onnx_ocr import OnnxPaddleOCR
+                
+                logger.info("   → Initializing ONNX Runtime HYBRID pipeline (paddle not loaded)...")
+                self.paddleocr_reader = OnnxPaddleOCR()
+                self.paddleocr_detector = self.paddleocr_reader
+                self.paddleocr_recognizer = self.paddleocr_reader
+                self.paddleocr_available = True
+                self.backend = 'onnx'
+                self.line_batcher = get_batcher("onnx_crnn_lines", self._recognize_line_batch)
+                logger.info("✅ HYBRID pipeline initialized on ONNX Runtime (CPU)")
+            except ImportError:
+                logger.warning("⚠️  onnxruntime not available (install with: pip install onnxruntime) - using PaddleOCR")
+            except Exception as e:
+                logger.warning(f"⚠️  ONNX Runtime backend initialization failed: {e} - using PaddleOCR")
+        
+        if not self.paddleocr_available:
+            try:
+                from paddleocr import PaddleOCR
             
-            # Initialize PaddleOCR for HYBRID pipeline
-            # We'll use the same instance but call it with det=True/rec=False for detection
-            # and det=False/rec=True for recognition
-            logger.info("   → Initializing PaddleOCR HYBRID pipeline...")
-            self.paddleocr_reader = PaddleOCR(
-                use_angle_cls=True,
-                lang='en',
-                use_gpu=self.device == 'cuda',
-                show_log=False,
-                det_algorithm='DB',  # DB detection
-                det_db_thresh=0.3,  # Lower threshold for handwriting
-                det_db_box_thresh=0.5,
-                det_db_unclip_ratio=1.6,
-                det_limit_side_len=960,
-                det_limit_type='max',
-                rec_algorithm='CRNN',  # CRNN recognition (C-RNN)
-                use_dilation=False,  # Preserve character shapes
-            )
+                # Initialize PaddleOCR for HYBRID pipeline
+                # We'll use the same instance but call it with det=True/rec=False for detection
+                # and det=False/rec=True for recognition
+                logger.info("   → Initializing PaddleOCR HYBRID pipeline...")
+                self.paddleocr_reader = PaddleOCR(
+                    use_angle_cls=True,
+                    lang='en',
+                    use_gpu=self.device == 'cuda',
+                    show_log=False,
+                    det_algorithm='DB',  # DB detection
+                    det_db_thresh=0.3,  # Lower threshold for handwriting
+                    det_db_box_thresh=0.5,
+                    det_db_unclip_ratio=1.6,
+                    det_limit_side_len=960,
+                    det_limit_type='max',
+                    rec_algorithm='CRNN',  # CRNN recognition (C-RNN)
+                    rec_batch_num=DEFAULT_MAX_BATCH_SIZE,  # Match micro-batch size
+                    use_dilation=False,  # Preserve character shapes
+                )
             
-            # Use the same reader for both detection and recognition
-            # We'll control it via the ocr() method parameters
-            self.paddleocr_detector = self.paddleocr_reader
-            self.paddleocr_recognizer = self.paddleocr_reader
+                # Use the same reader for both detection and recognition
+                # We'll control it via the ocr() method parameters
+                self.paddleocr_detector = self.paddleocr_reader
+                self.paddleocr_recognizer = self.paddleocr_reader
             
-            self.paddleocr_available = True
-            logger.info(f"✅ HYBRID pipeline initialized successfully on {self.device.upper()}")
-            logger.info("   Architecture: DB Detection → Line Segmentation → CRNN Recognition")
+                self.paddleocr_available = True
             
-        except ImportError:
-            logger.warning("⚠️  PaddleOCR not available (install with: pip install paddlepaddle paddleocr)")
-            self.paddleocr_detector = None
-            self.paddleocr_recognizer = None
-        except Exception as e:
-            logger.warning(f"⚠️  PaddleOCR initialization failed: {e}")
-            self.paddleocr_detector = None
-            self.paddleocr_recognizer = None
+                # Shared micro-batcher: line crops from ALL concurrent requests
+                # are recognized together in one CRNN forward pass
+                self.line_batcher = get_batcher("paddle_crnn_lines", self._recognize_line_batch)
+                self.backend = 'paddle'
+                logger.info(f"✅ HYBRID pipeline initialized successfully on {self.device.upper()}")
+                logger.info("   Architecture: DB Detection → Line Segmentation → CRNN Recognition")
+            
+            except ImportError:
+                logger.warning("⚠️  PaddleOCR not available (install with: pip install paddlepaddle paddleocr)")
+                self.paddleocr_detector = None
+                self.paddleocr_recognizer = None
+            except Exception as e:
+                logger.warning(f"⚠️  PaddleOCR initialization failed: {e}")
+                self.paddleocr_detector = None
+                self.paddleocr_recognizer = None
         
         # Fallback: EasyOCR (if PaddleOCR not available)
         logger.info("📦 Loading EasyOCR fallback...")
@@ -364,14 +398,31 @@ class TextOCR:
         total_confidence = 0.0
         valid_lines = 0
         
+        # Extract all line images first so they can be batched
+        line_images = []
         for line_idx, box in enumerate(line_boxes):
+            line_image = self._extract_line_image(image, box)
+            if line_image is None or line_image.size == 0:
+                logger.debug(f"   → Line {line_idx}: Invalid line image, skipping")
+                continue
+            line_images.append(line_image)
+        
+        # Step 3 (batched): Recognize all lines through the shared micro-batcher
+        batched_results = self._recognize_lines_batched(line_images)
+        if batched_results is not None:
+            for line_idx, (line_text, line_confidence) in enumerate(batched_results):
+                # CRITICAL: Include ALL text, regardless of confidence
+                if isinstance(line_text, str) and line_text.strip():
+                    recognized_lines.append(line_text.strip())
+                    total_confidence += line_confidence
+                    valid_lines += 1
+                    logger.debug(f"   → Line {line_idx}: '{line_text}' (confidence: {line_confidence:.4f})")
+                else:
+                    logger.debug(f"   → Line {line_idx}: Empty text, skipping")
+            line_images = []  # Already recognized - skip per-line fallback
+        
+        for line_idx, line_image in enumerate(line_images):
             try:
-                # Extract line image from box coordinates
-                line_image = self._extract_line_image(image, box)
-                if line_image is None or line_image.size == 0:
-                    logger.debug(f"   → Line {line_idx}: Invalid line image, skipping")
-                    continue
-                
                 # Step 3: Recognize line with CRNN (CTC decoding)
                 logger.debug(f"   → Line {line_idx}: Recognizing with CRNN...")
                 # det=False, rec=True means recognition only, no detection
@@ -462,6 +513,48 @@ class TextOCR:
             logger.info("   🔄 Running full-image OCR (all regions returned empty)...")
             return self._run_full_image_ocr(image)
     
+    def _recognize_lines_batched(
+        self,
+        line_images: List[np.ndarray]
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        Recognize line images through the shared CRNN micro-batcher.
+        
+        Returns:
+            List of (text, confidence) in input order, or None if batched
+            recognition is unavailable (caller falls back to per-line OCR)
+        """
+        if not line_images or self.line_batcher is None:
+            return None
+        try:
+            return self.line_batcher.infer_many(line_images)
+        except Exception as e:
+            logger.warning(f"   ⚠️  Batched line recognition failed: {e} - using per-line recognition")
+            return None
+    
+    def _recognize_line_batch(self, line_images: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """
+        Batch function for the micro-batcher: ONE CRNN forward pass over
+        line crops that may come from several concurrent requests.
+        
+        Uses PaddleOCR's internal angle classifier and recognizer directly,
+        which accept image lists (ocr() only accepts a single image).
+        """
+        reader = self.paddleocr_recognizer
+        
+        # PaddleOCR recognizer expects 3-channel BGR crops
+        images = [
+            cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img
+            for img in line_images
+        ]
+        
+        classifier = getattr(reader, 'text_classifier', None)
+        if classifier is not None:
+            images, _, _ = classifier(images)
+        
+        rec_res, _ = reader.text_recognizer(images)
+        return [(str(text), float(score)) for text, score in rec_res]
+    
     def _extract_line_image(self, image: np.ndarray, box: List) -> Optional[np.ndarray]:
         """
         Extract line image from bounding box coordinates.
@@ -0,0 +1,280 @@
+"""
+Tiled layout analysis for very large or panoramic scans.
+
+The full-page pipeline in layout.py allocates several full-size buffers
+(adaptive threshold, 40-px dilation, text mask, inverted mask, label map).
+On 40MP scans and long whiteboard panoramas this spikes memory and time.
+
+This engine processes overlapping tiles instead:
+- Each tile is thresholded, dilated and labelled on its own, so the
+  working buffers are bounded by the tile size, not the page size
+- Tiles overlap by more than the dilation/threshold reach, so pixels in
+  each tile's core (and on its seams) are identical to a full-page pass
+- Each tile labels its connected components; components that share pixels
+  on a seam line are unioned, so lines crossing seams are stitched exactly
+- Background regions are stitched the same way, so components enclosed by
+  another component (not returned by external contours) are dropped too
+- Tiles can be processed in parallel (OpenCV releases the GIL)
+
+CONFIGURATION (environment variables):
+- LAYOUT_TILED_MIN_PIXELS: page size from which tiling is used (default 12MP)
+- LAYOUT_TILE_SIZE: tile core size in pixels (default 2048)
+- LAYOUT_TILE_WORKERS: tiles processed in parallel (default 1). Peak
+  working memory is roughly workers x 10 x (tile + 2 x overlap)^2 bytes
+  (two uint8 buffers plus two int32 label maps).
+- LAYOUT_MASK_MAX_PIXELS: resolution cap for the diagram text mask
+  (default 4MP); larger pages use a downscaled mask
+"""
+import os
+import math
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TILED_MIN_PIXELS = int(os.getenv("LAYOUT_TILED_MIN_PIXELS", str(12_000_000)))
+TILE_SIZE = int(os.getenv("LAYOUT_TILE_SIZE", "2048"))
+TILE_WORKERS = max(1, int(os.getenv("LAYOUT_TILE_WORKERS", "1")))
+MASK_MAX_PIXELS = int(os.getenv("LAYOUT_MASK_MAX_PIXELS", str(4_000_000)))
+
+# Must exceed the horizontal dilation reach (20 px) plus the adaptive
+# threshold radius (5 px) so tile borders do not change results in the core
+TILE_OVERLAP = 64
+
+# How far past the core corners seam strips are compared. Pixels this far
+# from the core are still exact in both tiles (TILE_OVERLAP - 26 px).
+SEAM_REACH = 38
+
+Box = Tuple[int, int, int, int]
+
+
+def should_tile(shape: Tuple[int, ...]) -> bool:
+    """Return True if a page of this shape should use the tiled engine."""
+    return shape[0] * shape[1] >= TILED_MIN_PIXELS
+
+
+def mask_scale(shape: Tuple[int, ...]) -> float:
+    """Downscale factor so a full-page mask stays under LAYOUT_MASK_MAX_PIXELS."""
+    pixels = shape[0] * shape[1]
+    if pixels <= MASK_MAX_PIXELS:
+        return 1.0
+    return math.sqrt(MASK_MAX_PIXELS / float(pixels))
+
+
+def detect_text_boxes_tiled(gray: np.ndarray, kernel_width: int = 40) -> List[Box]:
+    """
+    Detect text-line bounding boxes tile by tile.
+
+    Equivalent to adaptiveThreshold + horizontal dilation + external
+    contours on the full page, with working memory bounded by the tile size.
+
+    Args:
+        gray: Full-page grayscale image
+        kernel_width: Horizontal dilation kernel width
+
+    Returns:
+        List of (x1, y1, x2, y2) boxes in page coordinates (unfiltered)
+    """
+    h, w = gray.shape[:2]
+    rows = list(range(0, h, TILE_SIZE))
+    cols = list(range(0, w, TILE_SIZE))
+    tiles = [(r, c) for r in range(len(rows)) for c in range(len(cols))]
+    logger.info(f"   🧩 Tiled layout: {len(tiles)} tiles of {TILE_SIZE}px (workers={TILE_WORKERS})")
+
+    def process(tile):
+        r, c = tile
+        core = (cols[c], rows[r], min(cols[c] + TILE_SIZE, w), min(rows[r] + TILE_SIZE, h))
+        return _process_tile(gray, core, w, h, kernel_width)
+
+    if TILE_WORKERS > 1 and len(tiles) > 1:
+        with ThreadPoolExecutor(max_workers=TILE_WORKERS) as executor:
+            results = dict(zip(tiles, executor.map(process, tiles)))
+    else:
+        results = {tile: process(tile) for tile in tiles}
+
+    boxes = _stitch(results)
+    logger.debug(f"   🧩 Stitched tiles into {len(boxes)} boxes")
+    return boxes
+
+
+def _process_tile(
+    gray: np.ndarray,
+    core: Box,
+    page_w: int,
+    page_h: int,
+    kernel_width: int
+) -> Dict[str, Any]:
+    """
+    Threshold, dilate and label one padded tile.
+
+    Foreground (8-connected) and background (4-connected) are both
+    labelled: external contours are exactly the foreground components that
+    touch the outer background, which can only be decided after stitching.
+
+    Returns:
+        Dictionary with:
+        - 'boxes': {fg label: bbox of the component's part inside the core}
+        - 'fg_count'/'bg_count': label counts (union-find node numbering)
+        - 'fg'/'bg': {side: labels along that core edge} for seam linking
+        - 'adjacent': (fg label, bg label) pairs touching inside the core
+        - 'fg_border'/'bg_border': labels touching the page border
+    """
+    px1 = max(0, core[0] - TILE_OVERLAP)
+    py1 = max(0, core[1] - TILE_OVERLAP)
+    px2 = min(page_w, core[2] + TILE_OVERLAP)
+    py2 = min(page_h, core[3] + TILE_OVERLAP)
+
+    binary = cv2.adaptiveThreshold(
+        gray[py1:py2, px1:px2], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY_INV, 11, 2
+    )
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_width, 1))
+    dilated = cv2.dilate(binary, kernel, iterations=1)
+    del binary
+    fg_count, fg, stats, _ = cv2.connectedComponentsWithStats(dilated, connectivity=8)
+    bg_count, bg = cv2.connectedComponents((dilated == 0).astype(np.uint8), connectivity=4)
+    del dilated
+
+    # Core rectangle in tile coordinates
+    cx1, cy1, cx2, cy2 = core[0] - px1, core[1] - py1, core[2] - px1, core[3] - py1
+
+    boxes = {}
+    for label in range(1, fg_count):
+        x, y, bw, bh = stats[label, :4]
+        x1, y1 = max(x, cx1), max(y, cy1)
+        x2, y2 = min(x + bw, cx2), min(y + bh, cy2)
+        if x2 > x1 and y2 > y1:
+            boxes[label] = (int(px1 + x1), int(py1 + y1), int(px1 + x2), int(py1 + y2))
+
+    # Foreground/background adjacency over the core plus one pixel to the
+    # right and bottom, so pairs across a seam are counted by one tile
+    fg_core = fg[cy1:min(cy2 + 1, fg.shape[0]), cx1:min(cx2 + 1, fg.shape[1])]
+    bg_core = bg[cy1:min(cy2 + 1, bg.shape[0]), cx1:min(cx2 + 1, bg.shape[1])]
+    codes = []
+    for f, b in (
+        (fg_core[:, :-1], bg_core[:, 1:]), (fg_core[:, 1:], bg_core[:, :-1]),
+        (fg_core[:-1, :], bg_core[1:, :]), (fg_core[1:, :], bg_core[:-1, :]),
+    ):
+        touching = (f > 0) & (b > 0)
+        codes.append(f[touching].astype(np.int64) * bg_count + b[touching])
+    codes = np.unique(np.concatenate(codes))
+    adjacent = np.stack([codes // bg_count, codes % bg_count], axis=1)
+
+    # Seam strips extend past the core corners so diagonal connections link too
+    ey1, ey2 = max(0, cy1 - SEAM_REACH), min(fg.shape[0], cy2 + SEAM_REACH)
+    ex1, ex2 = max(0, cx1 - SEAM_REACH), min(fg.shape[1], cx2 + SEAM_REACH)
+    strips = {'fg': {}, 'bg': {}}
+    for name, labels in (('fg', fg), ('bg', bg)):
+        if core[0] > 0:
+            strips[name]['left'] = labels[ey1:ey2, cx1].copy()
+        if core[2] < page_w:
+            strips[name]['right'] = labels[ey1:ey2, cx2].copy()
+        if core[1] > 0:
+            strips[name]['top'] = labels[cy1, ex1:ex2].copy()
+        if core[3] < page_h:
+            strips[name]['bottom'] = labels[cy2, ex1:ex2].copy()
+
+    # Labels on the page border (the image frame counts as outer background)
+    edges = []
+    if py1 == 0:
+        edges.append(np.s_[0, cx1:cx2])
+    if py2 == page_h:
+        edges.append(np.s_[-1, cx1:cx2])
+    if px1 == 0:
+        edges.append(np.s_[cy1:cy2, 0])
+    if px2 == page_w:
+        edges.append(np.s_[cy1:cy2, -1])
+    fg_border = np.unique(np.concatenate([fg[e] for e in edges])) if edges else np.empty(0, np.int32)
+    bg_border = np.unique(np.concatenate([bg[e] for e in edges])) if edges else np.empty(0, np.int32)
+
+    return {
+        'boxes': boxes,
+        'fg_count': fg_count,
+        'bg_count': bg_count,
+        'fg': strips['fg'],
+        'bg': strips['bg'],
+        'adjacent': adjacent,
+        'fg_border': fg_border[fg_border > 0],
+        'bg_border': bg_border[bg_border > 0],
+    }
+
+
+class _UnionFind:
+    """Union-find over the labels of all tiles, numbered by per-tile offsets."""
+
+    def __init__(self, counts: Dict[Tuple[int, int], int]):
+        self.offsets = {}
+        total = 0
+        for tile, count in counts.items():
+            self.offsets[tile] = total
+            total += count
+        self.parent = np.arange(total)
+
+    def find(self, tile: Tuple[int, int], label: int) -> int:
+        i = self.offsets[tile] + int(label)
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return int(i)
+
+    def union(self, tile_a, label_a, tile_b, label_b) -> None:
+        ra = self.find(tile_a, label_a)
+        rb = self.find(tile_b, label_b)
+        if ra != rb:
+            self.parent[ra] = rb
+
+
+def _stitch(results: Dict[Tuple[int, int], Dict[str, Any]]) -> List[Box]:
+    """
+    Union labels that share pixels on a seam, keep external components only,
+    then merge each component's per-tile boxes.
+
+    On the seam line both neighbouring tiles compute identical pixels, so a
+    non-zero label pair at the same position means the same component.
+    """
+    fg_sets = _UnionFind({tile: r['fg_count'] for tile, r in results.items()})
+    bg_sets = _UnionFind({tile: r['bg_count'] for tile, r in results.items()})
+
+    for (r, c) in results:
+        for neighbour, side, other_side in (((r, c + 1), 'right', 'left'), ((r + 1, c), 'bottom', 'top')):
+            if neighbour not in results:
+                continue
+            for kind, sets in (('fg', fg_sets), ('bg', bg_sets)):
+                a = results[(r, c)][kind].get(side)
+                b = results[neighbour][kind].get(other_side)
+                if a is None or b is None:
+                    continue
+                both = (a > 0) & (b > 0)
+                if not both.any():
+                    continue
+                for la, lb in np.unique(np.stack([a[both], b[both]], axis=1), axis=0):
+                    sets.union((r, c), la, neighbour, lb)
+
+    outer = set()
+    external = set()
+    for tile, result in results.items():
+        outer.update(bg_sets.find(tile, label) for label in result['bg_border'])
+        external.update(fg_sets.find(tile, label) for label in result['fg_border'])
+    for tile, result in results.items():
+        for fg_label, bg_label in result['adjacent']:
+            if bg_sets.find(tile, bg_label) in outer:
+                external.add(fg_sets.find(tile, fg_label))
+
+    groups: Dict[int, Box] = {}
+    for tile, result in results.items():
+        for label, box in result['boxes'].items():
+            root = fg_sets.find(tile, label)
+            if root not in external:
+                continue
+            g = groups.get(root)
+            if g is None:
+                groups[root] = box
+            else:
+                groups[root] = (min(g[0], box[0]), min(g[1], box[1]), max(g[2], box[2]), max(g[3], box[3]))
+
+    return list(groups.values())
@@ -0,0 +1,142 @@
+"""
+Benchmark: legacy greedy diagram merge vs fixed-point sweep + union-find.
+
+Generates random candidate boxes (clusters of overlapping boxes plus
+scattered singletons) and reports for both mergers:
+- time per call, for candidate counts from tens to thousands
+- violations: result pairs that still satisfy the merge criterion
+  (intersection > 50% of the smaller box); a fixed point has none
+- order: whether shuffling the candidates changes the result
+
+The repo has no test suite, so the correctness checks (transitive chain,
+order independence, fixed point) also run here before the timings.
+
+Usage (from backend/):
+    python -m benchmarks.box_merge_benchmark
+    python -m benchmarks.box_merge_benchmark --sizes 100 1000 5000 --runs 5
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.box_merge import merge_overlapping_boxes
+
+
+def legacy_merge(diagrams: List[Dict]) -> List[Dict]:
+    """The previous DiagramExtractor._merge_overlaps (greedy, single pass)."""
+    if not diagrams:
+        return []
+    sorted_diagrams = sorted(
+        ({'bbox': list(d['bbox'])} for d in diagrams),
+        key=lambda d: (d['bbox'][2] - d['bbox'][0]) * (d['bbox'][3] - d['bbox'][1]),
+        reverse=True
+    )
+    merged = []
+    for current in sorted_diagrams:
+        is_overlap = False
+        cx1, cy1, cx2, cy2 = current['bbox']
+        c_area = (cx2 - cx1) * (cy2 - cy1)
+        for existing in merged:
+            ex1, ey1, ex2, ey2 = existing['bbox']
+            ix1, iy1 = max(cx1, ex1), max(cy1, ey1)
+            ix2, iy2 = min(cx2, ex2), min(cy2, ey2)
+            if ix2 > ix1 and iy2 > iy1:
+                intersection = (ix2 - ix1) * (iy2 - iy1)
+                if intersection > 0.5 * min(c_area, (ex2 - ex1) * (ey2 - ey1)):
+                    existing['bbox'] = [min(cx1, ex1), min(cy1, ey1), max(cx2, ex2), max(cy2, ey2)]
+                    is_overlap = True
+                    break
+        if not is_overlap:
+            merged.append(current)
+    return merged
+
+
+def new_merge(diagrams: List[Dict]) -> List[Dict]:
+    merged, _ = merge_overlapping_boxes([d['bbox'] for d in diagrams], min_overlap=0.5)
+    return [{'bbox': box} for box in merged.tolist()]
+
+
+def random_candidates(count: int, rng: random.Random) -> List[Dict]:
+    """
+    Clusters of jittered boxes (one contour split several ways) plus
+    singletons, on a canvas that grows with count so density stays constant.
+    """
+    page = int(4000 * max(1.0, (count / 200) ** 0.5))
+    diagrams = []
+    while len(diagrams) < count:
+        w, h = rng.randint(40, 400), rng.randint(40, 400)
+        x, y = rng.randint(0, page - w), rng.randint(0, page - h)
+        for _ in range(rng.choice([1, 1, 2, 3, 5])):
+            dx, dy = rng.randint(-w // 3, w // 3), rng.randint(-h // 3, h // 3)
+            sw, sh = rng.randint(w // 2, w), rng.randint(h // 2, h)
+            diagrams.append({'bbox': [x + dx, y + dy, x + dx + sw, y + dy + sh]})
+    return diagrams[:count]
+
+
+def violations(merged: List[Dict]) -> int:
+    """Result pairs that still meet the merge criterion."""
+    boxes = np.array([d['bbox'] for d in merged], dtype=np.int64).reshape(-1, 4)
+    a, b = boxes[:, None, :], boxes[None, :, :]
+    iw = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+    ih = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0)
+    hit = inter > 0.5 * np.minimum(area[:, None], area[None, :])
+    np.fill_diagonal(hit, False)
+    return int(hit.sum() // 2)
+
+
+def _canonical(merged: List[Dict]) -> List[tuple]:
+    return sorted(tuple(d['bbox']) for d in merged)
+
+
+def check(rng: random.Random):
+    """Correctness checks for the fixed-point merger."""
+    # A overlaps C enough only after absorbing B; C is placed first (larger),
+    # so the greedy pass never revisits it
+    chain = [{'bbox': [0, 0, 100, 100]}, {'bbox': [0, 40, 100, 140]}, {'bbox': [40, 20, 150, 120]}]
+    assert _canonical(new_merge(chain)) == [(0, 0, 150, 140)], new_merge(chain)
+    assert len(legacy_merge(chain)) == 2
+
+    for _ in range(50):
+        candidates = random_candidates(200, rng)
+        expected = _canonical(new_merge(candidates))
+        shuffled = candidates[:]
+        rng.shuffle(shuffled)
+        assert _canonical(new_merge(shuffled)) == expected, "result depends on input order"
+        assert violations(new_merge(candidates)) == 0, "not a fixed point"
+    print("checks: chain, order independence, fixed point ... ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="*", type=int, default=[50, 200, 1000, 3000])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    check(rng)
+
+    for size in args.sizes:
+        candidates = random_candidates(size, rng)
+        shuffled = candidates[:]
+        rng.shuffle(shuffled)
+        for name, merger in (("legacy", legacy_merge), ("fixpoint", new_merge)):
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                merged = merger(candidates)
+            elapsed = (time.perf_counter() - start) / args.runs
+            stable = _canonical(merger(shuffled)) == _canonical(merged)
+            print(
+                f"candidates={size:5d} {name:9s} boxes={len(merged):5d} "
+                f"violations={violations(merged):4d} order-stable={str(stable):5s} "
+                f"time={1000 * elapsed:8.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Benchmark: legacy row-threshold sorter vs column-aware reading order.
+
+Generates synthetic multi-column pages (full-width title, 1-3 columns of
+jittered text lines, occasional full-width equations between sections)
+with known ground-truth order, then reports for both sorters:
+- exact: fraction of pages ordered exactly right
+- pairwise: fraction of region pairs in the correct relative order
+- time per page, for page sizes up to thousands of regions
+
+Usage (from backend/):
+    python -m benchmarks.reading_order_benchmark
+    python -m benchmarks.reading_order_benchmark --pages 50 --sizes 100 1000 5000
+"""
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.reading_order import sort_reading_order
+
+
+def legacy_sort(regions: List[Dict]) -> List[Dict]:
+    """The previous layout._sort_reading_order (fixed 30px rows)."""
+    if not regions:
+        return []
+    y_threshold = 30
+    sorted_by_y = sorted(regions, key=lambda r: r['y'])
+    rows = []
+    current_row = [sorted_by_y[0]]
+    for region in sorted_by_y[1:]:
+        avg_y_current = np.mean([r['y'] + r['height'] / 2 for r in current_row])
+        region_center_y = region['y'] + region['height'] / 2
+        if abs(region_center_y - avg_y_current) < y_threshold:
+            current_row.append(region)
+        else:
+            rows.append(current_row)
+            current_row = [region]
+    if current_row:
+        rows.append(current_row)
+    final_order = []
+    for row in rows:
+        final_order.extend(sorted(row, key=lambda r: r['x']))
+    return final_order
+
+
+def _region(rank: int, x1: int, y1: int, x2: int, y2: int) -> Dict:
+    return {
+        'rank': rank,
+        'bbox': (x1, y1, x2, y2),
+        'x': x1,
+        'y': y1,
+        'width': x2 - x1,
+        'height': y2 - y1,
+    }
+
+
+def synthetic_page(target_regions: int, rng: random.Random) -> List[Dict]:
+    """
+    Build one page with roughly target_regions regions in known order.
+
+    Columns hold word-group regions (1-3 per line, as produced by the
+    40px dilation); lines in neighbouring columns share baselines, which
+    is what interleaves them under a plain row sorter.
+    """
+    width = 2400
+    margin = 80
+    gutter = rng.randint(80, 160)
+    line_height = rng.randint(24, 40)
+    line_gap = rng.randint(8, 20)
+    regions: List[Dict] = []
+    y = margin
+
+    def add(x1, y1, x2, y2):
+        regions.append(_region(len(regions), x1, y1, x2, y2))
+
+    # Title
+    add(width // 4, y, 3 * width // 4, y + 2 * line_height)
+    y += 2 * line_height + 3 * line_gap
+
+    while len(regions) < target_regions:
+        columns = rng.choice([1, 2, 2, 3])
+        column_width = (width - 2 * margin - (columns - 1) * gutter) // columns
+        lines = rng.randint(6, 30)
+        for c in range(columns):
+            cx = margin + c * (column_width + gutter)
+            cy = y
+            for _ in range(lines):
+                jitter = rng.randint(-3, 3)
+                words = rng.randint(1, 3)
+                line_end = cx + rng.randint(column_width // 2, column_width)
+                step = (line_end - cx) // words
+                for w in range(words):
+                    x1 = cx + w * step
+                    x2 = x1 + step - rng.randint(45, 60) if w < words - 1 else line_end
+                    add(x1, cy + jitter, x2, cy + jitter + line_height)
+                cy += line_height + line_gap
+        y += lines * (line_height + line_gap) + 2 * line_gap
+
+        # Occasional full-width equation between sections
+        if rng.random() < 0.5:
+            add(margin + 40, y, width - margin - 40, y + line_height)
+            y += line_height + 3 * line_gap
+
+    return regions
+
+
+def score(ordered: List[Dict]) -> Tuple[bool, float]:
+    """Exact match and pairwise order accuracy (inversions via merge sort)."""
+    ranks = [r['rank'] for r in ordered]
+    n = len(ranks)
+    inversions = _count_inversions(ranks)
+    pairs = n * (n - 1) // 2
+    return inversions == 0, 1.0 - (inversions / pairs if pairs else 0.0)
+
+
+def _count_inversions(values: List[int]) -> int:
+    if len(values) < 2:
+        return 0
+    mid = len(values) // 2
+    left, right = values[:mid], values[mid:]
+    count = _count_inversions(left) + _count_inversions(right)
+    left.sort()
+    right.sort()
+    j = 0
+    for value in left:
+        while j < len(right) and right[j] < value:
+            j += 1
+        count += j
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--sizes", nargs="*", type=int, default=[50, 200, 1000, 5000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for size in args.sizes:
+        pages = [synthetic_page(size, rng) for _ in range(args.pages)]
+        for name, sorter in (("legacy", legacy_sort), ("columns", sort_reading_order)):
+            exact, pairwise, elapsed = 0, [], 0.0
+            for page in pages:
+                shuffled = page[:]
+                rng.shuffle(shuffled)
+                start = time.perf_counter()
+                ordered = sorter(shuffled)
+                elapsed += time.perf_counter() - start
+                ok, accuracy = score(ordered)
+                exact += ok
+                pairwise.append(accuracy)
+            print(
+                f"regions~{size:5d} {name:8s} exact={exact / len(pages):6.1%} "
+                f"pairwise={np.mean(pairwise):.4f} time/page={1000 * elapsed / len(pages):8.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark: legacy per-region TrOCR vs batched/quantized TrOCR path.
+
+Compares generated tokens/sec and character error rate (CER) on the sample
+images in the repository root (test_img1, test_img2, test_img3).
+
+Both paths count non-pad generated tokens of the greedy pass; tokens spent
+by the batched path's beam-search retry of empty regions are reported
+separately (retry=) and not included in tokens/s.
+
+CER is computed against reference transcripts if --references is given
+(one <image_name>.txt per image, one line per region in reading order).
+Without references, CER is measured against the legacy fp32 output, i.e.
+it reports how much the fast path deviates from the current behaviour.
+
+Usage (from backend/):
+    python -m benchmarks.trocr_benchmark
+    python -m benchmarks.trocr_benchmark --images ../test_img1 --references refs/
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+import torch
+from transformers import VisionEncoderDecoderModel
+
+from app.services.layout_analyzer import LayoutAnalyzer
+from app.services.ocr_engine import OCREngine, TROCR_MODEL_NAME
+
+REPO_ROOT = Path(__file__).resolve().parent.parent.parent
+DEFAULT_IMAGES = [REPO_ROOT / name for name in ("test_img1", "test_img2", "test_img3")]
+
+
+def character_error_rate(hypothesis: str, reference: str) -> float:
+    """Levenshtein distance over characters, normalized by reference length."""
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    previous = list(range(len(reference) + 1))
+    for i, h_char in enumerate(hypothesis, start=1):
+        current = [i]
+        for j, r_char in enumerate(reference, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (h_char != r_char),
+            ))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def load_regions(image_path: Path) -> List[np.ndarray]:
+    """Crop text regions in reading order using the existing layout analyzer."""
+    image = cv2.imread(str(image_path))
+    if image is None:
+        raise ValueError(f"Could not load image: {image_path}")
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    layout = LayoutAnalyzer().analyze(image)
+    crops = []
+    for idx in layout.reading_order:
+        x, y, w, h = layout.text_regions[idx].bbox
+        crops.append(image[y:y+h, x:x+w])
+    return crops
+
+
+def run_legacy(engine: OCREngine, model, crops: List[np.ndarray]) -> Tuple[List[str], int, float]:
+    """Legacy path: fp32 model, one generate() per region, default length."""
+    texts, tokens = [], 0
+    start = time.perf_counter()
+    for crop in crops:
+        pixel_values = engine.trocr_processor(images=engine._to_pil(crop), return_tensors="pt").pixel_values.to(engine.device)
+        with torch.no_grad():
+            generated_ids = model.generate(pixel_values)
+        tokens += engine._count_tokens(generated_ids)
+        texts.append(engine.trocr_processor.batch_decode(generated_ids, skip_special_tokens=True)[0].strip())
+    return texts, tokens, time.perf_counter() - start
+
+
+def run_batched(engine: OCREngine, crops: List[np.ndarray], batch_size: int) -> Tuple[List[str], int, int, float]:
+    """New path: batched, width-capped generation with encoder reuse."""
+    texts, tokens, retry_tokens = [], 0, 0
+    start = time.perf_counter()
+    for offset in range(0, len(crops), batch_size):
+        batch_texts, batch_tokens, batch_retry_tokens = engine._trocr_generate(crops[offset:offset + batch_size])
+        texts.extend(text.strip() for text in batch_texts)
+        tokens += batch_tokens
+        retry_tokens += batch_retry_tokens
+    return texts, tokens, retry_tokens, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", nargs="*", type=Path, default=DEFAULT_IMAGES)
+    parser.add_argument("--references", type=Path, default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    engine = OCREngine()
+    if engine.trocr_model is None:
+        raise SystemExit("TrOCR model could not be loaded")
+    legacy_model = VisionEncoderDecoderModel.from_pretrained(TROCR_MODEL_NAME).to(engine.device).eval()
+
+    totals = {"legacy": [0, 0, 0.0, []], "batched": [0, 0, 0.0, []]}
+    for image_path in args.images:
+        crops = load_regions(image_path)
+        if not crops:
+            print(f"{image_path.name}: no text regions")
+            continue
+
+        legacy_texts, legacy_tokens, legacy_time = run_legacy(engine, legacy_model, crops)
+        batched_texts, batched_tokens, retry_tokens, batched_time = run_batched(engine, crops, args.batch_size)
+
+        references = legacy_texts
+        if args.references:
+            ref_file = args.references / f"{image_path.name}.txt"
+            if ref_file.exists():
+                references = ref_file.read_text(encoding="utf-8").splitlines()
+
+        for name, texts, tokens, retried, elapsed in (
+            ("legacy", legacy_texts, legacy_tokens, 0, legacy_time),
+            ("batched", batched_texts, batched_tokens, retry_tokens, batched_time),
+        ):
+            cers = [character_error_rate(h, r) for h, r in zip(texts, references)]
+            totals[name][0] += tokens
+            totals[name][1] += retried
+            totals[name][2] += elapsed
+            totals[name][3].extend(cers)
+            print(
+                f"{image_path.name:12s} {name:8s} regions={len(crops):3d} "
+                f"time={elapsed:7.2f}s tokens/s={tokens / elapsed if elapsed else 0:8.1f} "
+                f"retry={retried:5d} CER={np.mean(cers) if cers else 0:.3f}"
+            )
+
+    print("-" * 72)
+    for name, (tokens, retried, elapsed, cers) in totals.items():
+        print(
+            f"{'TOTAL':12s} {name:8s} time={elapsed:7.2f}s "
+            f"tokens/s={tokens / elapsed if elapsed else 0:8.1f} retry={retried:5d} "
+            f"CER={np.mean(cers) if cers else 0:.3f}"
+        )
+    reference_kind = "reference transcripts" if args.references else "legacy fp32 output"
+    print(f"CER measured against {reference_kind}; quantized={engine.trocr_quantized}")
+
+
+if __name__ == "__main__":
+    main()